@@ -7,6 +7,7 @@ Seguridad: JWT Manual (PyJWT) - Token en header Authorization
 
 from flask import Blueprint, request, jsonify, g, current_app
 from bd import obtener_conexion
+from tiempo_real import bus
 import pymysql
 import jwt  # Usamos PyJWT directamente
 import datetime
@@ -722,11 +723,11 @@ def api_registrar_sala():
         cursor = conexion.cursor()
 
         cursor.execute("""
-            INSERT INTO salas_juego (pin_sala, id_cuestionario, modo_juego, estado, tiempo_por_pregunta)
-            VALUES (%s, %s, %s, %s, %s)
+            INSERT INTO salas_juego (pin_sala, id_cuestionario, modo_juego, estado, tiempo_por_pregunta, avance_automatico)
+            VALUES (%s, %s, %s, %s, %s, %s)
         """, (data.get('pin_sala'), data.get('id_cuestionario'),
               data.get('modo_juego', 'individual'), data.get('estado', 'esperando'),
-              data.get('tiempo_por_pregunta', 30)))
+              data.get('tiempo_por_pregunta', 30), 1 if data.get('avance_automatico') else 0))
 
         conexion.commit()
         sala_id = cursor.lastrowid
@@ -747,7 +748,7 @@ def api_actualizar_sala(sala_id):
 
         campos = []
         valores = []
-        for campo in ['estado', 'tiempo_por_pregunta', 'modo_juego', 'max_participantes']:
+        for campo in ['estado', 'tiempo_por_pregunta', 'modo_juego', 'max_participantes', 'avance_automatico']:
             if campo in data:
                 campos.append(f"{campo} = %s")
                 valores.append(data[campo])
@@ -761,6 +762,7 @@ def api_actualizar_sala(sala_id):
         cursor.execute(query, valores)
         conexion.commit()
         conexion.close()
+        bus.publicar(sala_id, 'sala_modificada')
 
         return respuesta_exito(None, 'Sala actualizada exitosamente')
     except Exception as e:
@@ -776,7 +778,7 @@ def api_obtener_sala(sala_id):
 
         cursor.execute("""
             SELECT id_sala, pin_sala, id_cuestionario, modo_juego, estado,
-                   tiempo_por_pregunta, max_participantes, fecha_creacion
+                   tiempo_por_pregunta, max_participantes, avance_automatico, fecha_creacion
             FROM salas_juego WHERE id_sala = %s
         """, (sala_id,))
 
@@ -800,7 +802,7 @@ def api_obtener_salas():
 
         cursor.execute("""
             SELECT id_sala, pin_sala, id_cuestionario, modo_juego, estado,
-                   tiempo_por_pregunta, max_participantes, fecha_creacion
+                   tiempo_por_pregunta, max_participantes, avance_automatico, fecha_creacion
             FROM salas_juego ORDER BY fecha_creacion DESC
         """)
 
@@ -819,9 +821,13 @@ def api_eliminar_sala(sala_id):
         conexion = obtener_conexion()
         cursor = conexion.cursor()
 
+        cursor.execute("SELECT pin_sala FROM salas_juego WHERE id_sala = %s", (sala_id,))
+        sala = cursor.fetchone()
         cursor.execute("DELETE FROM salas_juego WHERE id_sala = %s", (sala_id,))
         conexion.commit()
         conexion.close()
+        # Con el PIN en los datos, tiempo_real.asignador_pines lo devuelve a su reserva
+        bus.publicar(sala_id, 'sala_eliminada', {'pin': sala[0]} if sala else None)
 
         return respuesta_exito(None, 'Sala eliminada exitosamente')
     except Exception as e:
@@ -1381,8 +1387,12 @@ def api_actualizar_grupo_sala(grupo_id):
         valores.append(grupo_id)
         query = f"UPDATE grupos_sala SET {', '.join(campos)} WHERE id_grupo = %s"
         cursor.execute(query, valores)
+        cursor.execute("SELECT id_sala FROM grupos_sala WHERE id_grupo = %s", (grupo_id,))
+        sala = cursor.fetchone()
         conexion.commit()
         conexion.close()
+        if sala:
+            bus.publicar(sala[0], 'sala_modificada')
         return respuesta_exito(None, 'Grupo actualizado exitosamente')
     except Exception as e:
         return respuesta_error(f'Error al actualizar grupo: {str(e)}', 500)
@@ -1424,9 +1434,13 @@ def api_eliminar_grupo_sala(grupo_id):
     try:
         conexion = obtener_conexion()
         cursor = conexion.cursor()
+        cursor.execute("SELECT id_sala FROM grupos_sala WHERE id_grupo = %s", (grupo_id,))
+        sala = cursor.fetchone()
         cursor.execute("DELETE FROM grupos_sala WHERE id_grupo = %s", (grupo_id,))
         conexion.commit()
         conexion.close()
+        if sala:
+            bus.publicar(sala[0], 'sala_modificada')
         return respuesta_exito(None, 'Grupo eliminado exitosamente')
     except Exception as e:
         return respuesta_error(f'Error al eliminar grupo: {str(e)}', 500)
@@ -1449,6 +1463,7 @@ def api_registrar_participante_sala():
         conexion.commit()
         participante_id = cursor.lastrowid
         conexion.close()
+        bus.publicar(data.get('id_sala'), 'sala_modificada')
         return respuesta_exito({'id_participante': participante_id}, 'Participante registrado exitosamente', 201)
     except Exception as e:
         return respuesta_error(f'Error al registrar participante: {str(e)}', 500)
@@ -1472,8 +1487,12 @@ def api_actualizar_participante_sala(participante_id):
         valores.append(participante_id)
         query = f"UPDATE participantes_sala SET {', '.join(campos)} WHERE id_participante = %s"
         cursor.execute(query, valores)
+        cursor.execute("SELECT id_sala FROM participantes_sala WHERE id_participante = %s", (participante_id,))
+        sala = cursor.fetchone()
         conexion.commit()
         conexion.close()
+        if sala:
+            bus.publicar(sala[0], 'sala_modificada')
         return respuesta_exito(None, 'Participante actualizado exitosamente')
     except Exception as e:
         return respuesta_error(f'Error al actualizar participante: {str(e)}', 500)
@@ -1515,9 +1534,13 @@ def api_eliminar_participante_sala(participante_id):
     try:
         conexion = obtener_conexion()
         cursor = conexion.cursor()
+        cursor.execute("SELECT id_sala FROM participantes_sala WHERE id_participante = %s", (participante_id,))
+        sala = cursor.fetchone()
         cursor.execute("DELETE FROM participantes_sala WHERE id_participante = %s", (participante_id,))
         conexion.commit()
         conexion.close()
+        if sala:
+            bus.publicar(sala[0], 'sala_modificada')
         return respuesta_exito(None, 'Participante eliminado exitosamente')
     except Exception as e:
         return respuesta_error(f'Error al eliminar participante: {str(e)}', 500)
@@ -1,8 +1,19 @@
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
 import pymysql
+import pymysql.cursors
+from flask import g, has_app_context
 
 def verificar_conexion():
     """Verifica si se puede establecer conexión con la base de datos"""
     try:
+        obtener_pool().precalentar()
         conexion = obtener_conexion()
         conexion.close()
         return True
@@ -43,9 +54,591 @@ def inicializar_usuarios_prueba():
             conexion.close()
         return False
 
+# ==================== POOL DE CONEXIONES ====================
+
+def _configuracion_bd():
+    """
+    Lee la configuración de la base de datos y del pool desde las variables de entorno.
+    Se evalúa de forma perezosa para respetar el .env cargado por main.py.
+    """
+    return {
+        # mysql (por defecto) o embebida: SQLite en el propio proceso, para
+        # benchmarks y pruebas sin servidor (ver bd_embebida.py)
+        'backend': (os.environ.get('DB_BACKEND') or 'mysql').lower(),
+        'embebida_ruta': os.environ.get('DB_EMBEBIDA_RUTA'),
+        'host': os.environ.get('DB_HOST') or 'localhost',
+        'port': int(os.environ.get('DB_PORT') or 3306),
+        'user': os.environ.get('DB_USER') or 'root',
+        'password': os.environ.get('DB_PASSWORD') or '',
+        'db': os.environ.get('DB_NAME') or 'brain_rush',
+        'pool_min': int(os.environ.get('DB_POOL_MIN') or 2),
+        'pool_max': int(os.environ.get('DB_POOL_MAX') or 20),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT') or 10),
+        'pool_recycle': float(os.environ.get('DB_POOL_RECYCLE') or 1800),
+        # Réplica de solo lectura (opcional): si no se define DB_REPLICA_HOST se usa la primaria
+        'replica_host': os.environ.get('DB_REPLICA_HOST'),
+        'replica_port': int(os.environ.get('DB_REPLICA_PORT') or os.environ.get('DB_PORT') or 3306),
+        'replica_user': os.environ.get('DB_REPLICA_USER') or os.environ.get('DB_USER') or 'root',
+        'replica_password': os.environ.get('DB_REPLICA_PASSWORD') or os.environ.get('DB_PASSWORD') or '',
+        'replica_db': os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_NAME') or 'brain_rush',
+        'replica_max_lag': float(os.environ.get('DB_REPLICA_MAX_LAG') or 5),
+    }
+
+
+class PoolAgotadoError(pymysql.err.OperationalError):
+    """No se liberó ninguna conexión del pool dentro del tiempo de espera"""
+
+
+class ConexionPool:
+    """
+    Envoltura de una conexión pymysql prestada por el pool.
+    Se comporta como la conexión original, pero close() la devuelve al pool.
+    Si la envoltura se pierde sin close() (una ruta que no cierra en su
+    except), el recolector avisa al pool para que recupere el hueco.
+    """
+
+    def __init__(self, pool, conexion):
+        self._pool = pool
+        self._conexion = conexion
+        self._devuelta = False
+        # No referencia a self: solo la cola de perdidas y la conexión
+        self._finalizador = weakref.finalize(self, pool._perdidas.append, conexion)
+
+    def __getattr__(self, nombre):
+        if self._devuelta:
+            raise pymysql.err.InterfaceError(0, "La conexión ya fue devuelta al pool")
+        return getattr(self._conexion, nombre)
+
+    def close(self):
+        if self._devuelta:
+            return
+        self._devuelta = True
+        self._finalizador.detach()
+        self._pool.devolver(self._conexion)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones MySQL seguro entre hilos.
+
+    - Mantiene entre `minimo` y `maximo` conexiones abiertas (repone el
+      mínimo al devolver si se descartaron conexiones)
+    - Recupera el hueco de las conexiones prestadas que nunca se cerraron
+    - Verifica cada conexión con ping() antes de prestarla
+    - Recicla las conexiones que superan `reciclar_segundos` de antigüedad
+    - Bloquea hasta `timeout` segundos si todas las conexiones están prestadas
+    """
+
+    def __init__(self, parametros, minimo=2, maximo=20, timeout=10, reciclar_segundos=1800,
+                 conectar=pymysql.connect):
+        if minimo > maximo:
+            raise ValueError("El mínimo del pool no puede superar al máximo")
+        self.parametros = parametros
+        self.conectar = conectar
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.reciclar_segundos = reciclar_segundos
+
+        self._libres = deque()
+        self._creadas_en = {}  # id(conexion) -> timestamp de creación
+        self._total = 0
+        # Conexiones cuya envoltura se recolectó sin close(); las encola el
+        # finalizador (sin tomar el candado) y se descartan en _recuperar_perdidas
+        self._perdidas = deque()
+        self._condicion = threading.Condition()
+
+        # Contadores
+        self.aciertos = 0  # Préstamos servidos con una conexión reutilizada
+        self.fallos = 0  # Préstamos que necesitaron abrir una conexión nueva
+        self.descartadas = 0  # Conexiones cerradas por ping fallido o antigüedad
+        self.esperas_agotadas = 0
+        self.perdidas = 0  # Conexiones prestadas que nunca se devolvieron
+
+    def _crear(self):
+        conexion = self.conectar(**self.parametros)
+        self._creadas_en[id(conexion)] = time.monotonic()
+        return conexion
+
+    def _descartar(self, conexion):
+        self._creadas_en.pop(id(conexion), None)
+        try:
+            conexion.close()
+        except Exception:
+            pass
+
+    def _recuperar_perdidas(self):
+        """Descarta las conexiones perdidas y libera sus huecos (con el candado tomado)"""
+        while self._perdidas:
+            self._descartar(self._perdidas.popleft())
+            self._total -= 1
+            self.perdidas += 1
+            self._condicion.notify()
+
+    def precalentar(self):
+        """Abre conexiones hasta alcanzar el mínimo configurado"""
+        while True:
+            with self._condicion:
+                self._recuperar_perdidas()
+                if self._total >= self.minimo:
+                    return
+                # Reservar el hueco antes de conectar, fuera del candado
+                self._total += 1
+            try:
+                conexion = self._crear()
+            except Exception:
+                with self._condicion:
+                    self._total -= 1
+                    self._condicion.notify()
+                raise
+            with self._condicion:
+                self._libres.append(conexion)
+                self._condicion.notify()
+
+    def obtener(self):
+        """Presta una conexión viva del pool"""
+        limite = time.monotonic() + self.timeout
+        while True:
+            with self._condicion:
+                while True:
+                    self._recuperar_perdidas()
+                    if self._libres:
+                        conexion = self._libres.pop()
+                        break
+                    if self._total < self.maximo:
+                        # Reservar el hueco antes de conectar, fuera del candado
+                        self._total += 1
+                        conexion = None
+                        break
+
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self.esperas_agotadas += 1
+                        raise PoolAgotadoError(
+                            f"No hay conexiones disponibles en el pool tras {self.timeout}s "
+                            f"({self._total}/{self.maximo} en uso)"
+                        )
+                    self._condicion.wait(restante)
+
+            if conexion is None:
+                break
+
+            # La conexión ya es de este préstamo: la comprobación (un viaje de
+            # red) no retiene el candado ni a quienes esperan el pool
+            creada_en = self._creadas_en.get(id(conexion), 0)
+            viva = time.monotonic() - creada_en <= self.reciclar_segundos
+            if viva:
+                try:
+                    conexion.ping(reconnect=False)
+                except Exception:
+                    viva = False
+            if not viva:
+                self._descartar(conexion)
+                with self._condicion:
+                    self._total -= 1
+                    self.descartadas += 1
+                    self._condicion.notify()
+                continue
+            with self._condicion:
+                self.aciertos += 1
+            return ConexionPool(self, conexion)
+
+        try:
+            conexion = self._crear()
+        except Exception:
+            with self._condicion:
+                self._total -= 1
+                self._condicion.notify()
+            raise
+        with self._condicion:
+            self.fallos += 1
+        return ConexionPool(self, conexion)
+
+    def devolver(self, conexion):
+        """Devuelve una conexión al pool descartando cualquier transacción abierta"""
+        try:
+            conexion.rollback()
+            reutilizable = conexion.open
+        except Exception:
+            reutilizable = False
+
+        with self._condicion:
+            self._recuperar_perdidas()
+            if reutilizable and len(self._libres) < self.maximo:
+                self._libres.append(conexion)
+            else:
+                self._descartar(conexion)
+                self._total -= 1
+            self._condicion.notify()
+            reponer = self._total < self.minimo
+
+        if reponer:
+            try:
+                self.precalentar()
+            except Exception as e:
+                print(f"⚠️ [POOL] No se pudo reponer el mínimo de conexiones: {e}")
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool"""
+        with self._condicion:
+            while self._libres:
+                self._descartar(self._libres.pop())
+                self._total -= 1
+
+    def estadisticas(self):
+        with self._condicion:
+            self._recuperar_perdidas()
+            prestamos = self.aciertos + self.fallos
+            return {
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'abiertas': self._total,
+                'libres': len(self._libres),
+                'en_uso': self._total - len(self._libres),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / prestamos * 100, 1) if prestamos else 0.0,
+                'descartadas': self.descartadas,
+                'esperas_agotadas': self.esperas_agotadas,
+                'perdidas': self.perdidas
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool():
+    """Devuelve el pool del proceso, creándolo en el primer uso"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                cfg = _configuracion_bd()
+                if cfg['backend'] == 'embebida':
+                    import bd_embebida
+                    conectar = bd_embebida.conectar
+                    parametros = {'ruta': cfg['embebida_ruta']}
+                else:
+                    conectar = pymysql.connect
+                    parametros = {
+                        'host': cfg['host'],
+                        'port': cfg['port'],
+                        'user': cfg['user'],
+                        'password': cfg['password'],
+                        'db': cfg['db']
+                    }
+                _pool = PoolConexiones(
+                    parametros=parametros,
+                    minimo=cfg['pool_min'],
+                    maximo=cfg['pool_max'],
+                    timeout=cfg['pool_timeout'],
+                    reciclar_segundos=cfg['pool_recycle'],
+                    conectar=conectar
+                )
+    return _pool
+
+
 def obtener_conexion():
-    return pymysql.connect(host='localhost',
-                                port=3306,
-                                user='root',
-                                password='',
-                                db='brain_rush')
\ No newline at end of file
+    """
+    Obtiene una conexión del pool.
+    Llamar a close() sobre ella la devuelve al pool en lugar de cerrarla.
+    Si hay una unidad de trabajo activa, devuelve su conexión compartida.
+    """
+    unidad = _unidad_actual()
+    if unidad is not None:
+        return unidad.compartida()
+    return obtener_pool().obtener()
+
+
+# ==================== RÉPLICA DE LECTURA ====================
+
+class EnrutadorReplica:
+    """
+    Decide si una consulta de solo lectura puede ir a la réplica.
+
+    El retraso de replicación se consulta como mucho cada `intervalo_verificacion`
+    segundos. Si la réplica supera `max_retraso` segundos o no responde, las lecturas
+    vuelven a la primaria hasta la siguiente verificación.
+    """
+
+    def __init__(self, pool, max_retraso=5, intervalo_verificacion=5, espera_tras_fallo=30):
+        self.pool = pool
+        self.max_retraso = max_retraso
+        self.intervalo_verificacion = intervalo_verificacion
+        self.espera_tras_fallo = espera_tras_fallo
+
+        self._lock = threading.Lock()
+        self._sana = True
+        self._proxima_verificacion = 0.0
+        self.retraso_actual = None
+
+        # Contadores
+        self.lecturas_replica = 0
+        self.lecturas_primaria = 0
+        self.fallos_conexion = 0
+
+    def _medir_retraso(self, conexion):
+        """Segundos de retraso de la réplica (0 si el servidor no replica, None si está detenida)"""
+        with conexion.cursor(pymysql.cursors.DictCursor) as cursor:
+            try:
+                cursor.execute('SHOW REPLICA STATUS')
+            except pymysql.err.MySQLError:
+                cursor.execute('SHOW SLAVE STATUS')
+            estado = cursor.fetchone()
+        if not estado:
+            return 0
+        retraso = estado.get('Seconds_Behind_Source', estado.get('Seconds_Behind_Master'))
+        return None if retraso is None else float(retraso)
+
+    def _marcar_caida(self):
+        with self._lock:
+            self._sana = False
+            self._proxima_verificacion = time.monotonic() + self.espera_tras_fallo
+            self.fallos_conexion += 1
+
+    def obtener(self):
+        """Devuelve una conexión de la réplica o None si hay que usar la primaria"""
+        ahora = time.monotonic()
+        with self._lock:
+            verificar = ahora >= self._proxima_verificacion
+            if not verificar and not self._sana:
+                self.lecturas_primaria += 1
+                return None
+
+        try:
+            conexion = self.pool.obtener()
+        except Exception as e:
+            print(f"⚠️ Réplica no disponible, usando primaria: {e}")
+            self._marcar_caida()
+            with self._lock:
+                self.lecturas_primaria += 1
+            return None
+
+        if verificar:
+            try:
+                retraso = self._medir_retraso(conexion)
+            except Exception as e:
+                print(f"⚠️ No se pudo medir el retraso de la réplica: {e}")
+                retraso = None
+            with self._lock:
+                self.retraso_actual = retraso
+                self._sana = retraso is not None and retraso <= self.max_retraso
+                self._proxima_verificacion = ahora + self.intervalo_verificacion
+
+        with self._lock:
+            if not self._sana:
+                self.lecturas_primaria += 1
+                conexion.close()
+                return None
+            self.lecturas_replica += 1
+        return conexion
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'sana': self._sana,
+                'retraso_segundos': self.retraso_actual,
+                'max_retraso': self.max_retraso,
+                'lecturas_replica': self.lecturas_replica,
+                'lecturas_primaria': self.lecturas_primaria,
+                'fallos_conexion': self.fallos_conexion,
+                'pool': self.pool.estadisticas()
+            }
+
+
+_enrutador_replica = None
+_replica_configurada = None
+
+
+def obtener_enrutador_replica():
+    """Devuelve el enrutador de la réplica, o None si no hay réplica configurada"""
+    global _enrutador_replica, _replica_configurada
+    if _replica_configurada is None:
+        with _pool_lock:
+            if _replica_configurada is None:
+                cfg = _configuracion_bd()
+                if cfg['replica_host'] and cfg['backend'] != 'embebida':
+                    pool_replica = PoolConexiones(
+                        parametros={
+                            'host': cfg['replica_host'],
+                            'port': cfg['replica_port'],
+                            'user': cfg['replica_user'],
+                            'password': cfg['replica_password'],
+                            'db': cfg['replica_db'],
+                            'connect_timeout': 3
+                        },
+                        minimo=0,
+                        maximo=cfg['pool_max'],
+                        timeout=cfg['pool_timeout'],
+                        reciclar_segundos=cfg['pool_recycle']
+                    )
+                    _enrutador_replica = EnrutadorReplica(pool_replica, max_retraso=cfg['replica_max_lag'])
+                _replica_configurada = _enrutador_replica is not None
+    return _enrutador_replica
+
+
+def obtener_conexion_lectura():
+    """
+    Obtiene una conexión para consultas de solo lectura que toleran unos segundos
+    de retraso (rankings, dashboards, historiales, exportaciones).
+
+    Usa la réplica si está configurada y al día; en cualquier otro caso, la primaria.
+    Dentro de una unidad de trabajo se usa siempre su conexión, para leer lo ya escrito.
+    """
+    unidad = _unidad_actual()
+    if unidad is not None:
+        return unidad.compartida()
+    enrutador = obtener_enrutador_replica()
+    if enrutador is not None:
+        conexion = enrutador.obtener()
+        if conexion is not None:
+            return conexion
+    return obtener_pool().obtener()
+
+
+# ==================== UNIDAD DE TRABAJO POR PETICIÓN ====================
+
+class ConexionCompartida:
+    """
+    Conexión de la unidad de trabajo activa.
+    commit() y close() se difieren hasta el final de la unidad de trabajo;
+    rollback() deshace la transacción y marca la unidad como fallida.
+    """
+
+    def __init__(self, unidad):
+        self._unidad = unidad
+
+    def __getattr__(self, nombre):
+        return getattr(self._unidad.conexion, nombre)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._unidad.conexion.rollback()
+        self._unidad.fallida = True
+
+    def close(self):
+        pass
+
+
+class UnidadDeTrabajo:
+    """Una conexión y una transacción compartidas por todos los controladores de una petición"""
+
+    def __init__(self):
+        self.conexion = None
+        self.fallida = False
+        self.profundidad = 0
+        self.tras_confirmar = []
+
+    def compartida(self):
+        if self.conexion is None:
+            self.conexion = obtener_pool().obtener()
+        return ConexionCompartida(self)
+
+    def finalizar(self, error=None):
+        confirmada = error is None and not self.fallida
+        if self.conexion is not None:
+            try:
+                if confirmada:
+                    self.conexion.commit()
+                else:
+                    self.conexion.rollback()
+            finally:
+                self.conexion.close()
+                self.conexion = None
+
+        if confirmada:
+            for funcion in self.tras_confirmar:
+                try:
+                    funcion()
+                except Exception as e:
+                    print(f"⚠️ [BD] Error en acción posterior al commit: {e}")
+        self.tras_confirmar = []
+
+
+def _unidad_actual():
+    """Devuelve la unidad de trabajo guardada en flask.g, si la hay"""
+    if not has_app_context():
+        return None
+    return g.get('_unidad_de_trabajo')
+
+
+def despues_de_confirmar(funcion):
+    """
+    Ejecuta `funcion` cuando se confirme la unidad de trabajo de la petición,
+    o de inmediato si no hay ninguna activa. Si la unidad termina en
+    ROLLBACK, la función no se ejecuta.
+    """
+    unidad = _unidad_actual()
+    if unidad is None:
+        funcion()
+    else:
+        unidad.tras_confirmar.append(funcion)
+
+
+@contextmanager
+def unidad_de_trabajo():
+    """
+    Abre (o reutiliza) la unidad de trabajo de la petición actual.
+    Dentro del bloque, obtener_conexion() devuelve siempre la misma conexión
+    y todo se confirma con un único COMMIT al salir del bloque más externo.
+
+    Uso:
+        with unidad_de_trabajo():
+            controlador_juego.registrar_respuesta_participante(...)
+    """
+    unidad = _unidad_actual()
+    if unidad is None:
+        unidad = UnidadDeTrabajo()
+        g._unidad_de_trabajo = unidad
+    unidad.profundidad += 1
+    try:
+        yield unidad
+    except Exception as e:
+        unidad.profundidad -= 1
+        if unidad.profundidad == 0:
+            g.pop('_unidad_de_trabajo', None)
+            unidad.finalizar(e)
+        raise
+    unidad.profundidad -= 1
+    if unidad.profundidad == 0:
+        g.pop('_unidad_de_trabajo', None)
+        unidad.finalizar()
+
+
+def _codigo_estado(respuesta):
+    """Extrae el código HTTP de lo que devuelve una vista de Flask"""
+    if isinstance(respuesta, tuple) and len(respuesta) > 1 and isinstance(respuesta[1], int):
+        return respuesta[1]
+    return getattr(respuesta, 'status_code', 200)
+
+
+def con_unidad_de_trabajo(f):
+    """
+    Decorador de rutas: ejecuta la vista completa en una única unidad de trabajo.
+    Si la vista responde con un error 5xx, la transacción se deshace.
+    """
+    @wraps(f)
+    def decorada(*args, **kwargs):
+        with unidad_de_trabajo() as unidad:
+            respuesta = f(*args, **kwargs)
+            if _codigo_estado(respuesta) >= 500:
+                unidad.fallida = True
+            return respuesta
+    return decorada
+
+
+def cerrar_unidad_de_trabajo(error=None):
+    """Cierra una unidad de trabajo que haya quedado abierta (para teardown_request)"""
+    unidad = _unidad_actual()
+    if unidad is not None:
+        g.pop('_unidad_de_trabajo', None)
+        unidad.finalizar(error)
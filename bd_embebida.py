@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Motor SQL embebido (SQLite) compatible con las consultas de los controladores
+Permite ejecutar la aplicación, los benchmarks y las pruebas de carga sin un
+servidor MySQL: carga database_schema_complete.sql traduciendo las partes
+propias de MySQL y traduce al vuelo el subconjunto de SQL que usa el código.
+
+Se activa con DB_BACKEND=embebida (ver bd.py).
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+import pymysql
+import pymysql.cursors
+
+RUTA_ESQUEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database_schema_complete.sql')
+RUTA_POR_DEFECTO = os.path.join(tempfile.gettempdir(), 'brain_rush_embebida.db')
+
+
+# ==================== TIPOS ====================
+
+def _convertir_fecha(valor):
+    texto = valor.decode()
+    for formato in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    return texto
+
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime, lambda d: d.strftime('%Y-%m-%d %H:%M:%S.%f'))
+sqlite3.register_adapter(date, lambda d: d.strftime('%Y-%m-%d'))
+sqlite3.register_converter('DATETIME', _convertir_fecha)
+sqlite3.register_converter('TIMESTAMP', _convertir_fecha)
+
+
+def _concat(*valores):
+    """CONCAT de MySQL: NULL si algún argumento es NULL"""
+    if any(v is None for v in valores):
+        return None
+    return ''.join(str(v) for v in valores)
+
+
+def _ahora():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ==================== TRADUCCIÓN DEL ESQUEMA ====================
+
+_RE_COMENTARIO_COLUMNA = re.compile(r"\s+COMMENT\s+'(?:[^'\\]|\\.)*'", re.IGNORECASE)
+_RE_ENUM = re.compile(r"\bENUM\s*\((?:[^()']|'[^']*')*\)", re.IGNORECASE)
+_RE_CLAVE_SECUNDARIA = re.compile(r"^\s*(?:INDEX|KEY)\s+`?(\w+)`?\s*\((.+)\)\s*$", re.IGNORECASE)
+_RE_CLAVE_UNICA = re.compile(r"^\s*UNIQUE\s+KEY\s+`?\w+`?\s*\((.+)\)\s*$", re.IGNORECASE)
+_RE_CLAVE_PRIMARIA = re.compile(r"^\s*PRIMARY\s+KEY\s*\(`?(\w+)`?\)\s*$", re.IGNORECASE)
+
+
+def _dividir_items(cuerpo):
+    """Divide el cuerpo de un CREATE TABLE por comas de primer nivel"""
+    items, actual, nivel, en_cadena = [], [], 0, False
+    for caracter in cuerpo:
+        if caracter == "'":
+            en_cadena = not en_cadena
+        elif not en_cadena:
+            if caracter == '(':
+                nivel += 1
+            elif caracter == ')':
+                nivel -= 1
+            elif caracter == ',' and nivel == 0:
+                items.append(''.join(actual).strip())
+                actual = []
+                continue
+        actual.append(caracter)
+    if ''.join(actual).strip():
+        items.append(''.join(actual).strip())
+    return items
+
+
+def _traducir_create_table(sentencia):
+    cabecera, resto = sentencia.split('(', 1)
+    tabla = re.search(r'`?(\w+)`?\s*$', cabecera.strip()).group(1)
+    cuerpo = resto[:resto.rindex(')')]
+
+    items = _dividir_items(cuerpo)
+    clave_primaria = None
+    for item in items:
+        coincidencia = _RE_CLAVE_PRIMARIA.match(item)
+        if coincidencia:
+            clave_primaria = coincidencia.group(1)
+
+    columnas, indices = [], []
+    for item in items:
+        if _RE_CLAVE_PRIMARIA.match(item):
+            continue
+        coincidencia = _RE_CLAVE_SECUNDARIA.match(item)
+        if coincidencia:
+            indices.append(f'CREATE INDEX IF NOT EXISTS `{tabla}_{coincidencia.group(1)}` ON `{tabla}` ({coincidencia.group(2)})')
+            continue
+        coincidencia = _RE_CLAVE_UNICA.match(item)
+        if coincidencia:
+            columnas.append(f'UNIQUE ({coincidencia.group(1)})')
+            continue
+
+        item = _RE_COMENTARIO_COLUMNA.sub('', item)
+        item = _RE_ENUM.sub('TEXT', item)
+        item = re.sub(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', '', item, flags=re.IGNORECASE)
+        item = re.sub(r'DEFAULT\s+CURRENT_TIMESTAMP', "DEFAULT (datetime('now', 'localtime'))", item, flags=re.IGNORECASE)
+
+        nombre = re.match(r'`?(\w+)`?', item).group(1)
+        if re.search(r'\bAUTO_INCREMENT\b', item, re.IGNORECASE) or nombre == clave_primaria:
+            if re.search(r'\bAUTO_INCREMENT\b', item, re.IGNORECASE):
+                item = f'`{nombre}` INTEGER PRIMARY KEY AUTOINCREMENT'
+            else:
+                item = f'{item} PRIMARY KEY'
+        columnas.append(item)
+
+    definicion = f'CREATE TABLE `{tabla}` (\n  ' + ',\n  '.join(columnas) + '\n)'
+    return [definicion] + indices
+
+
+def _traducir_trigger(bloque):
+    """Traduce el trigger IF ... THEN ... END IF de MySQL a un trigger WHEN de SQLite"""
+    coincidencia = re.search(
+        r'CREATE\s+TRIGGER\s+(\w+)\s+(AFTER|BEFORE)\s+(INSERT|UPDATE|DELETE)\s+ON\s+(\w+)\s+FOR\s+EACH\s+ROW\s+'
+        r'BEGIN\s+IF\s+(.+?)\s+THEN\s+(.+?)\s+END\s+IF;\s*END',
+        bloque, re.IGNORECASE | re.DOTALL
+    )
+    if not coincidencia:
+        return []
+    nombre, momento, evento, tabla, condicion, cuerpo = coincidencia.groups()
+    return [f'CREATE TRIGGER IF NOT EXISTS {nombre} {momento} {evento} ON {tabla} '
+            f'FOR EACH ROW WHEN {condicion} BEGIN {cuerpo} END']
+
+
+def traducir_esquema(sql):
+    """
+    Traduce database_schema_complete.sql a sentencias ejecutables por SQLite
+
+    Returns:
+        Lista de sentencias SQL
+    """
+    # Separar los bloques DELIMITER $$ ... DELIMITER ; (triggers)
+    sentencias = []
+    partes = re.split(r'^DELIMITER\s+(\S+)\s*$', sql, flags=re.MULTILINE)
+    delimitador = ';'
+    for indice, parte in enumerate(partes):
+        if indice % 2 == 1:
+            delimitador = parte
+            continue
+        if delimitador != ';':
+            for bloque in parte.split(delimitador):
+                if re.search(r'CREATE\s+TRIGGER', bloque, re.IGNORECASE):
+                    sentencias.extend(_traducir_trigger(bloque))
+            continue
+
+        lineas = [l for l in parte.splitlines() if not l.strip().startswith('--')]
+        for sentencia in '\n'.join(lineas).split(';'):
+            sentencia = sentencia.strip()
+            if not sentencia:
+                continue
+            mayusculas = sentencia.upper()
+            if mayusculas.startswith(('USE ', 'SET ', 'SELECT ')):
+                continue
+            if mayusculas.startswith('CREATE TABLE'):
+                sentencias.extend(_traducir_create_table(sentencia))
+            elif mayusculas.startswith('CREATE VIEW'):
+                sentencias.append(re.sub(r'\s+ORDER\s+BY\s+[^()]+$', '', sentencia))
+            elif mayusculas.startswith('DROP '):
+                sentencias.append(sentencia)
+    return sentencias
+
+
+# ==================== TRADUCCIÓN DE CONSULTAS ====================
+
+_RE_DUPLICADO = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_RE_VALUES_COLUMNA = re.compile(r'\bVALUES\s*\(\s*`?(\w+)`?\s*\)', re.IGNORECASE)
+_RE_SHOW_TABLES = re.compile(r"^\s*SHOW\s+TABLES\s+LIKE\s+('[^']*')\s*$", re.IGNORECASE)
+_RE_SHOW_COLUMNS = re.compile(r"^\s*SHOW\s+COLUMNS\s+FROM\s+`?(\w+)`?\s+LIKE\s+('[^']*')\s*$", re.IGNORECASE)
+_RE_GROUP_CONCAT = re.compile(r'GROUP_CONCAT\(\s*(DISTINCT\s+)?(.+?)\s+SEPARATOR\s+(\'[^\']*\')\s*\)', re.IGNORECASE)
+# Numeración con variables de usuario (MySQL 5.7, sin funciones de ventana):
+# (@n := @n + 1) sobre una subconsulta ordenada con LIMIT para conservar el orden
+_RE_NUMERACION = re.compile(r'\(\s*@(\w+)\s*:=\s*@\1\s*\+\s*1\s*\)')
+_RE_INICIO_VARIABLE = re.compile(r'\s+CROSS\s+JOIN\s+\(\s*SELECT\s+@\w+\s*:=\s*0\s*\)\s+AS\s+\w+', re.IGNORECASE)
+_RE_LIMITE_MAXIMO = re.compile(r'\bLIMIT\s+18446744073709551615\b', re.IGNORECASE)
+# UPDATE t a JOIN (...) AS b ON ... SET a.col = ... -> UPDATE t AS a SET col = ... FROM (...) AS b WHERE ...
+_RE_UPDATE_JOIN = re.compile(
+    r'^\s*UPDATE\s+(\w+)\s+(\w+)\s+JOIN\s+(.+)\s+ON\s+(.+?)\s+SET\s+(.+?)\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+
+_RE_ESCRITURA = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE|SAVEPOINT)\b', re.IGNORECASE)
+# SELECT ... FOR UPDATE: SQLite no bloquea filas; la lectura abre la transacción
+# de escritura (BEGIN IMMEDIATE), que serializa igual a los demás escritores
+_RE_BLOQUEO = re.compile(r'\s+FOR\s+UPDATE\s*$', re.IGNORECASE)
+
+_cache_traducciones = {}
+
+
+def traducir_consulta(consulta, con_parametros=True):
+    """Traduce una consulta escrita para MySQL/pymysql al dialecto de SQLite"""
+    clave = (consulta, con_parametros)
+    traducida = _cache_traducciones.get(clave)
+    if traducida is not None:
+        return traducida
+
+    traducida = consulta
+    coincidencia = _RE_SHOW_TABLES.match(traducida)
+    if coincidencia:
+        traducida = f"SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE {coincidencia.group(1)}"
+    coincidencia = _RE_SHOW_COLUMNS.match(traducida)
+    if coincidencia:
+        traducida = f"SELECT name FROM pragma_table_info('{coincidencia.group(1)}') WHERE name LIKE {coincidencia.group(2)}"
+
+    if con_parametros:
+        traducida = traducida.replace('%s', '?').replace('%%', '%')
+
+    coincidencia = _RE_DUPLICADO.search(traducida)
+    if coincidencia:
+        inicio, fin = coincidencia.start(), coincidencia.end()
+        actualizacion = _RE_VALUES_COLUMNA.sub(r'excluded.\1', traducida[fin:])
+        traducida = traducida[:inicio] + 'ON CONFLICT DO UPDATE SET' + actualizacion
+
+    def _group_concat(m):
+        if m.group(1):
+            # SQLite no admite separador junto con DISTINCT
+            return f'GROUP_CONCAT(DISTINCT {m.group(2)})'
+        return f'GROUP_CONCAT({m.group(2)}, {m.group(3)})'
+
+    traducida = _RE_GROUP_CONCAT.sub(_group_concat, traducida)
+    if _RE_NUMERACION.search(traducida):
+        traducida = _RE_NUMERACION.sub('ROW_NUMBER() OVER ()', traducida)
+        traducida = _RE_INICIO_VARIABLE.sub('', traducida)
+        traducida = _RE_LIMITE_MAXIMO.sub('LIMIT -1', traducida)
+    coincidencia = _RE_UPDATE_JOIN.match(traducida)
+    if coincidencia:
+        tabla, alias, origen, condicion, asignaciones = coincidencia.groups()
+        asignaciones = re.sub(rf'\b{alias}\.(\w+)\s*=', r'\1 =', asignaciones)
+        traducida = f'UPDATE {tabla} AS {alias} SET {asignaciones} FROM {origen} WHERE {condicion}'
+    traducida = re.sub(r'\bLAST_INSERT_ID\(\)', 'last_insert_rowid()', traducida, flags=re.IGNORECASE)
+    traducida = _RE_BLOQUEO.sub('', traducida)
+
+    _cache_traducciones[clave] = traducida
+    return traducida
+
+
+def _error_pymysql(error):
+    """Convierte una excepción de sqlite3 en la equivalente de pymysql"""
+    mensaje = str(error)
+    if isinstance(error, sqlite3.IntegrityError):
+        codigo = 1062 if 'UNIQUE' in mensaje else 1452
+        return pymysql.err.IntegrityError(codigo, mensaje)
+    if isinstance(error, sqlite3.OperationalError):
+        if 'syntax' in mensaje or 'no such' in mensaje:
+            return pymysql.err.ProgrammingError(1064, mensaje)
+        return pymysql.err.OperationalError(2013, mensaje)
+    return pymysql.err.DatabaseError(0, mensaje)
+
+
+# ==================== CONEXIÓN Y CURSOR ====================
+
+class CursorEmbebido:
+    """Cursor con la interfaz de pymysql sobre un cursor de sqlite3"""
+
+    def __init__(self, conexion, como_diccionario=False):
+        self._conexion = conexion
+        self._cursor = conexion._sqlite.cursor()
+        self._como_diccionario = como_diccionario
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _iniciar_transaccion(self, consulta):
+        # Las transacciones de escritura se abren con BEGIN IMMEDIATE: una
+        # transacción diferida que primero lee y luego escribe puede chocar con
+        # otra y fallar con "database is locked" sin esperar al busy timeout
+        if not self._conexion._sqlite.in_transaction and (
+                _RE_ESCRITURA.match(consulta) or _RE_BLOQUEO.search(consulta)):
+            self._cursor.execute('BEGIN IMMEDIATE')
+
+    def execute(self, consulta, args=None):
+        if args is not None and not isinstance(args, (tuple, list, dict)):
+            args = (args,)
+        traducida = traducir_consulta(consulta, args is not None)
+        try:
+            self._iniciar_transaccion(consulta)
+            self._cursor.execute(traducida, args if args is not None else ())
+        except sqlite3.Error as e:
+            raise _error_pymysql(e) from e
+        return self._cursor.rowcount
+
+    def executemany(self, consulta, lista_args):
+        traducida = traducir_consulta(consulta, True)
+        try:
+            self._iniciar_transaccion(traducida)
+            self._cursor.executemany(traducida, lista_args)
+        except sqlite3.Error as e:
+            raise _error_pymysql(e) from e
+        return self._cursor.rowcount
+
+    def _fila(self, fila):
+        if fila is None or not self._como_diccionario:
+            return fila
+        columnas = [d[0] for d in self._cursor.description]
+        return dict(zip(columnas, fila))
+
+    def fetchone(self):
+        return self._fila(self._cursor.fetchone())
+
+    def fetchall(self):
+        filas = self._cursor.fetchall()
+        if not self._como_diccionario:
+            return filas
+        columnas = [d[0] for d in self._cursor.description]
+        return [dict(zip(columnas, fila)) for fila in filas]
+
+    def fetchmany(self, cantidad=1):
+        return [self._fila(f) for f in self._cursor.fetchmany(cantidad)]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ConexionEmbebida:
+    """Conexión con la interfaz de pymysql sobre una conexión de sqlite3"""
+
+    def __init__(self, ruta):
+        self._sqlite = sqlite3.connect(
+            ruta, timeout=30, check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        self._sqlite.execute('PRAGMA foreign_keys = ON')
+        self._sqlite.execute('PRAGMA journal_mode = WAL')
+        self._sqlite.execute('PRAGMA synchronous = NORMAL')
+        self._sqlite.create_function('CONCAT', -1, _concat)
+        self._sqlite.create_function('NOW', 0, _ahora)
+        self.open = True
+
+    def cursor(self, clase=None):
+        como_diccionario = clase is not None and issubclass(clase, pymysql.cursors.DictCursorMixin)
+        return CursorEmbebido(self, como_diccionario)
+
+    def commit(self):
+        self._sqlite.commit()
+
+    def rollback(self):
+        self._sqlite.rollback()
+
+    def ping(self, reconnect=False):
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, 'Conexión cerrada')
+
+    def close(self):
+        if self.open:
+            self.open = False
+            self._sqlite.close()
+
+
+_esquema_lock = threading.Lock()
+
+
+def crear_esquema(ruta, ruta_esquema=RUTA_ESQUEMA):
+    """Crea las tablas del esquema en la base embebida si todavía no existen"""
+    with _esquema_lock:
+        conexion = sqlite3.connect(ruta, timeout=30)
+        try:
+            existe = conexion.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'salas_juego'"
+            ).fetchone()
+            if existe:
+                return False
+            with open(ruta_esquema, encoding='utf-8') as archivo:
+                sentencias = traducir_esquema(archivo.read())
+            conexion.create_function('CONCAT', -1, _concat)
+            for sentencia in sentencias:
+                conexion.execute(sentencia)
+            conexion.commit()
+            return True
+        finally:
+            conexion.close()
+
+
+def conectar(ruta=None, **_ignorados):
+    """
+    Abre una conexión a la base embebida (misma firma que pymysql.connect,
+    los parámetros de MySQL se ignoran)
+    """
+    ruta = ruta or os.environ.get('DB_EMBEBIDA_RUTA') or RUTA_POR_DEFECTO
+    crear_esquema(ruta)
+    return ConexionEmbebida(ruta)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: avalancha de uniones a una sala (300 estudiantes en un segundo)
+Compara la unión anterior (buscar la sala por PIN, leer la lista completa de
+participantes para la capacidad, SELECT de repetidos e INSERT con su propia
+conexión y commit) con la admisión por lotes de tiempo_real.admision.
+
+Cada estudiante es un hilo que llega en un instante aleatorio dentro de
+--ventana segundos. Se informa la latencia de cada unión (p50/p95/máx), las
+sentencias a la base de datos, los lotes escritos y si se respetó la
+capacidad: con --capacidad menor que --uniones, deben entrar exactamente
+--capacidad participantes.
+
+Crea una sala de prueba por método y la borra al terminar.
+
+Uso:
+    python benchmarks/avalancha_uniones.py [--uniones 300] [--ventana 1] [--capacidad 300] [--semilla 7] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import pymysql.cursors
+
+import bd_embebida
+from bd import obtener_conexion
+from controladores import controlador_salas  # noqa: F401  registra los cargadores y el escritor de admision
+from tiempo_real import admision
+
+
+class Contador:
+    """Cuenta las sentencias ejecutadas por cualquier hilo"""
+
+    def __init__(self):
+        self.sentencias = 0
+        self._lock = threading.Lock()
+
+    def sumar(self):
+        with self._lock:
+            self.sentencias += 1
+
+
+@contextlib.contextmanager
+def contar_sentencias(contador):
+    originales = {clase: clase.execute for clase in (pymysql.cursors.Cursor, bd_embebida.CursorEmbebido)}
+
+    def envolver(original):
+        def execute(cursor, consulta, args=None):
+            contador.sumar()
+            return original(cursor, consulta, args)
+        return execute
+
+    for clase, original in originales.items():
+        clase.execute = envolver(original)
+    try:
+        yield
+    finally:
+        for clase, original in originales.items():
+            clase.execute = original
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def unir_anterior(pin, nombre_participante):
+    """Método anterior: cada unión consulta la sala, la lista completa y los repetidos, e inserta sola"""
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT id_sala, estado, max_participantes FROM salas_juego WHERE pin_sala = %s', (pin,))
+            sala_id, estado, max_participantes = cursor.fetchone()
+    finally:
+        conexion.close()
+    if estado != 'esperando':
+        raise ValueError('La sala no está disponible')
+
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('''
+                SELECT ps.id_participante, ps.id_usuario, ps.nombre_participante, ps.fecha_union,
+                       ps.estado, ps.id_grupo, gs.nombre_grupo
+                FROM participantes_sala ps
+                LEFT JOIN grupos_sala gs ON ps.id_grupo = gs.id_grupo
+                WHERE ps.id_sala = %s AND ps.estado != 'desconectado'
+                ORDER BY ps.fecha_union ASC
+            ''', (sala_id,))
+            if len(cursor.fetchall()) >= max_participantes:
+                raise ValueError('La sala está llena')
+    finally:
+        conexion.close()
+
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('''
+                SELECT id_participante FROM participantes_sala
+                WHERE id_sala = %s AND nombre_participante = %s AND estado != 'desconectado'
+            ''', (sala_id, nombre_participante))
+            if cursor.fetchone():
+                raise ValueError('El participante ya está en la sala')
+            cursor.execute('''
+                INSERT INTO participantes_sala (id_sala, nombre_participante, estado)
+                VALUES (%s, %s, 'esperando')
+            ''', (sala_id, nombre_participante))
+            conexion.commit()
+            return cursor.lastrowid
+    finally:
+        conexion.close()
+
+
+def unir_por_lotes(pin, nombre_participante):
+    return admision.admitir(pin, nombre_participante)[1]
+
+
+def crear_sala(capacidad, aleatorio):
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            while True:
+                pin = f'{aleatorio.randrange(10 ** 6):06d}'
+                cursor.execute('SELECT 1 FROM salas_juego WHERE pin_sala = %s', (pin,))
+                if not cursor.fetchone():
+                    break
+            cursor.execute(
+                "INSERT INTO salas_juego (pin_sala, estado, max_participantes) VALUES (%s, 'esperando', %s)",
+                (pin, capacidad)
+            )
+            conexion.commit()
+            return cursor.lastrowid, pin
+    finally:
+        conexion.close()
+
+
+def borrar_sala(sala_id):
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM participantes_sala WHERE id_sala = %s', (sala_id,))
+            filas = cursor.fetchone()[0]
+            cursor.execute('DELETE FROM salas_juego WHERE id_sala = %s', (sala_id,))
+            conexion.commit()
+            return filas
+    finally:
+        conexion.close()
+
+
+def avalancha(metodo, args):
+    """Lanza las uniones y devuelve el resumen"""
+    aleatorio = random.Random(args.semilla)
+    sala_id, pin = crear_sala(args.capacidad, aleatorio)
+    llegadas = sorted(aleatorio.uniform(0, args.ventana) for _ in range(args.uniones))
+    latencias = []
+    rechazos = []
+    errores = []
+    lock = threading.Lock()
+    contador = Contador()
+    barrera = threading.Barrier(args.uniones + 1)
+
+    def estudiante(indice, llegada):
+        barrera.wait()
+        time.sleep(max(0.0, inicio + llegada - time.perf_counter()))
+        t0 = time.perf_counter()
+        try:
+            metodo(pin, f'Estudiante {indice}')
+            with lock:
+                latencias.append((time.perf_counter() - t0) * 1000)
+        except ValueError as e:
+            with lock:
+                rechazos.append(str(e))
+        except Exception as e:
+            with lock:
+                errores.append(repr(e))
+
+    hilos = [threading.Thread(target=estudiante, args=(i, llegada)) for i, llegada in enumerate(llegadas)]
+    for hilo in hilos:
+        hilo.start()
+    antes = admision.estadisticas()
+    with contar_sentencias(contador), contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter() + 0.05
+        barrera.wait()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+    despues = admision.estadisticas()
+    filas = borrar_sala(sala_id)
+
+    return {
+        'admitidas': len(latencias),
+        'rechazadas': len(rechazos),
+        'errores': len(errores),
+        'filas_en_bd': filas,
+        'capacidad_respetada': filas <= args.capacidad,
+        'duracion_s': round(duracion, 3),
+        'p50_ms': round(percentil(latencias, 50), 2),
+        'p95_ms': round(percentil(latencias, 95), 2),
+        'max_ms': round(max(latencias, default=0.0), 2),
+        'sentencias': contador.sentencias,
+        'lotes': despues['lotes'] - antes['lotes'],
+        'ejemplo_error': errores[0] if errores else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uniones', type=int, default=300)
+    parser.add_argument('--ventana', type=float, default=1.0, help='Segundos en los que llegan todas las uniones')
+    parser.add_argument('--capacidad', type=int, default=300, help='max_participantes de la sala')
+    parser.add_argument('--semilla', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='Imprime los resultados en JSON')
+    args = parser.parse_args()
+
+    resultados = {
+        'anterior': avalancha(unir_anterior, args),
+        'por_lotes': avalancha(unir_por_lotes, args)
+    }
+
+    if args.json:
+        print(json.dumps({
+            'uniones': args.uniones, 'ventana_s': args.ventana, 'capacidad': args.capacidad,
+            'semilla': args.semilla, 'resultados': resultados
+        }, indent=2))
+        return
+
+    print(f"{args.uniones} uniones en {args.ventana:g} s, capacidad {args.capacidad}\n")
+    print(f"{'método':<10} | {'admitidas':>9} | {'en BD':>5} | {'errores':>7} | {'p50 ms':>8} | {'p95 ms':>8} | "
+          f"{'máx ms':>8} | {'sentencias':>10} | {'lotes':>5}")
+    for nombre, r in resultados.items():
+        aviso = '' if r['capacidad_respetada'] else '  ⚠️ capacidad superada'
+        print(f"{nombre:<10} | {r['admitidas']:>9} | {r['filas_en_bd']:>5} | {r['errores']:>7} | {r['p50_ms']:>8.2f} | "
+              f"{r['p95_ms']:>8.2f} | {r['max_ms']:>8.2f} | {r['sentencias']:>10} | {r['lotes']:>5}{aviso}")
+        if r['ejemplo_error']:
+            print(f"   ❌ {r['ejemplo_error']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga: salas de juego simultáneas con estudiantes simulados
+Crea N salas con /crear-sala-cuestionario, une M estudiantes por sala con
+/unirse-juego, inicia cada juego y reproduce el tráfico de JuegoEstudiante.html
+(pregunta actual, respuesta, XP, esperas largas sobre /esperar, ranking final)
+y de ControlJuegoDocente.html (panel cada 2 segundos, avance y finalización),
+sin eventos SSE, es decir, el peor caso de sondeo.
+
+Las peticiones se hacen dentro del proceso con el cliente de pruebas de Flask
+contra la base de datos configurada en .env: un MySQL local o, con
+DB_BACKEND=embebida, el motor embebido (sin ningún servicio). Cada estudiante y docente es un
+hilo con su propia sesión. Los tiempos de pensar y de espera se escalan con
+--escala (0.1 = una pregunta de 30 s dura 3 s) y salen de generadores con
+semilla: dos ejecuciones con la misma semilla hacen el mismo recorrido.
+
+Informa, por ruta, las peticiones, errores y latencias p50/p95/p99, y en total
+la tasa de error y las consultas a la base de datos por respuesta registrada.
+Al terminar borra el cuestionario, las salas y el docente de prueba (salvo
+--conservar).
+
+Uso:
+    python benchmarks/carga_salas.py [--salas 5] [--estudiantes 30] [--preguntas 10]
+                                     [--escala 0.1] [--semilla 1] [--salida carga_salas.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import pymysql.cursors
+
+import bd_embebida
+from bd import obtener_conexion, obtener_pool
+
+# Intervalos de los sondeos de las páginas (segundos, antes de escalar)
+SONDEO_PAGINAS = 2.0
+PAUSA_TRAS_RESPONDER = 1.5
+PAUSA_CONSULTA_XP = 0.8
+
+
+# ==================== MEDICIÓN ====================
+
+class Medidor:
+    """
+    Latencias por ruta y consultas a la base de datos.
+    Las consultas se atribuyen a la ruta que el hilo está pidiendo; las de los
+    hilos de segundo plano (ingesta, XP, temporizador) van a 'segundo_plano'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.consultas = defaultdict(int)
+        self.respuestas_registradas = 0
+
+    def ruta_actual(self):
+        return getattr(self._local, 'ruta', None) or 'segundo_plano'
+
+    def contar_consulta(self):
+        ruta = self.ruta_actual()
+        with self._lock:
+            self.consultas[ruta] += 1
+
+    def peticion(self, cliente, metodo, ruta, url, **kwargs):
+        """Hace la petición, mide su latencia y devuelve (status, json o None, cabeceras)"""
+        self._local.ruta = ruta
+        inicio = time.perf_counter()
+        cabeceras = {}
+        try:
+            respuesta = cliente.open(url, method=metodo, **kwargs)
+            estado, cabeceras = respuesta.status_code, respuesta.headers
+            datos = respuesta.get_json(silent=True)
+        except Exception:
+            estado, datos = 599, None
+        finally:
+            self._local.ruta = None
+        transcurrido = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.latencias[ruta].append(transcurrido)
+            if estado >= 400 or (isinstance(datos, dict) and datos.get('success') is False):
+                self.errores[ruta] += 1
+        return estado, datos, cabeceras
+
+    def anotar_respuesta(self):
+        with self._lock:
+            self.respuestas_registradas += 1
+
+
+@contextlib.contextmanager
+def contar_consultas(medidor):
+    """Cuenta cada execute() de los cursores (pymysql o embebidos) mientras dura el bloque"""
+    originales = {clase: clase.execute for clase in (pymysql.cursors.Cursor, bd_embebida.CursorEmbebido)}
+
+    def contador(original):
+        def execute(cursor, consulta, args=None):
+            medidor.contar_consulta()
+            return original(cursor, consulta, args)
+        return execute
+
+    for clase, original in originales.items():
+        clase.execute = contador(original)
+    try:
+        yield
+    finally:
+        for clase, original in originales.items():
+            clase.execute = original
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+# ==================== DATOS DE PRUEBA ====================
+
+def preparar_datos(semilla, num_preguntas):
+    """
+    Crea un docente y un cuestionario de prueba con sus preguntas
+
+    Returns:
+        (id_docente, id_cuestionario, {id_pregunta: id_opcion_correcta})
+    """
+    marca = f'carga-{semilla}-{int(time.time())}'
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO usuarios (nombre, apellidos, email, contraseña_hash, tipo_usuario)
+                VALUES (%s, 'Carga', %s, 'sin-acceso', 'docente')
+            ''', ('Docente', f'{marca}@carga.local'))
+            id_docente = cursor.lastrowid
+            cursor.execute('''
+                INSERT INTO cuestionarios (titulo, id_docente, estado)
+                VALUES (%s, %s, 'publicado')
+            ''', (f'Prueba de carga {marca}', id_docente))
+            id_cuestionario = cursor.lastrowid
+
+            correctas = {}
+            for orden in range(1, num_preguntas + 1):
+                cursor.execute('''
+                    INSERT INTO preguntas (enunciado, tipo) VALUES (%s, 'opcion_multiple')
+                ''', (f'Pregunta {orden} ({marca})',))
+                id_pregunta = cursor.lastrowid
+                cursor.execute('''
+                    INSERT INTO cuestionario_preguntas (id_cuestionario, id_pregunta, orden)
+                    VALUES (%s, %s, %s)
+                ''', (id_cuestionario, id_pregunta, orden))
+                for indice in range(4):
+                    cursor.execute('''
+                        INSERT INTO opciones_respuesta (id_pregunta, texto_opcion, es_correcta)
+                        VALUES (%s, %s, %s)
+                    ''', (id_pregunta, f'Opción {indice + 1}', 1 if indice == 0 else 0))
+                    if indice == 0:
+                        correctas[id_pregunta] = cursor.lastrowid
+            conexion.commit()
+            return id_docente, id_cuestionario, correctas
+    finally:
+        conexion.close()
+
+
+def limpiar_datos(id_docente, id_cuestionario, salas):
+    """Borra las salas (en cascada participantes, respuestas y ranking), el cuestionario y el docente"""
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            for sala_id in salas:
+                cursor.execute('DELETE FROM salas_juego WHERE id_sala = %s', (sala_id,))
+            cursor.execute('''
+                DELETE FROM preguntas WHERE id_pregunta IN (
+                    SELECT id_pregunta FROM (
+                        SELECT id_pregunta FROM cuestionario_preguntas WHERE id_cuestionario = %s
+                    ) AS p
+                )
+            ''', (id_cuestionario,))
+            cursor.execute('DELETE FROM cuestionarios WHERE id_cuestionario = %s', (id_cuestionario,))
+            cursor.execute('DELETE FROM usuarios WHERE id_usuario = %s', (id_docente,))
+            conexion.commit()
+    finally:
+        conexion.close()
+
+
+# ==================== CLIENTES SIMULADOS ====================
+
+class Sondeo:
+    """Guarda el ETag de cada URL y lo reenvía (If-None-Match), como el navegador"""
+
+    def __init__(self, medidor, cliente):
+        self.medidor = medidor
+        self.cliente = cliente
+        self._etags = {}
+        self._ultimos = {}
+
+    def get(self, ruta, url):
+        cabeceras = {}
+        if url in self._etags:
+            cabeceras['If-None-Match'] = self._etags[url]
+        estado, datos, respuesta = self.medidor.peticion(self.cliente, 'GET', ruta, url, headers=cabeceras)
+        if estado == 304:
+            return self._ultimos.get(url)
+        if respuesta.get('ETag'):
+            self._etags[url] = respuesta['ETag']
+            self._ultimos[url] = datos
+        return datos
+
+
+class Sala:
+    """Coordinación entre el docente simulado de una sala y sus estudiantes"""
+
+    def __init__(self, indice):
+        self.indice = indice
+        self.sala_id = None
+        self.pin = None
+        self.creada = threading.Event()
+        self.terminada = threading.Event()
+
+
+def simular_estudiante(app, medidor, sala, indice, correctas, escala, rng, tiempo_limite):
+    cliente = app.test_client()
+    sondeo = Sondeo(medidor, cliente)
+    sala.creada.wait()
+    if sala.sala_id is None:
+        return
+    base = f'/api/sala/{sala.sala_id}'
+
+    estado, datos, _ = medidor.peticion(cliente, 'POST', 'POST /unirse-juego', '/unirse-juego', json={
+        'pin_sala': sala.pin,
+        'nombre_estudiante': f'Estudiante {sala.indice}-{indice}'
+    })
+    if not datos or not datos.get('success'):
+        return
+
+    # Sala de espera: participantes y estado cada 2 segundos hasta que empiece
+    while not sala.terminada.is_set():
+        sondeo.get('GET /api/sala/<id>/participantes', f'{base}/participantes')
+        datos = sondeo.get('GET /api/sala/<id>/estado', f'{base}/estado')
+        if datos and datos.get('sala', {}).get('estado') in ('en_curso', 'finalizada'):
+            break
+        time.sleep(SONDEO_PAGINAS * escala)
+
+    version = ''
+    numero_respondido = 0
+    while not sala.terminada.is_set():
+        _, datos, _ = medidor.peticion(cliente, 'GET', 'GET /api/sala/<id>/pregunta-actual', f'{base}/pregunta-actual')
+        pregunta = (datos or {}).get('pregunta')
+        if pregunta and pregunta['numero_pregunta'] != numero_respondido:
+            numero_respondido = pregunta['numero_pregunta']
+            # Tiempo de pensar: log-normal alrededor de un tercio del tiempo límite
+            pensar = min(rng.lognormvariate(math.log(tiempo_limite / 3), 0.5), tiempo_limite)
+            time.sleep(pensar * escala)
+            if pensar < tiempo_limite:
+                opciones = [opcion['id_opcion'] for opcion in pregunta['opciones']]
+                correcta = correctas.get(pregunta['id_pregunta'])
+                elegida = correcta if correcta in opciones and rng.random() < 0.6 else rng.choice(opciones)
+                _, datos, _ = medidor.peticion(cliente, 'POST', 'POST /api/sala/<id>/responder', f'{base}/responder', json={
+                    'id_pregunta': pregunta['id_pregunta'],
+                    'id_opcion': elegida,
+                    'tiempo_respuesta': round(pensar, 3)
+                })
+                if datos and datos.get('success'):
+                    medidor.anotar_respuesta()
+                    if datos['resultado'].get('es_correcta'):
+                        time.sleep(PAUSA_CONSULTA_XP * escala)
+                        medidor.peticion(cliente, 'GET', 'GET /api/sala/<id>/xp', f'{base}/xp')
+                time.sleep(PAUSA_TRAS_RESPONDER * escala)
+
+        # Espera larga hasta que el docente avance o finalice
+        while not sala.terminada.is_set():
+            _, datos, _ = medidor.peticion(
+                cliente, 'GET', 'GET /api/sala/<id>/esperar',
+                f'{base}/esperar?desde={version}&timeout={max(1.0, 25 * escala)}'
+            )
+            if not datos or not datos.get('success'):
+                time.sleep(SONDEO_PAGINAS * escala)
+                continue
+            version = datos['version']
+            if datos['estado'] == 'finalizada':
+                medidor.peticion(cliente, 'GET', 'GET /api/sala/<id>/ranking', f'{base}/ranking')
+                return
+            if datos.get('pregunta') and datos['pregunta']['numero_pregunta'] != numero_respondido:
+                break
+
+
+def simular_docente(app, medidor, sala, id_docente, id_cuestionario, estudiantes, escala, tiempo_limite):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['usuario_id'] = id_docente
+        sesion['logged_in'] = True
+        sesion['usuario_tipo'] = 'docente'
+    sondeo = Sondeo(medidor, cliente)
+
+    try:
+        _, datos, _ = medidor.peticion(
+            cliente, 'POST', 'POST /crear-sala-cuestionario/<id>',
+            f'/crear-sala-cuestionario/{id_cuestionario}', json={'capacidad_maxima': estudiantes}
+        )
+        if not datos or not datos.get('success'):
+            return
+        sala.sala_id, sala.pin = datos['sala_id'], datos['codigo_sala']
+        # crear_sala_simple no guarda la capacidad: se ajusta para admitir a todos
+        conexion = obtener_conexion()
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute('UPDATE salas_juego SET max_participantes = %s WHERE id_sala = %s',
+                               (estudiantes, sala.sala_id))
+                conexion.commit()
+        finally:
+            conexion.close()
+    finally:
+        sala.creada.set()
+
+    base = f'/api/sala/{sala.sala_id}'
+    try:
+        # Esperar a que se unan todos (como mucho 60 s reales)
+        limite = time.monotonic() + 60
+        while time.monotonic() < limite:
+            datos = sondeo.get('GET /api/sala/<id>/participantes', f'{base}/participantes')
+            if datos and len(datos.get('participantes') or []) >= estudiantes:
+                break
+            time.sleep(SONDEO_PAGINAS * escala)
+
+        medidor.peticion(cliente, 'POST', 'POST /sala/<id>/iniciar', f'/sala/{sala.sala_id}/iniciar', json={})
+
+        while True:
+            _, datos, _ = medidor.peticion(cliente, 'GET', 'GET /api/sala/<id>/pregunta-actual', f'{base}/pregunta-actual')
+            pregunta = (datos or {}).get('pregunta')
+            if not pregunta:
+                break
+            # Panel cada 2 segundos hasta que respondan todos o se agote el tiempo
+            vence = time.monotonic() + tiempo_limite * escala
+            while time.monotonic() < vence:
+                panel = sondeo.get('GET /api/sala/<id>/panel', f'{base}/panel')
+                estadisticas = (panel or {}).get('estadisticas') or {}
+                if estadisticas.get('total') and estadisticas.get('respondieron', 0) >= estadisticas['total']:
+                    break
+                time.sleep(SONDEO_PAGINAS * escala)
+
+            if pregunta['numero_pregunta'] >= pregunta['total_preguntas']:
+                medidor.peticion(cliente, 'POST', 'POST /sala/<id>/finalizar', f'/sala/{sala.sala_id}/finalizar', json={})
+                break
+            medidor.peticion(cliente, 'POST', 'POST /api/sala/<id>/siguiente-pregunta', f'{base}/siguiente-pregunta', json={})
+    finally:
+        sala.terminada.set()
+
+
+# ==================== EJECUCIÓN ====================
+
+def ejecutar(args):
+    with contextlib.redirect_stdout(io.StringIO() if not args.verboso else sys.stdout):
+        import main
+    app = main.app
+
+    id_docente, id_cuestionario, correctas = preparar_datos(args.semilla, args.preguntas)
+    salas = [Sala(i) for i in range(args.salas)]
+    medidor = Medidor()
+    hilos = []
+    for sala in salas:
+        hilos.append(threading.Thread(target=simular_docente, args=(
+            app, medidor, sala, id_docente, id_cuestionario, args.estudiantes, args.escala, args.tiempo_limite
+        )))
+        for indice in range(args.estudiantes):
+            rng = random.Random(f'{args.semilla}-{sala.indice}-{indice}')
+            hilos.append(threading.Thread(target=simular_estudiante, args=(
+                app, medidor, sala, indice, correctas, args.escala, rng, args.tiempo_limite
+            )))
+
+    salida_app = sys.stdout if args.verboso else io.StringIO()
+    inicio = time.perf_counter()
+    with contar_consultas(medidor), contextlib.redirect_stdout(salida_app):
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        # Dejar que la ingesta diferida y la liquidación de XP terminen
+        main.ingesta.vaciar()
+    duracion = time.perf_counter() - inicio
+
+    if not args.conservar:
+        with contextlib.redirect_stdout(salida_app):
+            limpiar_datos(id_docente, id_cuestionario, [s.sala_id for s in salas if s.sala_id])
+
+    rutas = {}
+    for ruta in sorted(medidor.latencias):
+        latencias = medidor.latencias[ruta]
+        rutas[ruta] = {
+            'peticiones': len(latencias),
+            'errores': medidor.errores[ruta],
+            'p50_ms': round(percentil(latencias, 50), 2),
+            'p95_ms': round(percentil(latencias, 95), 2),
+            'p99_ms': round(percentil(latencias, 99), 2),
+            'max_ms': round(max(latencias), 2),
+            'consultas_bd': medidor.consultas.get(ruta, 0)
+        }
+    peticiones = sum(r['peticiones'] for r in rutas.values())
+    errores = sum(r['errores'] for r in rutas.values())
+    consultas = sum(medidor.consultas.values())
+    respuestas = medidor.respuestas_registradas
+
+    return {
+        'configuracion': {
+            'salas': args.salas,
+            'estudiantes_por_sala': args.estudiantes,
+            'preguntas': args.preguntas,
+            'tiempo_limite_s': args.tiempo_limite,
+            'escala': args.escala,
+            'semilla': args.semilla,
+            'base_datos': 'embebida' if (os.environ.get('DB_BACKEND') or '').lower() == 'embebida'
+                          else os.environ.get('DB_HOST') or 'localhost',
+            'ingesta_diferida': main.ingesta.ACTIVA,
+            'python': platform.python_version()
+        },
+        'duracion_s': round(duracion, 2),
+        'peticiones': peticiones,
+        'peticiones_por_segundo': round(peticiones / duracion, 1) if duracion else 0.0,
+        'tasa_error': round(errores / peticiones * 100, 2) if peticiones else 0.0,
+        'respuestas_registradas': respuestas,
+        'consultas_bd': consultas,
+        'consultas_por_respuesta': round(consultas / respuestas, 2) if respuestas else None,
+        'consultas_segundo_plano': medidor.consultas.get('segundo_plano', 0),
+        'rutas': rutas,
+        'pool': obtener_pool().estadisticas()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga de salas de juego simultáneas')
+    parser.add_argument('--salas', type=int, default=5)
+    parser.add_argument('--estudiantes', type=int, default=30, help='Estudiantes por sala')
+    parser.add_argument('--preguntas', type=int, default=10)
+    parser.add_argument('--tiempo-limite', type=float, default=30, help='Segundos por pregunta (sin escalar)')
+    parser.add_argument('--escala', type=float, default=0.1, help='Factor aplicado a esperas y tiempos de pensar')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', default='carga_salas.json', help='Archivo JSON de resultados')
+    parser.add_argument('--conservar', action='store_true', help='No borrar los datos de prueba al terminar')
+    parser.add_argument('--verboso', action='store_true', help='Mostrar el registro de la aplicación')
+    args = parser.parse_args()
+
+    resultados = ejecutar(args)
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+    print(f"\n{args.salas} salas x {args.estudiantes} estudiantes, {args.preguntas} preguntas "
+          f"en {resultados['duracion_s']} s ({resultados['peticiones_por_segundo']} pet/s)")
+    print(f"{'Ruta':<42} {'Pet.':>7} {'Err.':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Consultas':>10}")
+    for ruta, datos in resultados['rutas'].items():
+        print(f"{ruta:<42} {datos['peticiones']:>7} {datos['errores']:>5} {datos['p50_ms']:>9.2f} "
+              f"{datos['p95_ms']:>9.2f} {datos['p99_ms']:>9.2f} {datos['consultas_bd']:>10}")
+    print(f"\nTasa de error: {resultados['tasa_error']}%  |  Respuestas: {resultados['respuestas_registradas']}  |  "
+          f"Consultas por respuesta: {resultados['consultas_por_respuesta']}")
+    print(f"Resultados en {args.salida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: consultas de lectura pesadas de los controladores
+Mide, sobre la base de datos configurada en .env (normalmente llena con
+benchmarks/generar_datos.py), el tiempo de:
+
+- controlador_ranking.obtener_ranking_global
+- controlador_ranking.obtener_ranking_global_por_docente (docente con más salas)
+- controlador_xp.obtener_perfil_xp y obtener_todas_insignias_usuario
+  (estudiante más activo y estudiante mediano)
+- controlador_participaciones.obtener_participaciones_por_usuario (historial
+  del estudiante más activo)
+- controlador_juego.obtener_detalle_respuestas_estudiantes (sala en curso con
+  más participantes)
+
+Cada consulta se calienta y se repite; el informe JSON guarda mínimo, mediana
+y p95 en ms, las filas devueltas y el número de filas de cada tabla (huella
+del conjunto de datos). Con --base se compara la mediana con un informe
+anterior y se termina con código 1 si alguna empeora más que --umbral.
+
+Uso:
+    python benchmarks/consultas_lectura.py [--repeticiones 5] [--calentamiento 1] [--salida consultas_lectura.json]
+        [--base anterior.json] [--umbral 0.2] [--minimo-ms 2] [--solo ranking_global,perfil_xp_activo]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from bd import obtener_conexion, _configuracion_bd
+from controladores import controlador_juego, controlador_participaciones, controlador_ranking, controlador_xp
+
+TABLAS = (
+    'usuarios', 'cuestionarios', 'preguntas', 'salas_juego', 'participantes_sala',
+    'respuestas_participantes', 'ranking_sala', 'insignias_usuarios'
+)
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def elegir_objetivos():
+    """Usuarios, docente y sala representativos de los datos actuales"""
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            huella = {}
+            for tabla in TABLAS:
+                cursor.execute(f'SELECT COUNT(*) FROM {tabla}')
+                huella[tabla] = cursor.fetchone()[0]
+
+            cursor.execute('''
+                SELECT p.id_usuario, COUNT(*) AS partidas
+                FROM participantes_sala p
+                JOIN usuarios u ON p.id_usuario = u.id_usuario
+                WHERE u.tipo_usuario = 'estudiante'
+                GROUP BY p.id_usuario
+                ORDER BY partidas DESC, p.id_usuario
+            ''')
+            actividad = cursor.fetchall()
+
+            cursor.execute('''
+                SELECT c.id_docente, COUNT(*) AS salas
+                FROM salas_juego s
+                JOIN cuestionarios c ON s.id_cuestionario = c.id_cuestionario
+                WHERE c.id_docente IS NOT NULL
+                GROUP BY c.id_docente
+                ORDER BY salas DESC, c.id_docente
+                LIMIT 1
+            ''')
+            docente = cursor.fetchone()
+
+            cursor.execute('''
+                SELECT p.id_sala, COUNT(*) AS participantes
+                FROM participantes_sala p
+                JOIN salas_juego s ON p.id_sala = s.id_sala
+                JOIN estado_juego_sala e ON e.id_sala = s.id_sala
+                WHERE s.estado = 'en_curso' AND p.estado = 'jugando'
+                GROUP BY p.id_sala
+                ORDER BY participantes DESC, p.id_sala
+                LIMIT 1
+            ''')
+            sala = cursor.fetchone()
+    finally:
+        conexion.close()
+
+    objetivos = {}
+    if actividad:
+        objetivos['estudiante_activo'] = {'id': actividad[0][0], 'partidas': actividad[0][1]}
+        mediano = actividad[len(actividad) // 2]
+        objetivos['estudiante_mediano'] = {'id': mediano[0], 'partidas': mediano[1]}
+    if docente:
+        objetivos['docente'] = {'id': docente[0], 'salas': docente[1]}
+    if sala:
+        objetivos['sala_en_curso'] = {'id': sala[0], 'participantes': sala[1]}
+    return huella, objetivos
+
+
+def definir_casos(objetivos):
+    """(nombre, función, argumentos) de cada consulta que se puede medir con los datos actuales"""
+    casos = [('ranking_global', controlador_ranking.obtener_ranking_global, ())]
+    if 'docente' in objetivos:
+        casos.append(('ranking_docente', controlador_ranking.obtener_ranking_global_por_docente,
+                      (objetivos['docente']['id'],)))
+    for clave, sufijo in (('estudiante_activo', 'activo'), ('estudiante_mediano', 'mediano')):
+        if clave in objetivos:
+            id_usuario = objetivos[clave]['id']
+            casos.append((f'perfil_xp_{sufijo}', controlador_xp.obtener_perfil_xp, (id_usuario,)))
+            casos.append((f'insignias_{sufijo}', controlador_xp.obtener_todas_insignias_usuario, (id_usuario,)))
+    if 'estudiante_activo' in objetivos:
+        casos.append(('historial_activo', controlador_participaciones.obtener_participaciones_por_usuario,
+                      (objetivos['estudiante_activo']['id'],)))
+    if 'sala_en_curso' in objetivos:
+        casos.append(('detalle_respuestas', controlador_juego.obtener_detalle_respuestas_estudiantes,
+                      (objetivos['sala_en_curso']['id'],)))
+    return casos
+
+
+def contar_filas(resultado):
+    if isinstance(resultado, list):
+        return len(resultado)
+    if isinstance(resultado, dict):
+        for clave in ('estudiantes', 'insignias'):
+            if isinstance(resultado.get(clave), list):
+                return len(resultado[clave])
+        return 1
+    return 0 if resultado is None else 1
+
+
+def medir(funcion, argumentos, repeticiones, calentamiento):
+    tiempos = []
+    resultado = None
+    # Los controladores registran con print: se silencia para no medir la consola
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(calentamiento):
+            funcion(*argumentos)
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion(*argumentos)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'min_ms': round(min(tiempos), 3),
+        'mediana_ms': round(statistics.median(tiempos), 3),
+        'p95_ms': round(percentil(tiempos, 95), 3),
+        'filas': contar_filas(resultado)
+    }
+
+
+def comparar(informe, base, umbral, minimo_ms):
+    """
+    Compara las medianas con un informe anterior
+
+    Returns:
+        Lista de (nombre, mediana base, mediana actual, variación) que empeoran más del umbral
+    """
+    if base.get('huella') != informe['huella']:
+        print("⚠️  Los datos no coinciden con los del informe base (huella distinta): la comparación es orientativa")
+    regresiones = []
+    print(f"\n{'consulta':<22}{'base ms':>12}{'actual ms':>12}{'variación':>12}")
+    for nombre, actual in informe['consultas'].items():
+        anterior = base.get('consultas', {}).get(nombre)
+        if not anterior:
+            print(f"{nombre:<22}{'-':>12}{actual['mediana_ms']:>12.2f}{'nueva':>12}")
+            continue
+        variacion = (actual['mediana_ms'] - anterior['mediana_ms']) / anterior['mediana_ms'] if anterior['mediana_ms'] else 0.0
+        empeora = variacion > umbral and actual['mediana_ms'] - anterior['mediana_ms'] > minimo_ms
+        marca = ' ❌' if empeora else ''
+        print(f"{nombre:<22}{anterior['mediana_ms']:>12.2f}{actual['mediana_ms']:>12.2f}{variacion:>+11.0%}{marca}")
+        if empeora:
+            regresiones.append((nombre, anterior['mediana_ms'], actual['mediana_ms'], variacion))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de consultas de lectura')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--calentamiento', type=int, default=1)
+    parser.add_argument('--solo', default='', help='Consultas a medir separadas por comas (por defecto, todas)')
+    parser.add_argument('--salida', default='consultas_lectura.json', help='Archivo JSON de resultados')
+    parser.add_argument('--base', help='Informe JSON anterior con el que comparar')
+    parser.add_argument('--umbral', type=float, default=0.2, help='Empeoramiento relativo tolerado de la mediana')
+    parser.add_argument('--minimo-ms', type=float, default=2.0,
+                        help='Diferencia absoluta mínima para considerar una regresión (evita ruido en consultas rápidas)')
+    args = parser.parse_args()
+
+    huella, objetivos = elegir_objetivos()
+    casos = definir_casos(objetivos)
+    if args.solo:
+        seleccion = {nombre.strip() for nombre in args.solo.split(',')}
+        casos = [caso for caso in casos if caso[0] in seleccion]
+
+    print(f"📊 Datos: " + ', '.join(f'{tabla}={filas:,}' for tabla, filas in huella.items()))
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'backend': _configuracion_bd()['backend'],
+        'repeticiones': args.repeticiones,
+        'huella': huella,
+        'objetivos': objetivos,
+        'consultas': {}
+    }
+    print(f"\n{'consulta':<22}{'min ms':>10}{'mediana ms':>12}{'p95 ms':>10}{'filas':>10}")
+    for nombre, funcion, argumentos in casos:
+        resultado = medir(funcion, argumentos, args.repeticiones, args.calentamiento)
+        informe['consultas'][nombre] = resultado
+        print(f"{nombre:<22}{resultado['min_ms']:>10.2f}{resultado['mediana_ms']:>12.2f}"
+              f"{resultado['p95_ms']:>10.2f}{resultado['filas']:>10}")
+
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    print(f"\n💾 Informe guardado en {args.salida}")
+
+    if args.base:
+        with open(args.base, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(informe, base, args.umbral, args.minimo_ms)
+        if regresiones:
+            print(f"\n❌ {len(regresiones)} consulta(s) empeoran más de un {args.umbral:.0%}:")
+            for nombre, anterior, actual, variacion in regresiones:
+                print(f"   {nombre}: {anterior:.2f} ms -> {actual:.2f} ms ({variacion:+.0%})")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones por encima del {args.umbral:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: cálculo de posiciones finales del ranking (calcular_ranking_final)
+Compara el método anterior (un UPDATE por participante) con el actual (un solo
+UPDATE ... JOIN sobre el ranking ordenado) para distintos tamaños de sala, sobre
+la base de datos configurada en .env.
+
+Todo se hace dentro de una transacción que se deshace al terminar: no deja
+salas ni participantes de prueba.
+
+Uso:
+    python benchmarks/finalizacion_ranking.py [--participantes 10,100,300,1000] [--repeticiones 5] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from bd import obtener_conexion
+from controladores.controlador_juego import calcular_ranking_final
+
+
+class CursorContador:
+    """Envuelve un cursor y cuenta las sentencias (viajes a la base de datos)"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.sentencias = 0
+
+    def execute(self, consulta, parametros=None):
+        self.sentencias += 1
+        return self._cursor.execute(consulta, parametros)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+def posiciones_fila_a_fila(sala_id, cursor):
+    """Método anterior: un UPDATE por participante"""
+    cursor.execute('''
+        SELECT id_ranking_sala
+        FROM ranking_sala
+        WHERE id_sala = %s
+        ORDER BY puntaje_total DESC, tiempo_total_respuestas ASC
+    ''', (sala_id,))
+    for posicion, (id_ranking,) in enumerate(cursor.fetchall(), start=1):
+        cursor.execute('''
+            UPDATE ranking_sala 
+            SET posicion = %s 
+            WHERE id_ranking_sala = %s
+        ''', (posicion, id_ranking))
+
+
+def crear_sala(cursor, participantes, semilla):
+    """Crea una sala con `participantes` filas de ranking con puntajes aleatorios"""
+    aleatorio = random.Random(semilla)
+    cursor.execute(
+        "INSERT INTO salas_juego (pin_sala, estado, total_preguntas) VALUES (%s, 'en_curso', 10)",
+        (f'B{aleatorio.randrange(10 ** 7):07d}',)
+    )
+    sala_id = cursor.lastrowid
+    for i in range(participantes):
+        cursor.execute(
+            "INSERT INTO participantes_sala (id_sala, nombre_participante, estado) VALUES (%s, %s, 'jugando')",
+            (sala_id, f'Participante {i}')
+        )
+        cursor.execute('''
+            INSERT INTO ranking_sala (id_participante, id_sala, puntaje_total, respuestas_correctas, tiempo_total_respuestas)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', (cursor.lastrowid, sala_id, aleatorio.randrange(0, 10001, 10),
+              aleatorio.randrange(11), round(aleatorio.uniform(5, 300), 3)))
+    return sala_id
+
+
+def posiciones(cursor, sala_id):
+    cursor.execute('SELECT id_ranking_sala, posicion FROM ranking_sala WHERE id_sala = %s', (sala_id,))
+    return dict(cursor.fetchall())
+
+
+def medir(metodo, sala_id, cursor, repeticiones):
+    tiempos = []
+    contador = CursorContador(cursor)
+    for _ in range(repeticiones):
+        contador.sentencias = 0
+        inicio = time.perf_counter()
+        metodo(sala_id, contador)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), contador.sentencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--participantes', default='10,100,300,1000')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='Imprime los resultados en JSON')
+    args = parser.parse_args()
+
+    resultados = []
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            for participantes in [int(n) for n in args.participantes.split(',')]:
+                sala_id = crear_sala(cursor, participantes, args.semilla + participantes)
+
+                anterior_ms, anterior_sentencias = medir(posiciones_fila_a_fila, sala_id, cursor, args.repeticiones)
+                esperadas = posiciones(cursor, sala_id)
+                actual_ms, actual_sentencias = medir(calcular_ranking_final, sala_id, cursor, args.repeticiones)
+                if posiciones(cursor, sala_id) != esperadas:
+                    raise SystemExit(f'❌ Las posiciones no coinciden con {participantes} participantes')
+
+                resultados.append({
+                    'participantes': participantes,
+                    'fila_a_fila_ms': round(anterior_ms, 2),
+                    'fila_a_fila_sentencias': anterior_sentencias,
+                    'conjunto_ms': round(actual_ms, 2),
+                    'conjunto_sentencias': actual_sentencias,
+                    'aceleracion': round(anterior_ms / actual_ms, 1) if actual_ms else None
+                })
+    finally:
+        conexion.rollback()
+        conexion.close()
+
+    if args.json:
+        print(json.dumps({'repeticiones': args.repeticiones, 'semilla': args.semilla, 'resultados': resultados}, indent=2))
+        return
+
+    print(f"{'participantes':>13} | {'fila a fila':>19} | {'una sentencia':>19} | aceleración")
+    for r in resultados:
+        print(f"{r['participantes']:>13} | {r['fila_a_fila_ms']:>9.2f} ms ({r['fila_a_fila_sentencias']:>4}) | "
+              f"{r['conjunto_ms']:>9.2f} ms ({r['conjunto_sentencias']:>4}) | x{r['aceleracion']}")
+
+
+if __name__ == '__main__':
+    main()
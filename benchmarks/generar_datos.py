@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de datos sintéticos para medir consultas de lectura a escala
+Llena el esquema (usuarios, cuestionarios, preguntas, salas finalizadas y en
+curso, participantes, respuestas, ranking, XP, estadísticas e insignias) sobre
+la base de datos configurada en .env, con una distribución parecida a la real:
+
+- Actividad de los estudiantes con cola larga (Pareto): unos pocos juegan
+  muchísimo y la mayoría, poco.
+- Popularidad de cuestionarios y docentes según Zipf.
+- Habilidad por estudiante y dificultad por pregunta; tiempos de respuesta
+  lognormales y puntaje con calcular_puntaje, como en el juego real.
+
+Con la misma semilla y escala genera siempre los mismos datos. Los usuarios
+llevan el dominio @sintetico.local y las salas un PIN 'S0000000', así que
+--limpiar los borra sin tocar el resto de la base.
+
+Uso:
+    python benchmarks/generar_datos.py [--escala pequena|mediana|grande] [--estudiantes N]
+        [--cuestionarios N] [--salas N] [--respuestas N] [--semilla 1]
+    python benchmarks/generar_datos.py --limpiar
+"""
+
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from bd import obtener_conexion
+from controladores.controlador_juego import calcular_puntaje
+from controladores.controlador_xp import XP_POR_RESPUESTA_CORRECTA, XP_POR_VICTORIA, calcular_nivel_por_xp
+
+DOMINIO = 'sintetico.local'
+PREFIJO_PIN = 'S'
+
+# estudiantes, cuestionarios, salas, respuestas
+ESCALAS = {
+    'pequena': (500, 50, 2_000, 200_000),
+    'mediana': (5_000, 500, 20_000, 2_000_000),
+    'grande': (50_000, 5_000, 200_000, 20_000_000),
+}
+
+# Insignias que se crean si el catálogo está vacío (requisito_tipo, valor, nombre, tipo, rareza)
+INSIGNIAS_BASE = [
+    ('partidas', 1, 'Primera partida', 'bronce', 'comun'),
+    ('partidas', 10, 'Jugador habitual', 'plata', 'comun'),
+    ('partidas', 50, 'Veterano', 'oro', 'raro'),
+    ('nivel', 5, 'Nivel 5', 'bronce', 'comun'),
+    ('nivel', 10, 'Nivel 10', 'plata', 'raro'),
+    ('nivel', 20, 'Nivel 20', 'oro', 'epico'),
+    ('precision', 80, 'Precisión 80%', 'platino', 'epico'),
+    ('velocidad', 3, 'Rayo', 'diamante', 'legendario'),
+]
+
+TAMANO_LOTE = 5_000
+OPCIONES_POR_PREGUNTA = 4
+PARTICIPANTES_MAXIMO = 60
+
+
+class Distribucion:
+    """Muestreo con pesos por búsqueda binaria sobre los pesos acumulados"""
+
+    def __init__(self, pesos):
+        self.acumulados = list(itertools.accumulate(pesos))
+
+    def elegir(self, rng):
+        return bisect.bisect_left(self.acumulados, rng.random() * self.acumulados[-1])
+
+    def elegir_distintos(self, rng, cantidad):
+        cantidad = min(cantidad, len(self.acumulados))
+        elegidos = set()
+        while len(elegidos) < cantidad:
+            elegidos.add(self.elegir(rng))
+        return list(elegidos)
+
+
+def zipf(n, s=1.1):
+    return [1 / (rango ** s) for rango in range(1, n + 1)]
+
+
+class Insertador:
+    """Acumula filas por tabla y las inserta con executemany en lotes"""
+
+    def __init__(self, conexion, cursor):
+        self.conexion = conexion
+        self.cursor = cursor
+        self.pendientes = {}
+        self.filas = {}
+
+    def agregar(self, tabla, columnas, fila):
+        lote = self.pendientes.setdefault((tabla, columnas), [])
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            self._vaciar_todas()
+
+    def _vaciar(self, tabla, columnas):
+        lote = self.pendientes.get((tabla, columnas))
+        if not lote:
+            return
+        marcadores = ', '.join(['%s'] * len(columnas))
+        self.cursor.executemany(
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({marcadores})", lote
+        )
+        self.filas[tabla] = self.filas.get(tabla, 0) + len(lote)
+        lote.clear()
+
+    def _vaciar_todas(self):
+        # En el orden en que aparecieron las tablas, para respetar las claves foráneas
+        for tabla, columnas in list(self.pendientes):
+            self._vaciar(tabla, columnas)
+
+    def vaciar(self):
+        self._vaciar_todas()
+        self.conexion.commit()
+
+
+def siguiente_id(cursor, tabla, columna):
+    cursor.execute(f'SELECT COALESCE(MAX({columna}), 0) FROM {tabla}')
+    return cursor.fetchone()[0] + 1
+
+
+def generar(args):
+    rng = random.Random(args.semilla)
+    inicio = time.perf_counter()
+    conexion = obtener_conexion()
+    cursor = conexion.cursor()
+    insertador = Insertador(conexion, cursor)
+
+    num_docentes = max(1, args.estudiantes // 50)
+    id_usuario = siguiente_id(cursor, 'usuarios', 'id_usuario')
+    id_cuestionario = siguiente_id(cursor, 'cuestionarios', 'id_cuestionario')
+    id_pregunta = siguiente_id(cursor, 'preguntas', 'id_pregunta')
+    id_opcion = siguiente_id(cursor, 'opciones_respuesta', 'id_opcion')
+    id_sala = siguiente_id(cursor, 'salas_juego', 'id_sala')
+    id_participante = siguiente_id(cursor, 'participantes_sala', 'id_participante')
+
+    # ---------- Usuarios ----------
+    print(f"👥 Creando {num_docentes} docentes y {args.estudiantes} estudiantes...")
+    columnas_usuario = ('id_usuario', 'nombre', 'apellidos', 'email', 'contraseña_hash', 'tipo_usuario', 'fecha_registro')
+    hace_un_anio = datetime.now().replace(microsecond=0) - timedelta(days=365)
+    docentes = []
+    for i in range(num_docentes):
+        docentes.append(id_usuario)
+        insertador.agregar('usuarios', columnas_usuario, (
+            id_usuario, f'Docente{i}', 'Sintético', f'docente{args.semilla}.{i}@{DOMINIO}', '-', 'docente', hace_un_anio
+        ))
+        id_usuario += 1
+    estudiantes = []
+    for i in range(args.estudiantes):
+        estudiantes.append(id_usuario)
+        insertador.agregar('usuarios', columnas_usuario, (
+            id_usuario, f'Estudiante{i}', 'Sintético', f'estudiante{args.semilla}.{i}@{DOMINIO}', '-', 'estudiante',
+            hace_un_anio + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        ))
+        id_usuario += 1
+    insertador.vaciar()
+
+    # Actividad (Pareto) y habilidad de cada estudiante
+    actividad = Distribucion([rng.paretovariate(1.2) for _ in estudiantes])
+    habilidad = [rng.betavariate(4, 2) for _ in estudiantes]
+
+    # ---------- Cuestionarios y preguntas ----------
+    print(f"📝 Creando {args.cuestionarios} cuestionarios...")
+    docente_de = Distribucion(zipf(num_docentes))
+    cuestionarios = []  # (id, [(id_pregunta, id_opcion_correcta, [ids opciones], facilidad)])
+    for i in range(args.cuestionarios):
+        insertador.agregar('cuestionarios', ('id_cuestionario', 'titulo', 'id_docente', 'estado', 'fecha_creacion'), (
+            id_cuestionario, f'Cuestionario sintético {i}', docentes[docente_de.elegir(rng)], 'publicado', hace_un_anio
+        ))
+        preguntas = []
+        for orden in range(1, rng.randint(5, 15) + 1):
+            insertador.agregar('preguntas', ('id_pregunta', 'enunciado', 'tipo', 'puntaje_base', 'tiempo_sugerido'), (
+                id_pregunta, f'Pregunta {orden} del cuestionario {i}', 'opcion_multiple', 1, 30
+            ))
+            insertador.agregar('cuestionario_preguntas', ('id_cuestionario', 'id_pregunta', 'orden'), (
+                id_cuestionario, id_pregunta, orden
+            ))
+            opciones = list(range(id_opcion, id_opcion + OPCIONES_POR_PREGUNTA))
+            correcta = rng.choice(opciones)
+            for id_op in opciones:
+                insertador.agregar('opciones_respuesta', ('id_opcion', 'id_pregunta', 'texto_opcion', 'es_correcta'), (
+                    id_op, id_pregunta, f'Opción {id_op - id_opcion + 1}', 1 if id_op == correcta else 0
+                ))
+            preguntas.append((id_pregunta, correcta, opciones, rng.uniform(0.6, 1.1)))
+            id_opcion += OPCIONES_POR_PREGUNTA
+            id_pregunta += 1
+        cuestionarios.append((id_cuestionario, preguntas))
+        id_cuestionario += 1
+    insertador.vaciar()
+
+    # ---------- Salas, participantes, respuestas y ranking ----------
+    pesos = zipf(len(cuestionarios))
+    popularidad = Distribucion(pesos)
+    preguntas_medio = sum(w * len(p) for w, (_, p) in zip(pesos, cuestionarios)) / sum(pesos)
+    participantes_medio = max(1.0, args.respuestas / (args.salas * preguntas_medio * args.tasa_respuesta))
+    print(f"🎮 Creando {args.salas} salas (~{participantes_medio:.1f} participantes de media)...")
+    en_curso = max(1, args.salas // 100)  # las últimas salas quedan en curso
+    # Acumulados por estudiante: partidas, ganadas, correctas, incorrectas, tiempo total, puntaje máximo
+    acumulado = [[0, 0, 0, 0, 0.0, 0] for _ in estudiantes]
+    sigma = 0.6
+    mu = math.log(participantes_medio) - sigma ** 2 / 2
+
+    for n in range(args.salas):
+        id_cuest, preguntas = cuestionarios[popularidad.elegir(rng)]
+        finalizada = n < args.salas - en_curso
+        fecha = hace_un_anio + timedelta(seconds=int(n / args.salas * 365 * 86400))
+        total_preguntas = len(preguntas)
+        pregunta_actual = total_preguntas if finalizada else rng.randint(1, total_preguntas)
+        insertador.agregar('salas_juego', (
+            'id_sala', 'pin_sala', 'id_cuestionario', 'estado', 'tiempo_por_pregunta', 'max_participantes',
+            'pregunta_actual', 'total_preguntas', 'tiempo_inicio_juego', 'fecha_creacion'
+        ), (
+            id_sala, f'{PREFIJO_PIN}{id_sala:07d}', id_cuest, 'finalizada' if finalizada else 'en_curso', 30,
+            PARTICIPANTES_MAXIMO, pregunta_actual, total_preguntas, fecha, fecha
+        ))
+        insertador.agregar('estado_juego_sala', ('id_sala', 'pregunta_actual', 'tiempo_inicio_pregunta', 'estado_pregunta'), (
+            id_sala, pregunta_actual, fecha, 'finalizada' if finalizada else 'respondiendo'
+        ))
+
+        cantidad = min(PARTICIPANTES_MAXIMO, max(1, round(rng.lognormvariate(mu, sigma))))
+        resultados = []
+        for indice in actividad.elegir_distintos(rng, cantidad):
+            id_est = estudiantes[indice]
+            insertador.agregar('participantes_sala', ('id_participante', 'id_sala', 'id_usuario', 'nombre_participante', 'fecha_union', 'estado'), (
+                id_participante, id_sala, id_est, f'Estudiante{indice}', fecha, 'finalizado' if finalizada else 'jugando'
+            ))
+            puntaje = correctas = 0
+            tiempo_total = 0.0
+            for id_preg, correcta, opciones, facilidad in preguntas[:pregunta_actual]:
+                if rng.random() > args.tasa_respuesta:
+                    continue
+                tiempo = round(min(30.0, rng.lognormvariate(math.log(6), 0.6)), 3)
+                es_correcta = rng.random() < min(0.98, habilidad[indice] * facilidad)
+                elegida = correcta if es_correcta else rng.choice([o for o in opciones if o != correcta])
+                obtenido = calcular_puntaje(tiempo) if es_correcta else 0
+                insertador.agregar('respuestas_participantes', (
+                    'id_participante', 'id_sala', 'id_pregunta', 'id_opcion_seleccionada', 'tiempo_respuesta',
+                    'es_correcta', 'puntaje_obtenido', 'fecha_respuesta'
+                ), (id_participante, id_sala, id_preg, elegida, tiempo, int(es_correcta), obtenido, fecha))
+                puntaje += obtenido
+                correctas += es_correcta
+                tiempo_total += tiempo
+                datos = acumulado[indice]
+                datos[2 if es_correcta else 3] += 1
+                datos[4] += tiempo
+            resultados.append((puntaje, tiempo_total, correctas, id_participante, indice))
+            id_participante += 1
+
+        resultados.sort(key=lambda r: (-r[0], r[1]))
+        for posicion, (puntaje, tiempo_total, correctas, id_part, indice) in enumerate(resultados, start=1):
+            insertador.agregar('ranking_sala', (
+                'id_participante', 'id_sala', 'puntaje_total', 'respuestas_correctas', 'tiempo_total_respuestas', 'posicion'
+            ), (id_part, id_sala, puntaje, correctas, round(tiempo_total, 3), posicion if finalizada else None))
+            if finalizada:
+                datos = acumulado[indice]
+                datos[0] += 1
+                datos[1] += posicion == 1
+                datos[5] = max(datos[5], puntaje)
+        id_sala += 1
+
+        if (n + 1) % 1000 == 0:
+            insertador.vaciar()
+            if (n + 1) % 10_000 == 0:
+                print(f"   ⏳ {n + 1}/{args.salas} salas ({insertador.filas.get('respuestas_participantes', 0)} respuestas)")
+    insertador.vaciar()
+
+    # ---------- XP, estadísticas e insignias ----------
+    print("⭐ Actualizando XP, estadísticas e insignias...")
+    cursor.execute('SELECT id_insignia, requisito_tipo, requisito_valor FROM insignias_catalogo WHERE activo = TRUE')
+    catalogo = list(cursor.fetchall())
+    if not catalogo:
+        for orden, (requisito, valor, nombre, tipo, rareza) in enumerate(INSIGNIAS_BASE, start=1):
+            cursor.execute('''
+                INSERT INTO insignias_catalogo (nombre, descripcion, tipo, requisito_tipo, requisito_valor, rareza, orden_visualizacion)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', (nombre, 'Insignia de datos sintéticos', tipo, requisito, valor, rareza, orden))
+            catalogo.append((cursor.lastrowid, requisito, valor))
+
+    experiencia = []
+    estadisticas = []
+    for indice, (partidas, ganadas, correctas, incorrectas, tiempo, maximo) in enumerate(acumulado):
+        id_est = estudiantes[indice]
+        xp_total = correctas * XP_POR_RESPUESTA_CORRECTA + ganadas * XP_POR_VICTORIA
+        nivel, xp_actual = calcular_nivel_por_xp(xp_total)
+        respondidas = correctas + incorrectas
+        precision = round(correctas / respondidas * 100, 2) if respondidas else 0
+        tiempo_medio = round(tiempo / respondidas, 2) if respondidas else 0
+        experiencia.append((xp_actual, nivel, xp_total, id_est))
+        estadisticas.append((partidas, ganadas, correctas, incorrectas, min(correctas, rng.randint(0, 12)),
+                             precision, tiempo_medio, maximo, id_est))
+        valores = {'partidas': partidas, 'nivel': nivel, 'precision': precision}
+        for id_insignia, requisito, valor in catalogo:
+            if not partidas:
+                cumple = False
+            elif requisito == 'velocidad':
+                cumple = tiempo_medio <= valor
+            elif requisito in valores:
+                cumple = valores[requisito] >= valor
+            else:
+                cumple = rng.random() < 0.02
+            if cumple:
+                insertador.agregar('insignias_usuarios', ('id_usuario', 'id_insignia', 'mostrar_perfil'), (
+                    id_est, id_insignia, int(rng.random() < 0.3)
+                ))
+    for inicio_lote in range(0, len(experiencia), TAMANO_LOTE):
+        cursor.executemany('''
+            UPDATE experiencia_usuarios
+            SET xp_actual = %s, nivel_actual = %s, xp_total_acumulado = %s
+            WHERE id_usuario = %s
+        ''', experiencia[inicio_lote:inicio_lote + TAMANO_LOTE])
+        cursor.executemany('''
+            UPDATE estadisticas_juego
+            SET total_partidas_jugadas = %s, total_partidas_ganadas = %s,
+                total_respuestas_correctas = %s, total_respuestas_incorrectas = %s,
+                racha_maxima = %s, precision_promedio = %s, tiempo_promedio_respuesta = %s,
+                puntaje_maximo_obtenido = %s
+            WHERE id_usuario = %s
+        ''', estadisticas[inicio_lote:inicio_lote + TAMANO_LOTE])
+    insertador.vaciar()
+    cursor.close()
+    conexion.close()
+
+    print(f"\n✅ Datos generados en {time.perf_counter() - inicio:.1f} s")
+    for tabla, filas in insertador.filas.items():
+        print(f"   {tabla:<26} {filas:>12,}")
+
+
+def limpiar():
+    """Borra todo lo generado (usuarios @sintetico.local, sus cuestionarios y salas)"""
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(
+                "SELECT id_usuario FROM usuarios WHERE email LIKE %s AND tipo_usuario = 'docente'", (f'%@{DOMINIO}',)
+            )
+            docentes = [fila[0] for fila in cursor.fetchall()]
+            for docente in docentes:
+                cursor.execute('''
+                    DELETE FROM preguntas WHERE id_pregunta IN (
+                        SELECT cp.id_pregunta FROM cuestionario_preguntas cp
+                        JOIN cuestionarios c ON cp.id_cuestionario = c.id_cuestionario
+                        WHERE c.id_docente = %s
+                    )
+                ''', (docente,))
+                cursor.execute('''
+                    DELETE FROM salas_juego WHERE id_cuestionario IN (
+                        SELECT id_cuestionario FROM cuestionarios WHERE id_docente = %s
+                    )
+                ''', (docente,))
+                cursor.execute('DELETE FROM cuestionarios WHERE id_docente = %s', (docente,))
+                conexion.commit()
+            cursor.execute('DELETE FROM salas_juego WHERE pin_sala LIKE %s', (f'{PREFIJO_PIN}%',))
+            cursor.execute('DELETE FROM usuarios WHERE email LIKE %s', (f'%@{DOMINIO}',))
+            usuarios = cursor.rowcount
+            conexion.commit()
+            print(f"🧹 Eliminados {usuarios} usuarios sintéticos con sus cuestionarios y salas")
+    finally:
+        conexion.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generador de datos sintéticos')
+    parser.add_argument('--escala', choices=sorted(ESCALAS), default='pequena',
+                        help='Valores por defecto de estudiantes/cuestionarios/salas/respuestas')
+    parser.add_argument('--estudiantes', type=int)
+    parser.add_argument('--cuestionarios', type=int)
+    parser.add_argument('--salas', type=int)
+    parser.add_argument('--respuestas', type=int, help='Total aproximado de filas en respuestas_participantes')
+    parser.add_argument('--tasa-respuesta', type=float, default=0.95,
+                        help='Probabilidad de que un participante responda cada pregunta')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--limpiar', action='store_true', help='Borrar los datos sintéticos y salir')
+    args = parser.parse_args()
+
+    if args.limpiar:
+        limpiar()
+        return
+
+    estudiantes, cuestionarios, salas, respuestas = ESCALAS[args.escala]
+    args.estudiantes = args.estudiantes or estudiantes
+    args.cuestionarios = args.cuestionarios or cuestionarios
+    args.salas = args.salas or salas
+    args.respuestas = args.respuestas or respuestas
+    generar(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,12 @@ Controlador para el sistema de juego en tiempo real
 Maneja el inicio del juego, respuestas de participantes y cálculo de puntuación
 """
 
-from bd import obtener_conexion
+from bd import obtener_conexion, despues_de_confirmar
 from datetime import datetime
 import time
+import uuid
+
+from tiempo_real import asignador_pines, bus, clasificacion, estado_salas, eventos, ingesta, liquidacion_xp, mazos, temporizador
 
 # ==================== CONSTANTES DE PUNTUACIÓN ====================
 PUNTAJE_MAXIMO = 1000
@@ -37,6 +40,72 @@ def calcular_puntaje(tiempo_respuesta_segundos):
 
 # ==================== GESTIÓN DEL ESTADO DEL JUEGO ====================
 
+def obtener_mazo_sala(sala_id, id_cuestionario, cursor):
+    """
+    Devuelve el mazo de preguntas de la sala (ver tiempo_real.mazos).
+    Si la sala no tiene mazo registrado se construye desde MySQL.
+    
+    Args:
+        sala_id: ID de la sala
+        id_cuestionario: ID del cuestionario de la sala
+        cursor: Cursor abierto
+        
+    Returns:
+        Mazo con las preguntas ordenadas del cuestionario
+    """
+    return mazos.obtener_o_construir(cursor, sala_id, id_cuestionario)
+
+def _registrar_estado_en_memoria(cursor, sala_id, mazo, num_pregunta, total_preguntas):
+    """
+    Lee el estado recién escrito en estado_juego_sala y prepara el registro en
+    memoria junto con la pregunta tomada del mazo
+    """
+    cursor.execute('''
+        SELECT e.tiempo_inicio_pregunta, e.estado_pregunta, s.tiempo_por_pregunta, s.avance_automatico,
+               (SELECT COUNT(*) FROM participantes_sala p
+                WHERE p.id_sala = e.id_sala AND p.estado = 'jugando') AS total_participantes
+        FROM estado_juego_sala e
+        JOIN salas_juego s ON e.id_sala = s.id_sala
+        WHERE e.id_sala = %s
+    ''', (sala_id,))
+    estado = cursor.fetchone()
+    if not estado:
+        return None
+    
+    tiempo_inicio, estado_pregunta, tiempo_por_pregunta, avance_automatico, total_participantes = estado
+    return estado_salas.EstadoSala(
+        sala_id,
+        estado='en_curso',
+        id_cuestionario=mazo.id_cuestionario,
+        numero_pregunta=num_pregunta,
+        total_preguntas=total_preguntas,
+        tiempo_inicio=tiempo_inicio,
+        estado_pregunta=estado_pregunta,
+        tiempo_limite=tiempo_por_pregunta or 30,
+        pregunta=mazo.como_diccionario(num_pregunta),
+        total_participantes=total_participantes,
+        avance_automatico=avance_automatico
+    )
+
+def _programar_vencimiento(estado_memoria, retomar=False):
+    """
+    Programa en tiempo_real.temporizador el vencimiento de la pregunta en curso
+    si la sala tiene activado el avance automático
+    
+    Args:
+        estado_memoria: EstadoSala recién registrado
+        retomar: True si la pregunta ya estaba en curso (se descuenta el tiempo transcurrido)
+    """
+    if not estado_memoria or not estado_memoria.avance_automatico or estado_memoria.estado != 'en_curso':
+        return
+    restante = estado_memoria.tiempo_limite
+    if retomar and isinstance(estado_memoria.tiempo_inicio, datetime):
+        transcurrido = (datetime.now() - estado_memoria.tiempo_inicio).total_seconds()
+        restante = min(restante, max(0, restante - transcurrido))
+    temporizador.programar(estado_memoria.sala_id, estado_memoria.numero_pregunta, restante + temporizador.PAUSA)
+    if estado_memoria.total_participantes and len(estado_memoria.respondieron) >= estado_memoria.total_participantes:
+        temporizador.adelantar(estado_memoria.sala_id, estado_memoria.numero_pregunta)
+
 def iniciar_juego_sala(sala_id):
     """
     Inicia el juego en una sala
@@ -61,12 +130,10 @@ def iniciar_juego_sala(sala_id):
             
             id_cuestionario = result[0]
             
-            # Contar preguntas del cuestionario
-            cursor.execute('''
-                SELECT COUNT(*) FROM cuestionario_preguntas WHERE id_cuestionario = %s
-            ''', (id_cuestionario,))
-            
-            total_preguntas = cursor.fetchone()[0]
+            # Cargar el mazo de preguntas una sola vez; queda fijo durante toda
+            # la partida aunque el cuestionario se edite mientras tanto
+            mazo = mazos.construir(cursor, id_cuestionario)
+            total_preguntas = len(mazo)
             
             # Actualizar estado de la sala
             cursor.execute('''
@@ -78,20 +145,23 @@ def iniciar_juego_sala(sala_id):
                 WHERE id_sala = %s
             ''', (total_preguntas, sala_id))
             
-            # Crear estado inicial del juego
+            # Crear estado inicial del juego; el mazo se guarda con él para que
+            # un reinicio o un worker sin el mensaje del bus usen esta misma copia
             cursor.execute('''
-                INSERT INTO estado_juego_sala (id_sala, pregunta_actual, estado_pregunta)
-                VALUES (%s, 1, 'mostrando')
+                INSERT INTO estado_juego_sala (id_sala, pregunta_actual, estado_pregunta, mazo)
+                VALUES (%s, 1, 'mostrando', %s)
                 ON DUPLICATE KEY UPDATE 
                     pregunta_actual = 1,
                     tiempo_inicio_pregunta = NOW(),
-                    estado_pregunta = 'mostrando'
-            ''', (sala_id,))
+                    estado_pregunta = 'mostrando',
+                    mazo = VALUES(mazo)
+            ''', (sala_id, mazos.a_json(mazo)))
             
-            # Actualizar estado de participantes
+            # Actualizar estado de participantes (los que caducaron sin latidos en
+            # la sala de espera, ausente = 1, conservan su plaza y también juegan)
             cursor.execute('''
                 UPDATE participantes_sala 
-                SET estado = 'jugando' 
+                SET estado = 'jugando', ausente = 0 
                 WHERE id_sala = %s AND estado = 'esperando'
             ''', (sala_id,))
             
@@ -104,12 +174,18 @@ def iniciar_juego_sala(sala_id):
                 ON DUPLICATE KEY UPDATE puntaje_total = 0, respuestas_correctas = 0, tiempo_total_respuestas = 0
             ''', (sala_id,))
             
+            estado_memoria = _registrar_estado_en_memoria(cursor, sala_id, mazo, 1, total_preguntas)
+            
             conexion.commit()
             
-            # Verificar que el estado se actualizó correctamente
-            cursor.execute('SELECT estado FROM salas_juego WHERE id_sala = %s', (sala_id,))
-            estado_verificado = cursor.fetchone()
-            print(f"✅ [CONTROLADOR_JUEGO] Estado verificado después de commit: '{estado_verificado[0] if estado_verificado else 'NULL'}'")
+            mazos.publicar(sala_id, mazo)
+            if estado_memoria:
+                estado_salas.registrar(estado_memoria)
+                _programar_vencimiento(estado_memoria)
+            bus.publicar(sala_id, 'game_started', {
+                'numero_pregunta': 1,
+                'total_preguntas': total_preguntas
+            })
             
             return True
     finally:
@@ -117,11 +193,17 @@ def iniciar_juego_sala(sala_id):
 
 def obtener_pregunta_actual_sala(sala_id):
     """
-    Obtiene la pregunta actual que se está mostrando en la sala
+    Obtiene la pregunta actual que se está mostrando en la sala.
+    Se sirve desde el registro en memoria; solo consulta MySQL si la sala
+    no está registrada (por ejemplo, tras reiniciar el servidor).
     
     Returns:
-        Diccionario con datos de la pregunta, opciones y tiempo de inicio
+        Diccionario con datos de la pregunta, opciones, tiempo de inicio y tiempo límite
     """
+    estado_memoria = estado_salas.obtener(sala_id)
+    if estado_memoria is not None:
+        return estado_memoria.pregunta_actual()
+    
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
@@ -130,6 +212,8 @@ def obtener_pregunta_actual_sala(sala_id):
             sala_estado = cursor.fetchone()
             
             if not sala_estado or sala_estado[0] == 'finalizada':
+                if sala_estado:
+                    estado_salas.finalizar(sala_id)
                 return None  # Juego finalizado, no hay pregunta activa
             
             # Obtener estado del juego
@@ -139,7 +223,11 @@ def obtener_pregunta_actual_sala(sala_id):
                     e.tiempo_inicio_pregunta,
                     e.estado_pregunta,
                     s.id_cuestionario,
-                    s.total_preguntas
+                    s.total_preguntas,
+                    s.tiempo_por_pregunta,
+                    s.avance_automatico,
+                    (SELECT COUNT(*) FROM participantes_sala p
+                     WHERE p.id_sala = e.id_sala AND p.estado = 'jugando') AS total_participantes
                 FROM estado_juego_sala e
                 JOIN salas_juego s ON e.id_sala = s.id_sala
                 WHERE e.id_sala = %s
@@ -149,63 +237,181 @@ def obtener_pregunta_actual_sala(sala_id):
             if not estado:
                 return None
             
-            num_pregunta, tiempo_inicio, estado_pregunta, id_cuestionario, total_preguntas = estado
+            (num_pregunta, tiempo_inicio, estado_pregunta, id_cuestionario,
+             total_preguntas, tiempo_por_pregunta, avance_automatico, total_participantes) = estado
             
             # Validar que num_pregunta sea >= 1
             if num_pregunta < 1:
                 return None
             
-            # Obtener la pregunta específica
-            cursor.execute('''
-                SELECT 
-                    p.id_pregunta,
-                    p.enunciado,
-                    p.tipo,
-                    cp.orden
-                FROM cuestionario_preguntas cp
-                JOIN preguntas p ON cp.id_pregunta = p.id_pregunta
-                WHERE cp.id_cuestionario = %s
-                ORDER BY cp.orden
-                LIMIT %s, 1
-            ''', (id_cuestionario, num_pregunta - 1))
-            
-            pregunta_data = cursor.fetchone()
-            if not pregunta_data:
+            mazo = obtener_mazo_sala(sala_id, id_cuestionario, cursor)
+            pregunta = mazo.como_diccionario(num_pregunta)
+            if not pregunta:
                 return None
             
-            id_pregunta, enunciado, tipo, orden = pregunta_data
+            # Quiénes ya respondieron la pregunta en curso
+            cursor.execute('''
+                SELECT id_participante FROM respuestas_participantes
+                WHERE id_sala = %s AND id_pregunta = %s
+            ''', (sala_id, pregunta['id_pregunta']))
+            respondieron = [fila[0] for fila in cursor.fetchall()]
             
-            # Obtener opciones de respuesta
+            # Respuestas por pregunta de lo que va de juego (contadores en memoria)
             cursor.execute('''
-                SELECT id_opcion, texto_opcion
-                FROM opciones_respuesta
-                WHERE id_pregunta = %s
-                ORDER BY id_opcion
-            ''', (id_pregunta,))
-            
-            opciones = []
-            for opcion in cursor.fetchall():
-                opciones.append({
-                    'id_opcion': opcion[0],
-                    'texto': opcion[1]
-                })
+                SELECT id_pregunta, COUNT(DISTINCT id_participante)
+                FROM respuestas_participantes
+                WHERE id_sala = %s
+                GROUP BY id_pregunta
+            ''', (sala_id,))
+            por_pregunta = dict(cursor.fetchall())
+            estado_salas.completar_respondidas(sala_id, {
+                numero: por_pregunta[p.id_pregunta]
+                for numero, p in enumerate(mazo.preguntas, start=1) if p.id_pregunta in por_pregunta
+            })
             
-            return {
-                'id_pregunta': id_pregunta,
-                'enunciado': enunciado,
-                'tipo': tipo,
-                'numero_pregunta': num_pregunta,
-                'total_preguntas': total_preguntas,
-                'opciones': opciones,
-                'tiempo_inicio': tiempo_inicio,
-                'estado': estado_pregunta
-            }
+            # Registrar en memoria para los siguientes sondeos
+            estado_memoria = estado_salas.EstadoSala(
+                sala_id,
+                estado=sala_estado[0],
+                id_cuestionario=id_cuestionario,
+                numero_pregunta=num_pregunta,
+                total_preguntas=total_preguntas,
+                tiempo_inicio=tiempo_inicio,
+                estado_pregunta=estado_pregunta,
+                tiempo_limite=tiempo_por_pregunta or 30,
+                pregunta=pregunta,
+                total_participantes=total_participantes,
+                respondieron=respondieron,
+                avance_automatico=avance_automatico
+            )
+            estado_salas.registrar(estado_memoria)
+            # Tras un reinicio, retomar el temporizador de la pregunta en curso
+            _programar_vencimiento(estado_memoria, retomar=True)
+            
+            return estado_memoria.pregunta_actual()
+    finally:
+        conexion.close()
+
+def obtener_instantanea_sala(sala_id):
+    """
+    Estado de la sala y pregunta actual, para las esperas largas de los clientes.
+    Se sirve desde el registro en memoria; solo consulta MySQL si la sala no
+    está registrada o todavía no ha empezado.
+    
+    Returns:
+        Diccionario con 'estado' de la sala y 'pregunta' (o None)
+    """
+    pregunta = obtener_pregunta_actual_sala(sala_id)
+    estado_memoria = estado_salas.obtener(sala_id)
+    if estado_memoria is not None:
+        return {'estado': estado_memoria.estado, 'pregunta': pregunta}
+    
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT estado FROM salas_juego WHERE id_sala = %s', (sala_id,))
+            sala = cursor.fetchone()
+            return {'estado': sala[0] if sala else None, 'pregunta': pregunta}
     finally:
         conexion.close()
 
+def _procesar_xp_respuesta(cursor, participante_id, sala_id, id_pregunta, es_correcta, tiempo_respuesta):
+    """
+    Actualiza estadísticas, XP e insignias del estudiante por una respuesta,
+    dentro de la transacción del cursor recibido
+    
+    Returns:
+        Información de XP ganado o None
+    """
+    # Obtener id_usuario del participante
+    cursor.execute('SELECT id_usuario FROM participantes_sala WHERE id_participante = %s', (participante_id,))
+    usuario_data = cursor.fetchone()
+    
+    resultado_xp = None
+    if usuario_data:
+        id_usuario = usuario_data[0]
+        
+        # Verificar que sea estudiante
+        cursor.execute('SELECT tipo_usuario FROM usuarios WHERE id_usuario = %s', (id_usuario,))
+        tipo_usuario = cursor.fetchone()
+        
+        if tipo_usuario and tipo_usuario[0] == 'estudiante':
+            # El XP comparte la transacción de la respuesta; un savepoint
+            # permite descartarlo sin perder la respuesta si algo falla
+            cursor.execute('SAVEPOINT sp_xp')
+            # Importar controlador de XP
+            try:
+                from controladores import controlador_xp
+                
+                # Actualizar estadísticas
+                racha_actual = controlador_xp.actualizar_estadisticas_respuesta(
+                    id_usuario, es_correcta, tiempo_respuesta, cursor
+                )
+                
+                # Otorgar XP si la respuesta es correcta
+                if es_correcta:
+                    xp_ganado = controlador_xp.calcular_xp_por_respuesta(
+                        tiempo_respuesta, es_correcta, racha_actual - 1
+                    )
+                    
+                    resultado_xp = controlador_xp.otorgar_xp(
+                        id_usuario, xp_ganado, 'respuesta_correcta', sala_id, id_pregunta, cursor
+                    )
+                    
+                    print(f"🎯 XP otorgado: {xp_ganado} XP a usuario {id_usuario}")
+                    if resultado_xp and resultado_xp['subio_nivel']:
+                        print(f"⬆️ ¡Subió de nivel {resultado_xp['nivel_anterior']} → {resultado_xp['nivel_nuevo']}!")
+                    if resultado_xp and resultado_xp['insignias_nuevas']:
+                        print(f"🏆 Insignias desbloqueadas: {len(resultado_xp['insignias_nuevas'])}")
+            except Exception as e_xp:
+                cursor.execute('ROLLBACK TO SAVEPOINT sp_xp')
+                resultado_xp = None
+                print(f"⚠️ Error al procesar XP (no crítico): {e_xp}")
+    
+    return resultado_xp
+
+class RespuestaInvalidaError(ValueError):
+    """La opción enviada no corresponde a la pregunta activa de la sala"""
+
+def evaluar_respuesta(sala_id, id_pregunta, id_opcion_seleccionada):
+    """
+    Corrige una respuesta con la clave del mazo de la sala, sin consultar MySQL
+    mientras la sala esté registrada en memoria.
+    
+    Args:
+        sala_id: ID de la sala
+        id_pregunta: ID de la pregunta respondida
+        id_opcion_seleccionada: ID de la opción seleccionada
+        
+    Returns:
+        1 si la opción es correcta, 0 si no
+        
+    Raises:
+        RespuestaInvalidaError: si no hay pregunta activa o la opción no pertenece a ella
+    """
+    estado_memoria = estado_salas.obtener(sala_id)
+    mazo = mazos.obtener(sala_id)
+    if estado_memoria is None or mazo is None:
+        # Carga en frío: registra el estado y el mazo de la sala
+        obtener_pregunta_actual_sala(sala_id)
+        estado_memoria = estado_salas.obtener(sala_id)
+        mazo = mazos.obtener(sala_id)
+    
+    if estado_memoria is None or mazo is None or estado_memoria.estado == 'finalizada':
+        raise RespuestaInvalidaError('La sala no tiene una pregunta activa')
+    
+    id_pregunta_actual = mazo.id_pregunta(estado_memoria.numero_pregunta)
+    clave = mazo.clave.get(id_opcion_seleccionada)
+    if id_pregunta != id_pregunta_actual or clave is None or clave[0] != id_pregunta_actual:
+        raise RespuestaInvalidaError('La opción no pertenece a la pregunta actual')
+    
+    return 1 if clave[1] else 0
+
 def registrar_respuesta_participante(participante_id, sala_id, id_pregunta, id_opcion_seleccionada, tiempo_respuesta):
     """
-    Registra la respuesta de un participante y calcula el puntaje
+    Registra la respuesta de un participante y calcula el puntaje.
+    Las estadísticas, el XP y las insignias se registran con el mismo cursor,
+    en una sola transacción.
     
     Args:
         participante_id: ID del participante
@@ -216,23 +422,32 @@ def registrar_respuesta_participante(participante_id, sala_id, id_pregunta, id_o
         
     Returns:
         Diccionario con información del resultado (puntaje, es_correcta, etc.)
+        
+    Raises:
+        RespuestaInvalidaError: si la opción no pertenece a la pregunta activa
     """
+    # Corregir con la clave en memoria antes de abrir la transacción
+    es_correcta = evaluar_respuesta(sala_id, id_pregunta, id_opcion_seleccionada)
+    
+    # Calcular puntaje solo si es correcta
+    puntaje = calcular_puntaje(tiempo_respuesta) if es_correcta else 0
+    
+    # Ingesta diferida: se confirma ya y el hilo de vaciado escribe por lotes
+    # (el XP se encola al persistir el lote, ver _tras_persistir_lote)
+    if ingesta.ACTIVA and ingesta.encolar(
+        participante_id, sala_id, id_pregunta, id_opcion_seleccionada, tiempo_respuesta, es_correcta, puntaje
+    ):
+        _anunciar_respuesta(sala_id, participante_id, id_pregunta, es_correcta, puntaje, tiempo_respuesta)
+        return {
+            'es_correcta': bool(es_correcta),
+            'puntaje_obtenido': puntaje,
+            'tiempo_respuesta': tiempo_respuesta,
+            'xp_info': None
+        }
+    
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
-            # Verificar si la respuesta es correcta
-            cursor.execute('''
-                SELECT es_correcta 
-                FROM opciones_respuesta 
-                WHERE id_opcion = %s
-            ''', (id_opcion_seleccionada,))
-            
-            result = cursor.fetchone()
-            es_correcta = result[0] if result else 0
-            
-            # Calcular puntaje solo si es correcta
-            puntaje = calcular_puntaje(tiempo_respuesta) if es_correcta else 0
-            
             # Registrar respuesta
             cursor.execute('''
                 INSERT INTO respuestas_participantes 
@@ -246,7 +461,6 @@ def registrar_respuesta_participante(participante_id, sala_id, id_pregunta, id_o
             ''', (participante_id, sala_id, id_pregunta, id_opcion_seleccionada, tiempo_respuesta, es_correcta, puntaje))
             
             # Actualizar o crear ranking del participante
-            print(f"🔄 Actualizando ranking: participante={participante_id}, sala={sala_id}, puntaje={puntaje}, es_correcta={es_correcta}")
             cursor.execute('''
                 INSERT INTO ranking_sala (id_participante, id_sala, puntaje_total, respuestas_correctas, tiempo_total_respuestas)
                 VALUES (%s, %s, %s, %s, %s)
@@ -256,77 +470,203 @@ def registrar_respuesta_participante(participante_id, sala_id, id_pregunta, id_o
                     tiempo_total_respuestas = tiempo_total_respuestas + VALUES(tiempo_total_respuestas)
             ''', (participante_id, sala_id, puntaje, 1 if es_correcta else 0, tiempo_respuesta))
             
-            # Verificar el ranking actualizado
-            cursor.execute('SELECT puntaje_total, respuestas_correctas FROM ranking_sala WHERE id_participante=%s AND id_sala=%s', 
-                          (participante_id, sala_id))
-            ranking_actual = cursor.fetchone()
-            print(f"✅ Ranking actualizado: puntaje_total={ranking_actual[0]}, respuestas_correctas={ranking_actual[1]}")
+            conexion.commit()
             
             # ==================== SISTEMA DE XP E INSIGNIAS ====================
-            # Obtener id_usuario del participante
-            cursor.execute('SELECT id_usuario FROM participantes_sala WHERE id_participante = %s', (participante_id,))
-            usuario_data = cursor.fetchone()
-            
-            resultado_xp = None
-            if usuario_data:
-                id_usuario = usuario_data[0]
-                
-                # Verificar que sea estudiante
-                cursor.execute('SELECT tipo_usuario FROM usuarios WHERE id_usuario = %s', (id_usuario,))
-                tipo_usuario = cursor.fetchone()
-                
-                if tipo_usuario and tipo_usuario[0] == 'estudiante':
-                    # Importar controlador de XP
-                    try:
-                        from controladores import controlador_xp
-                        
-                        # Actualizar estadísticas
-                        racha_actual = controlador_xp.actualizar_estadisticas_respuesta(
-                            id_usuario, es_correcta, tiempo_respuesta
-                        )
-                        
-                        # Otorgar XP si la respuesta es correcta
-                        if es_correcta:
-                            xp_ganado = controlador_xp.calcular_xp_por_respuesta(
-                                tiempo_respuesta, es_correcta, racha_actual - 1
-                            )
-                            
-                            resultado_xp = controlador_xp.otorgar_xp(
-                                id_usuario, xp_ganado, 'respuesta_correcta', sala_id, id_pregunta
-                            )
-                            
-                            print(f"🎯 XP otorgado: {xp_ganado} XP a usuario {id_usuario}")
-                            if resultado_xp and resultado_xp['subio_nivel']:
-                                print(f"⬆️ ¡Subió de nivel {resultado_xp['nivel_anterior']} → {resultado_xp['nivel_nuevo']}!")
-                            if resultado_xp and resultado_xp['insignias_nuevas']:
-                                print(f"🏆 Insignias desbloqueadas: {len(resultado_xp['insignias_nuevas'])}")
-                    except Exception as e_xp:
-                        print(f"⚠️ Error al procesar XP (no crítico): {e_xp}")
-            
-            conexion.commit()
+            # Se liquida en segundo plano una vez confirmada la respuesta; el
+            # resultado llega al cliente por /api/sala/<id>/xp
+            despues_de_confirmar(lambda: liquidacion_xp.enviar(
+                participante_id, sala_id, id_pregunta, es_correcta, tiempo_respuesta
+            ))
+            despues_de_confirmar(lambda: _anunciar_respuesta(
+                sala_id, participante_id, id_pregunta, es_correcta, puntaje, tiempo_respuesta
+            ))
             
             return {
                 'es_correcta': bool(es_correcta),
                 'puntaje_obtenido': puntaje,
                 'tiempo_respuesta': tiempo_respuesta,
-                'xp_info': resultado_xp  # Información de XP ganado
+                'xp_info': None  # Se entrega por separado al liquidarse
             }
     finally:
         conexion.close()
 
-def avanzar_siguiente_pregunta(sala_id):
+def _anunciar_respuesta(sala_id, participante_id, id_pregunta, es_correcta, puntaje, tiempo_respuesta):
+    """Publica la respuesta puntuada (conteo de respuestas y clasificación en vivo)"""
+    bus.publicar(sala_id, 'answer_recorded', {
+        'id_participante': participante_id,
+        'id_pregunta': id_pregunta,
+        'es_correcta': int(es_correcta),
+        'puntaje': puntaje,
+        'tiempo_respuesta': float(tiempo_respuesta)
+    })
+    bus.publicar(sala_id, 'ranking_updated')
+
+@bus.al_recibir
+def _contar_respuesta(mensaje, remoto):
+    """
+    Cada worker anota en su registro las respuestas de todos (propias y de otros
+    procesos) y avisa el nuevo conteo a sus clientes conectados
+    """
+    if mensaje.tipo != 'answer_recorded':
+        return
+    conteo = estado_salas.marcar_respuesta(mensaje.sala_id, mensaje.datos.get('id_participante'))
+    if conteo:
+        respondieron, total = conteo
+        eventos.publicar(mensaje.sala_id, 'answer_count', {
+            'respondieron': respondieron,
+            'total': total,
+            'pendientes': max(0, total - respondieron)
+        })
+        # Si ya respondieron todos, la sala con avance automático no espera al tiempo límite
+        numero_programado = temporizador.programada(mensaje.sala_id)
+        if total and respondieron >= total and numero_programado is not None:
+            temporizador.adelantar(mensaje.sala_id, numero_programado)
+
+@temporizador.al_vencer
+def _avanzar_al_vencer(sala_id, numero_pregunta):
+    """
+    Avance automático: al vencer la pregunta (o responder todos) pasa a la
+    siguiente o, si era la última, finaliza el juego
+    """
+    estado_memoria = estado_salas.obtener(sala_id)
+    if estado_memoria is None:
+        obtener_pregunta_actual_sala(sala_id)
+        estado_memoria = estado_salas.obtener(sala_id)
+    if (estado_memoria is None or estado_memoria.estado != 'en_curso'
+            or not estado_memoria.avance_automatico
+            or estado_memoria.numero_pregunta != numero_pregunta):
+        return
+    
+    if numero_pregunta < estado_memoria.total_preguntas:
+        print(f"⏱️ [TEMPORIZADOR] Sala {sala_id}: avance automático desde la pregunta {numero_pregunta}")
+        avanzar_siguiente_pregunta(sala_id, desde_pregunta=numero_pregunta)
+    else:
+        print(f"⏱️ [TEMPORIZADOR] Sala {sala_id}: última pregunta vencida, finalizando")
+        finalizar_juego_sala(sala_id, desde_pregunta=numero_pregunta)
+
+@ingesta.al_persistir
+def _tras_persistir_lote(lote):
+    """Encola el XP de un lote ya escrito por la ingesta diferida"""
+    for respuesta in lote:
+        liquidacion_xp.enviar(
+            respuesta.participante_id, respuesta.sala_id, respuesta.id_pregunta,
+            respuesta.es_correcta, respuesta.tiempo_respuesta
+        )
+
+@ingesta.al_persistir
+def _rehacer_resultado_final(lote):
+    """
+    Rehace posiciones y recompensas de las salas ya finalizadas que reciben
+    respuestas tarde (un worker que no confirmó ingesta.vaciar_sala a tiempo,
+    o el diario recuperado de un proceso caído)
+    """
+    candidatas = set()
+    for respuesta in lote:
+        estado_memoria = estado_salas.obtener(respuesta.sala_id)
+        if estado_memoria is None or estado_memoria.estado == 'finalizada':
+            candidatas.add(respuesta.sala_id)
+    if not candidatas:
+        return
+    
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            marcadores = ', '.join(['%s'] * len(candidatas))
+            cursor.execute(f'''
+                SELECT id_sala FROM salas_juego
+                WHERE id_sala IN ({marcadores}) AND estado = 'finalizada'
+            ''', list(candidatas))
+            finalizadas = [fila[0] for fila in cursor.fetchall()]
+            for sala_id in finalizadas:
+                calcular_ranking_final(sala_id, cursor)
+            conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+    
+    from controladores import controlador_recompensas
+    for sala_id in finalizadas:
+        print(f"♻️ Resultado final de la sala {sala_id} recalculado con respuestas escritas tarde")
+        controlador_recompensas.asignar_recompensas_top3(sala_id)
+        bus.publicar(sala_id, 'ranking_updated')
+
+@liquidacion_xp.procesador
+def _liquidar_xp_lote(trabajos):
+    """
+    Liquida estadísticas, XP e insignias de un lote de respuestas en una transacción.
+    Cada respuesta se marca con xp_liquidado en la misma transacción; la que ya
+    estaba marcada (la liquidó otro worker o una recuperación) se salta.
+    
+    Returns:
+        Lista con el xp_info de cada trabajo (None si no ganó XP)
+    """
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            resultados = []
+            for trabajo in trabajos:
+                cursor.execute('''
+                    UPDATE respuestas_participantes
+                    SET xp_liquidado = 1
+                    WHERE id_participante = %s AND id_sala = %s AND id_pregunta = %s AND xp_liquidado = 0
+                ''', (trabajo.participante_id, trabajo.sala_id, trabajo.id_pregunta))
+                if cursor.rowcount == 0:
+                    resultados.append(None)
+                    continue
+                resultados.append(_procesar_xp_respuesta(
+                    cursor, trabajo.participante_id, trabajo.sala_id, trabajo.id_pregunta,
+                    trabajo.es_correcta, trabajo.tiempo_respuesta
+                ))
+            conexion.commit()
+            return resultados
+    finally:
+        conexion.close()
+
+@liquidacion_xp.pendientes
+def _respuestas_sin_liquidar():
+    """Respuestas confirmadas cuyo XP aún no se ha liquidado (ver liquidacion_xp)"""
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('''
+                SELECT id_participante, id_sala, id_pregunta, es_correcta, tiempo_respuesta
+                FROM respuestas_participantes
+                WHERE xp_liquidado = 0
+                ORDER BY id_respuesta_participante
+                LIMIT %s
+            ''', (liquidacion_xp.COLA_MAX,))
+            return [
+                liquidacion_xp.Trabajo(participante_id, sala_id, id_pregunta, int(es_correcta), float(tiempo))
+                for participante_id, sala_id, id_pregunta, es_correcta, tiempo in cursor.fetchall()
+            ]
+    finally:
+        conexion.close()
+
+def avanzar_siguiente_pregunta(sala_id, desde_pregunta=None):
     """
     Avanza a la siguiente pregunta de la sala
     
+    Args:
+        sala_id: ID de la sala
+        desde_pregunta: Si se indica, solo avanza si la sala sigue en esa pregunta
+                        (el avance automático no repite un avance ya hecho por otro proceso)
+    
     Returns:
-        True si avanzó, False si ya no hay más preguntas
+        True si avanzó, False si ya no hay más preguntas (o ya no estaba en desde_pregunta)
     """
+    # Las respuestas de la pregunta que se cierra deben estar en MySQL, también
+    # las que aceptaron otros workers
+    ingesta.vaciar_sala(sala_id)
+    
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
             # Obtener estado actual
             cursor.execute('''
-                SELECT e.pregunta_actual, s.total_preguntas
+                SELECT e.pregunta_actual, s.total_preguntas, s.id_cuestionario
                 FROM estado_juego_sala e
                 JOIN salas_juego s ON e.id_sala = s.id_sala
                 WHERE e.id_sala = %s
@@ -336,7 +676,11 @@ def avanzar_siguiente_pregunta(sala_id):
             if not result:
                 return False
             
-            pregunta_actual, total_preguntas = result
+            pregunta_actual, total_preguntas, id_cuestionario = result
+            
+            if desde_pregunta is not None and pregunta_actual != desde_pregunta:
+                conexion.commit()
+                return False
             
             # Verificar si hay más preguntas
             if pregunta_actual >= total_preguntas:
@@ -352,8 +696,13 @@ def avanzar_siguiente_pregunta(sala_id):
             cursor.execute('''
                 UPDATE salas_juego 
                 SET pregunta_actual = %s
-                WHERE id_sala = %s
-            ''', (siguiente_pregunta, sala_id))
+                WHERE id_sala = %s AND pregunta_actual = %s
+            ''', (siguiente_pregunta, sala_id, pregunta_actual))
+            
+            if cursor.rowcount == 0:
+                # Otro proceso avanzó la sala entre la lectura y la escritura
+                conexion.rollback()
+                return False
             
             cursor.execute('''
                 UPDATE estado_juego_sala
@@ -363,11 +712,59 @@ def avanzar_siguiente_pregunta(sala_id):
                 WHERE id_sala = %s
             ''', (siguiente_pregunta, sala_id))
             
+            estado_memoria = _registrar_estado_en_memoria(
+                cursor, sala_id, obtener_mazo_sala(sala_id, id_cuestionario, cursor),
+                siguiente_pregunta, total_preguntas
+            )
+            
             conexion.commit()
+            
+            if estado_memoria:
+                estado_salas.registrar(estado_memoria)
+                _programar_vencimiento(estado_memoria)
+            bus.publicar(sala_id, 'question_changed', {
+                'numero_pregunta': siguiente_pregunta,
+                'total_preguntas': total_preguntas
+            })
             return True
     finally:
         conexion.close()
 
+def configurar_avance_automatico(sala_id, activo):
+    """
+    Activa o desactiva el avance automático de la sala: al vencer el tiempo de
+    cada pregunta (o cuando responden todos) el servidor avanza solo
+    
+    Args:
+        sala_id: ID de la sala
+        activo: True para activarlo, False para volver al avance manual
+        
+    Returns:
+        True si la sala existe
+    """
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT id_sala FROM salas_juego WHERE id_sala = %s', (sala_id,))
+            if not cursor.fetchone():
+                return False
+            cursor.execute('''
+                UPDATE salas_juego
+                SET avance_automatico = %s
+                WHERE id_sala = %s
+            ''', (1 if activo else 0, sala_id))
+            conexion.commit()
+    finally:
+        conexion.close()
+    
+    bus.publicar(sala_id, 'sala_modificada')
+    if activo:
+        # Recarga el estado de la sala y programa la pregunta en curso
+        obtener_pregunta_actual_sala(sala_id)
+    else:
+        temporizador.cancelar(sala_id)
+    return True
+
 def calcular_ranking_final(sala_id, cursor=None):
     """
     Calcula las posiciones finales del ranking
@@ -382,24 +779,27 @@ def calcular_ranking_final(sala_id, cursor=None):
         cerrar_conexion = True
     
     try:
-        # Obtener ranking ordenado
+        # Una sola sentencia sobre el ranking ordenado (id_participante desempata
+        # como en tiempo_real.clasificacion). MySQL 5.7 no tiene funciones de
+        # ventana: se numera con una variable de usuario; el LIMIT conserva el
+        # ORDER BY de la tabla derivada y la materializa, lo que permite leer
+        # ranking_sala mientras se actualiza
         cursor.execute('''
-            SELECT id_ranking_sala
-            FROM ranking_sala
-            WHERE id_sala = %s
-            ORDER BY puntaje_total DESC, tiempo_total_respuestas ASC
+            UPDATE ranking_sala r
+            JOIN (
+                SELECT ordenadas.id_ranking_sala, (@posicion := @posicion + 1) AS posicion
+                FROM (
+                    SELECT id_ranking_sala
+                    FROM ranking_sala
+                    WHERE id_sala = %s
+                    ORDER BY puntaje_total DESC, tiempo_total_respuestas ASC, id_participante ASC
+                    LIMIT 18446744073709551615
+                ) AS ordenadas
+                CROSS JOIN (SELECT @posicion := 0) AS inicio
+            ) AS posiciones ON posiciones.id_ranking_sala = r.id_ranking_sala
+            SET r.posicion = posiciones.posicion
         ''', (sala_id,))
         
-        rankings = cursor.fetchall()
-        
-        # Actualizar posiciones
-        for posicion, (id_ranking,) in enumerate(rankings, start=1):
-            cursor.execute('''
-                UPDATE ranking_sala 
-                SET posicion = %s 
-                WHERE id_ranking_sala = %s
-            ''', (posicion, id_ranking))
-        
         if cerrar_conexion and conexion_local:
             conexion_local.commit()
     finally:
@@ -407,52 +807,112 @@ def calcular_ranking_final(sala_id, cursor=None):
             cursor.close()
             conexion_local.close()
 
-def obtener_ranking_sala(sala_id):
+def _cargar_clasificacion(sala_id):
     """
-    Obtiene el ranking actual de una sala
-    
-    Returns:
-        Lista de participantes ordenados por puntaje y tiempo
+    Carga en frío la clasificación de la sala desde MySQL y la registra en memoria.
+    Las respuestas anunciadas que no están en MySQL (en la cola de ingesta de
+    cualquier worker o anunciadas durante la lectura) se suman al registrarla.
     """
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
-            print(f"\n📊 Obteniendo ranking para sala {sala_id}...")
+            # Misma transacción que la lectura del ranking: ambas ven la misma
+            # foto, y cada respuesta está en las dos o en ninguna
+            cursor.execute('''
+                SELECT id_participante, id_pregunta
+                FROM respuestas_participantes
+                WHERE id_sala = %s
+            ''', (sala_id,))
+            persistidas = set(cursor.fetchall())
             
             cursor.execute('''
                 SELECT 
-                    r.posicion,
+                    p.id_participante,
                     COALESCE(CONCAT(u.nombre, ' ', u.apellidos), p.nombre_participante) as nombre_completo,
                     r.puntaje_total,
                     r.respuestas_correctas,
                     r.tiempo_total_respuestas,
-                    g.numero_grupo,
-                    p.id_participante
+                    g.numero_grupo
                 FROM ranking_sala r
                 JOIN participantes_sala p ON r.id_participante = p.id_participante
                 LEFT JOIN usuarios u ON p.id_usuario = u.id_usuario
                 LEFT JOIN grupos_sala g ON p.id_grupo = g.id_grupo
                 WHERE r.id_sala = %s
-                ORDER BY r.puntaje_total DESC, r.tiempo_total_respuestas ASC
             ''', (sala_id,))
+            filas = [{
+                'id_participante': row[0],
+                'nombre_completo': row[1],
+                'puntos_totales': row[2],  # Cambio de puntaje_total a puntos_totales para consistencia
+                'respuestas_correctas': row[3],
+                'tiempo_total_respuestas': float(row[4]),
+                'numero_grupo': row[5]
+            } for row in cursor.fetchall()]
             
-            ranking = []
-            for row in cursor.fetchall():
-                print(f"   👤 {row[1]}: {row[2]} puntos, {row[3]} correctas")
-                ranking.append({
-                    'posicion': row[0],
-                    'nombre_completo': row[1],
-                    'puntos_totales': row[2],  # Cambio de puntaje_total a puntos_totales para consistencia
-                    'respuestas_correctas': row[3],
-                    'tiempo_total_respuestas': float(row[4]),
-                    'numero_grupo': row[5],
-                    'id_participante': row[6]
-                })
-            
-            print(f"✅ Total participantes en ranking: {len(ranking)}\n")
-            return ranking
+            cursor.execute('SELECT estado FROM salas_juego WHERE id_sala = %s', (sala_id,))
+            sala = cursor.fetchone()
     finally:
         conexion.close()
+    
+    print(f"📊 Clasificación de la sala {sala_id} cargada desde MySQL ({len(filas)} participantes)")
+    return clasificacion.registrar(sala_id, filas, finalizada=bool(sala and sala[0] == 'finalizada'),
+                                   persistidas=persistidas)
+
+def _obtener_clasificacion(sala_id):
+    return clasificacion.obtener(sala_id) or _cargar_clasificacion(sala_id)
+
+def obtener_ranking_sala(sala_id, top=None):
+    """
+    Obtiene el ranking actual de una sala desde la clasificación en memoria
+    
+    Args:
+        sala_id: ID de la sala
+        top: número de primeros puestos a devolver (None = todos)
+    
+    Returns:
+        Lista de participantes ordenados por puntaje y tiempo
+    """
+    return _obtener_clasificacion(sala_id).top(top)
+
+def obtener_posicion_participante(sala_id, participante_id, radio=2):
+    """
+    Obtiene la posición de un participante y sus vecinos en el ranking en vivo
+    
+    Returns:
+        Diccionario con la posición, el total de participantes y los `radio`
+        participantes por delante y por detrás, o None si no está en el ranking
+    """
+    tabla = _obtener_clasificacion(sala_id)
+    posicion = tabla.posicion(participante_id)
+    if posicion is None:
+        return None
+    return {
+        'posicion': posicion,
+        'total': len(tabla),
+        'vecinos': tabla.vecinos(participante_id, radio)
+    }
+
+def obtener_conteos_respuestas(sala_id):
+    """
+    Respuestas de la pregunta actual y de cada pregunta del juego, solo desde
+    el registro en memoria (no consulta MySQL)
+    
+    Returns:
+        Diccionario con numero_pregunta, total, respondieron, pendientes y
+        por_pregunta ({numero_pregunta: respuestas}), o None si la sala no
+        está registrada
+    """
+    estado_memoria = estado_salas.obtener(sala_id)
+    if estado_memoria is None:
+        return None
+    total = estado_memoria.total_participantes
+    respondieron = len(estado_memoria.respondieron)
+    return {
+        'numero_pregunta': estado_memoria.numero_pregunta,
+        'total': total,
+        'respondieron': respondieron,
+        'pendientes': max(0, total - respondieron),
+        'por_pregunta': estado_salas.respondidas(sala_id)
+    }
 
 def obtener_estadisticas_pregunta_actual(sala_id):
     """
@@ -461,6 +921,16 @@ def obtener_estadisticas_pregunta_actual(sala_id):
     Returns:
         Diccionario con total de participantes y cuántos han respondido
     """
+    estado_memoria = estado_salas.obtener(sala_id)
+    if estado_memoria is not None and estado_memoria.estado == 'en_curso':
+        total = estado_memoria.total_participantes
+        respondieron = len(estado_memoria.respondieron)
+        return {
+            'total': total,
+            'respondieron': respondieron,
+            'pendientes': max(0, total - respondieron)
+        }
+    
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
@@ -475,25 +945,18 @@ def obtener_estadisticas_pregunta_actual(sala_id):
             
             # Pregunta actual
             cursor.execute('''
-                SELECT pregunta_actual FROM salas_juego WHERE id_sala = %s
+                SELECT pregunta_actual, id_cuestionario FROM salas_juego WHERE id_sala = %s
             ''', (sala_id,))
             
-            pregunta_actual = cursor.fetchone()[0]
+            pregunta_actual, id_cuestionario = cursor.fetchone()
+            id_pregunta = obtener_mazo_sala(sala_id, id_cuestionario, cursor).id_pregunta(pregunta_actual)
             
             # Cuántos han respondido
             cursor.execute('''
                 SELECT COUNT(DISTINCT id_participante)
                 FROM respuestas_participantes
-                WHERE id_sala = %s AND id_pregunta = (
-                    SELECT p.id_pregunta
-                    FROM cuestionario_preguntas cp
-                    JOIN preguntas p ON cp.id_pregunta = p.id_pregunta
-                    JOIN salas_juego s ON cp.id_cuestionario = s.id_cuestionario
-                    WHERE s.id_sala = %s
-                    ORDER BY cp.orden
-                    LIMIT %s, 1
-                )
-            ''', (sala_id, sala_id, pregunta_actual - 1))
+                WHERE id_sala = %s AND id_pregunta = %s
+            ''', (sala_id, id_pregunta))
             
             respondieron = cursor.fetchone()[0]
             
@@ -505,6 +968,64 @@ def obtener_estadisticas_pregunta_actual(sala_id):
     finally:
         conexion.close()
 
+def _consultar_detalle_estudiantes(cursor, sala_id, id_pregunta_actual):
+    """
+    Participantes activos de la sala con su respuesta a la pregunta indicada
+    
+    Returns:
+        (lista de estudiantes, diccionario de estadísticas)
+    """
+    # Obtener todos los participantes con su estado de respuesta
+    cursor.execute('''
+        SELECT 
+            ps.id_participante,
+            CONCAT(u.nombre, ' ', u.apellidos) as nombre_completo,
+            COALESCE(gs.numero_grupo, ps.id_grupo, 0) as numero_grupo,
+            CASE 
+                WHEN rp.id_respuesta_participante IS NOT NULL THEN 1 
+                ELSE 0 
+            END as ha_respondido,
+            rp.tiempo_respuesta,
+            rp.es_correcta,
+            rp.puntaje_obtenido
+        FROM participantes_sala ps
+        JOIN usuarios u ON ps.id_usuario = u.id_usuario
+        LEFT JOIN grupos_sala gs ON ps.id_grupo = gs.id_grupo
+        LEFT JOIN respuestas_participantes rp ON 
+            rp.id_participante = ps.id_participante 
+            AND rp.id_sala = ps.id_sala
+            AND rp.id_pregunta = %s
+        WHERE ps.id_sala = %s AND ps.estado = 'jugando'
+        ORDER BY ha_respondido DESC, nombre_completo ASC
+    ''', (id_pregunta_actual, sala_id))
+    
+    estudiantes = []
+    total = 0
+    respondieron = 0
+    
+    for row in cursor.fetchall():
+        total += 1
+        ha_respondido = bool(row[3])
+        if ha_respondido:
+            respondieron += 1
+        
+        estudiantes.append({
+            'id_participante': row[0],
+            'nombre': row[1],
+            'grupo': row[2],
+            'ha_respondido': ha_respondido,
+            'tiempo_respuesta': float(row[4]) if row[4] else None,
+            'es_correcta': bool(row[5]) if row[5] is not None else None,
+            'puntaje': row[6] if row[6] else None
+        })
+    
+    return estudiantes, {
+        'total': total,
+        'respondieron': respondieron,
+        'pendientes': total - respondieron,
+        'porcentaje': round((respondieron / total * 100) if total > 0 else 0, 1)
+    }
+
 def obtener_detalle_respuestas_estudiantes(sala_id):
     """
     Obtiene el detalle de qué estudiantes han respondido la pregunta actual
@@ -533,81 +1054,92 @@ def obtener_detalle_respuestas_estudiantes(sala_id):
             tiempo_por_pregunta = estado[3]  # Tiempo límite configurado (en segundos)
             
             # Obtener id_pregunta actual
-            cursor.execute('''
-                SELECT p.id_pregunta
-                FROM cuestionario_preguntas cp
-                JOIN preguntas p ON cp.id_pregunta = p.id_pregunta
-                WHERE cp.id_cuestionario = %s
-                ORDER BY cp.orden
-                LIMIT %s, 1
-            ''', (id_cuestionario, num_pregunta_actual - 1))
-            
-            pregunta_result = cursor.fetchone()
-            if not pregunta_result:
+            id_pregunta_actual = obtener_mazo_sala(sala_id, id_cuestionario, cursor).id_pregunta(num_pregunta_actual)
+            if not id_pregunta_actual:
                 return None
             
-            id_pregunta_actual = pregunta_result[0]
-            
-            # Obtener todos los participantes con su estado de respuesta
-            cursor.execute('''
-                SELECT 
-                    ps.id_participante,
-                    CONCAT(u.nombre, ' ', u.apellidos) as nombre_completo,
-                    COALESCE(gs.numero_grupo, ps.id_grupo, 0) as numero_grupo,
-                    CASE 
-                        WHEN rp.id_respuesta_participante IS NOT NULL THEN 1 
-                        ELSE 0 
-                    END as ha_respondido,
-                    rp.tiempo_respuesta,
-                    rp.es_correcta,
-                    rp.puntaje_obtenido
-                FROM participantes_sala ps
-                JOIN usuarios u ON ps.id_usuario = u.id_usuario
-                LEFT JOIN grupos_sala gs ON ps.id_grupo = gs.id_grupo
-                LEFT JOIN respuestas_participantes rp ON 
-                    rp.id_participante = ps.id_participante 
-                    AND rp.id_sala = ps.id_sala
-                    AND rp.id_pregunta = %s
-                WHERE ps.id_sala = %s AND ps.estado = 'jugando'
-                ORDER BY ha_respondido DESC, nombre_completo ASC
-            ''', (id_pregunta_actual, sala_id))
-            
-            estudiantes = []
-            total = 0
-            respondieron = 0
-            
-            for row in cursor.fetchall():
-                total += 1
-                ha_respondido = bool(row[3])
-                if ha_respondido:
-                    respondieron += 1
-                
-                estudiantes.append({
-                    'id_participante': row[0],
-                    'nombre': row[1],
-                    'grupo': row[2],
-                    'ha_respondido': ha_respondido,
-                    'tiempo_respuesta': float(row[4]) if row[4] else None,
-                    'es_correcta': bool(row[5]) if row[5] is not None else None,
-                    'puntaje': row[6] if row[6] else None
-                })
+            estudiantes, estadisticas = _consultar_detalle_estudiantes(cursor, sala_id, id_pregunta_actual)
             
             return {
                 'estudiantes': estudiantes,
                 'tiempo_inicio_pregunta': tiempo_inicio.isoformat() if tiempo_inicio else None,
                 'tiempo_por_pregunta': tiempo_por_pregunta,  # Tiempo límite configurado
                 'numero_pregunta_actual': num_pregunta_actual,  # Número de pregunta para detectar cambios
-                'estadisticas': {
-                    'total': total,
-                    'respondieron': respondieron,
-                    'pendientes': total - respondieron,
-                    'porcentaje': round((respondieron / total * 100) if total > 0 else 0, 1)
-                }
+                'estadisticas': estadisticas
             }
     finally:
         conexion.close()
 
-def finalizar_juego_sala(sala_id):
+# Secciones que puede devolver obtener_panel_control
+CAMPOS_PANEL = ('pregunta', 'estadisticas', 'detalle', 'ranking')
+
+def _formatear_fecha(valor):
+    return valor.isoformat() if hasattr(valor, 'isoformat') else valor
+
+def obtener_panel_control(sala_id, campos=CAMPOS_PANEL):
+    """
+    Instantánea del panel de control del docente en una sola llamada: pregunta
+    actual, estadísticas de respuestas, detalle por estudiante y ranking.
+    La pregunta, el conteo y el ranking salen de memoria; solo el detalle por
+    estudiante (o el conteo, si la sala no está en memoria) consulta MySQL,
+    con una única consulta.
+    
+    Args:
+        sala_id: ID de la sala
+        campos: secciones a incluir (subconjunto de CAMPOS_PANEL)
+        
+    Returns:
+        Diccionario con las secciones pedidas; 'estadisticas' y 'detalle' son
+        None si la sala no tiene una pregunta activa
+    """
+    pregunta = obtener_pregunta_actual_sala(sala_id)
+    estado_memoria = estado_salas.obtener(sala_id)
+    panel = {}
+    
+    if 'pregunta' in campos:
+        panel['pregunta'] = pregunta
+    
+    estadisticas = None
+    if pregunta and estado_memoria is not None:
+        respondieron = len(estado_memoria.respondieron)
+        total = estado_memoria.total_participantes
+        estadisticas = {
+            'total': total,
+            'respondieron': respondieron,
+            'pendientes': max(0, total - respondieron)
+        }
+    
+    necesita_consulta = 'detalle' in campos or ('estadisticas' in campos and estadisticas is None)
+    if pregunta and necesita_consulta:
+        conexion = obtener_conexion()
+        try:
+            with conexion.cursor() as cursor:
+                estudiantes, estadisticas_detalle = _consultar_detalle_estudiantes(
+                    cursor, sala_id, pregunta['id_pregunta']
+                )
+        finally:
+            conexion.close()
+        
+        if estadisticas is None:
+            estadisticas = {clave: estadisticas_detalle[clave] for clave in ('total', 'respondieron', 'pendientes')}
+        if 'detalle' in campos:
+            panel['detalle'] = {
+                'estudiantes': estudiantes,
+                'tiempo_inicio_pregunta': _formatear_fecha(pregunta['tiempo_inicio']),
+                'tiempo_por_pregunta': pregunta['tiempo_limite'],
+                'numero_pregunta_actual': pregunta['numero_pregunta'],
+                'estadisticas': estadisticas_detalle
+            }
+    elif 'detalle' in campos:
+        panel['detalle'] = None
+    
+    if 'estadisticas' in campos:
+        panel['estadisticas'] = estadisticas
+    if 'ranking' in campos:
+        panel['ranking'] = obtener_ranking_sala(sala_id)
+    return panel
+
+def finalizar_juego_sala(sala_id, desde_pregunta=None):
     """
     Finaliza el juego en una sala
     - Cambia el estado a 'finalizada'
@@ -615,12 +1147,32 @@ def finalizar_juego_sala(sala_id):
     - Actualiza el estado de los participantes
     - Asigna recompensas automáticamente a los 3 primeros puestos
     
+    Args:
+        sala_id: ID de la sala
+        desde_pregunta: Si se indica, solo finaliza si la sala sigue en curso en esa
+                        pregunta (el avance automático no finaliza dos veces)
+    
     Returns:
         True si se finalizó correctamente
     """
+    temporizador.cancelar(sala_id)
+    # El ranking final se calcula con todas las respuestas ya escritas por todos
+    # los workers; si alguno no confirma, _rehacer_resultado_final lo corrige
+    ingesta.vaciar_sala(sala_id)
+    
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
+            if desde_pregunta is not None:
+                cursor.execute('''
+                    UPDATE salas_juego
+                    SET estado = 'finalizada'
+                    WHERE id_sala = %s AND estado = 'en_curso' AND pregunta_actual = %s
+                ''', (sala_id, desde_pregunta))
+                if cursor.rowcount == 0:
+                    conexion.rollback()
+                    return False
+            
             # Calcular ranking final
             calcular_ranking_final(sala_id, cursor)
             
@@ -639,6 +1191,9 @@ def finalizar_juego_sala(sala_id):
             ''', (sala_id,))
             
             conexion.commit()
+            estado_salas.finalizar(sala_id)
+            mazos.descartar(sala_id)
+            bus.publicar(sala_id, 'game_finished')
             print(f"✅ Juego finalizado para sala {sala_id}")
             
             # Asignar recompensas automáticamente a los 3 primeros puestos
@@ -704,3 +1259,328 @@ def obtener_resultado_participante(sala_id, participante_id):
             }
     finally:
         conexion.close()
+
+# ==================== MODO INDIVIDUAL ====================
+# El estudiante recibe de una vez el mazo completo, sin la clave de respuestas,
+# junto con una firma del servidor; responde en el navegador y envía las
+# respuestas por lotes (periódicamente y al terminar). El servidor corrige con
+# la clave del mazo, puntúa con calcular_puntaje y guarda cada lote (respuestas,
+# ranking, XP) en una sola transacción. La partida se registra como una sala
+# automática (PIN AUTOxxxx), así que historial y resultados no cambian; la sala
+# y su PIN se crean con el primer lote, identificada por la clave del mazo.
+#
+# Los tiempos declarados se acotan con el reloj del servidor: por arriba, su
+# suma no puede superar el tiempo transcurrido desde la entrega del mazo; por
+# abajo, ese tiempo (menos las pausas entre preguntas y la pregunta en curso)
+# tuvo que gastarse respondiendo. Si no alcanza, las respuestas nuevas del lote
+# suben hasta un piso común, así declarar 0 segundos no da el puntaje máximo.
+
+TIEMPO_POR_PREGUNTA_INDIVIDUAL = 30
+# Segundos de holgura entre la suma de tiempos de respuesta declarados y el
+# tiempo transcurrido desde que se entregó el mazo
+MARGEN_TIEMPO_INDIVIDUAL = 5
+# Segundos por pregunta que el navegador puede pasar fuera de una pregunta
+# (pausa de 400 ms entre preguntas, más temporizadores lentos en segundo plano)
+PAUSA_INDIVIDUAL = 2
+
+class PartidaIndividualError(ValueError):
+    """Lote de respuestas que no corresponde a la partida firmada"""
+    
+    def __init__(self, mensaje, codigo=400):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+def preparar_partida_individual(cuestionario_id, id_usuario):
+    """
+    Prepara el mazo de una partida individual
+    
+    Args:
+        cuestionario_id: ID del cuestionario (debe estar publicado)
+        id_usuario: ID del estudiante
+        
+    Returns:
+        (mazo para el cliente, datos a firmar) o None si el cuestionario no
+        existe, no está publicado o no tiene preguntas
+    """
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute('''
+                SELECT titulo FROM cuestionarios
+                WHERE id_cuestionario = %s AND estado = 'publicado'
+            ''', (cuestionario_id,))
+            cuestionario = cursor.fetchone()
+            if not cuestionario:
+                return None
+            
+            mazo = mazos.construir(cursor, cuestionario_id)
+            if not len(mazo):
+                return None
+    finally:
+        conexion.close()
+    
+    preguntas = []
+    for numero in range(1, len(mazo) + 1):
+        pregunta = mazo.como_diccionario(numero)
+        pregunta['numero_pregunta'] = numero
+        preguntas.append(pregunta)
+    
+    mazo_cliente = {
+        'titulo': cuestionario[0],
+        'total_preguntas': len(preguntas),
+        'tiempo_limite': TIEMPO_POR_PREGUNTA_INDIVIDUAL,
+        'preguntas': preguntas
+    }
+    # La clave identifica la partida en los lotes de respuestas; la sala (y su
+    # PIN) se crea con ella en el primer lote
+    datos = {
+        'c': cuestionario_id,
+        'u': id_usuario,
+        'k': uuid.uuid4().hex,
+        'p': [pregunta['id_pregunta'] for pregunta in preguntas],
+        't': TIEMPO_POR_PREGUNTA_INDIVIDUAL
+    }
+    return mazo_cliente, datos
+
+def _normalizar_respuestas_individuales(datos, respuestas):
+    """
+    Valida el lote contra la partida firmada
+    
+    Returns:
+        ({numero_pregunta: (id_pregunta, id_opcion, tiempo_respuesta)}, último
+        numero_pregunta del lote o 0); las preguntas sin opción (tiempo
+        agotado) no se incluyen en el diccionario pero cuentan como alcanzadas
+    """
+    ids_preguntas = datos['p']
+    tiempo_limite = datos['t']
+    elegidas = {}
+    ultima = 0
+    for respuesta in respuestas:
+        try:
+            numero = int(respuesta['numero_pregunta'])
+            id_opcion = respuesta.get('id_opcion')
+            id_opcion = int(id_opcion) if id_opcion is not None else None
+            tiempo = float(respuesta.get('tiempo_respuesta') or 0)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise PartidaIndividualError('Formato de respuesta inválido')
+        if not 1 <= numero <= len(ids_preguntas):
+            raise PartidaIndividualError(f'La pregunta {numero} no pertenece a la partida')
+        ultima = max(ultima, numero)
+        if id_opcion is None:
+            continue
+        elegidas[numero] = (ids_preguntas[numero - 1], id_opcion, min(max(tiempo, 0.0), tiempo_limite))
+    return elegidas, ultima
+
+def _piso_tiempos(tiempos, deficit, tiempo_limite):
+    """
+    Piso común de tiempo por respuesta: subir hasta él las respuestas más
+    rápidas suma el déficit (sin pasar del tiempo límite)
+    """
+    ordenados = sorted(tiempos)
+    acumulado = 0.0
+    debajo = len(ordenados)
+    for indice, tiempo in enumerate(ordenados):
+        if indice * tiempo - acumulado >= deficit:
+            debajo = indice
+            break
+        acumulado += tiempo
+    return min((deficit + acumulado) / debajo, tiempo_limite)
+
+def registrar_respuestas_individuales(datos, emitido_en, id_usuario, nombre_participante, respuestas, final=False):
+    """
+    Corrige, puntúa y guarda un lote de respuestas de una partida individual
+    en una sola transacción. La primera vez crea la sala, el participante y
+    su fila de ranking. Las preguntas ya guardadas se ignoran, así que
+    reenviar un lote no duplica puntos.
+    
+    Args:
+        datos: Datos firmados de preparar_partida_individual (ya verificados)
+        emitido_en: Momento (epoch) en que se firmó el mazo
+        id_usuario: ID del estudiante de la sesión
+        nombre_participante: Nombre a mostrar
+        respuestas: Lista de {'numero_pregunta', 'id_opcion', 'tiempo_respuesta'}
+        final: True en el último lote (finaliza la partida)
+        
+    Returns:
+        Diccionario con sala_id, participante_id, finalizada, resultados de
+        cada respuesta nueva, puntaje_total y respuestas_correctas
+        
+    Raises:
+        PartidaIndividualError: partida de otro usuario, ya finalizada, opción
+        que no pertenece a la pregunta o tiempos imposibles
+    """
+    if datos['u'] != id_usuario:
+        raise PartidaIndividualError('La partida pertenece a otro usuario', 403)
+    
+    elegidas, ultima = _normalizar_respuestas_individuales(datos, respuestas)
+    transcurrido = time.time() - emitido_en
+    tiempo_limite = datos['t']
+    numeros = {id_pregunta: numero for numero, id_pregunta in enumerate(datos['p'], start=1)}
+    # Mazos firmados antes de existir la clave llevan ya su PIN
+    clave_partida = datos.get('k')
+    
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            # Los lotes de un mismo estudiante se escriben de uno en uno: un
+            # reintento del primer lote no crea otra sala y los tiempos se
+            # comprueban contra lo ya guardado
+            cursor.execute('SELECT id_usuario FROM usuarios WHERE id_usuario = %s FOR UPDATE', (id_usuario,))
+            
+            mazo = mazos.construir(cursor, datos['c'])
+            
+            cursor.execute(f'''
+                SELECT s.id_sala, s.estado, p.id_participante, r.tiempo_total_respuestas, s.pregunta_actual
+                FROM salas_juego s
+                JOIN participantes_sala p ON p.id_sala = s.id_sala
+                LEFT JOIN ranking_sala r ON r.id_participante = p.id_participante AND r.id_sala = s.id_sala
+                WHERE {'s.clave_partida' if clave_partida else 's.pin_sala'} = %s AND p.id_usuario = %s
+            ''', (clave_partida or datos['pin'], id_usuario))
+            partida = cursor.fetchone()
+            
+            if partida is None:
+                inicio = datetime.fromtimestamp(emitido_en).replace(microsecond=0)
+                
+                def insertar(pin_sala):
+                    cursor.execute('''
+                        INSERT INTO salas_juego
+                        (id_cuestionario, pin_sala, clave_partida, estado, modo_juego, total_preguntas,
+                         tiempo_por_pregunta, tiempo_inicio_juego, fecha_creacion, grupos_habilitados, num_grupos)
+                        VALUES (%s, %s, %s, 'en_curso', 'individual', %s, %s, %s, %s, 0, 0)
+                    ''', (datos['c'], pin_sala, clave_partida, len(datos['p']), datos['t'], inicio, inicio))
+                    return cursor.lastrowid
+                
+                if clave_partida:
+                    _, sala_id = asignador_pines.insertar_con_pin('auto', insertar)
+                else:
+                    try:
+                        sala_id = insertar(datos['pin'])
+                    except Exception as e:
+                        # Otra sala tomó el PIN entre la entrega del mazo y el primer lote
+                        if e.args[:1] == (asignador_pines.ER_DUP_ENTRY,):
+                            raise PartidaIndividualError('La partida ya no es válida. Vuelve a empezar', 409)
+                        raise
+                
+                cursor.execute('''
+                    INSERT INTO participantes_sala
+                    (id_sala, id_usuario, nombre_participante, estado, fecha_union)
+                    VALUES (%s, %s, %s, 'jugando', %s)
+                ''', (sala_id, id_usuario, nombre_participante, inicio))
+                participante_id = cursor.lastrowid
+                
+                cursor.execute('''
+                    INSERT INTO ranking_sala
+                    (id_participante, id_sala, puntaje_total, respuestas_correctas, tiempo_total_respuestas, posicion)
+                    VALUES (%s, %s, 0, 0, 0, 1)
+                ''', (participante_id, sala_id))
+                tiempo_previo = 0.0
+                alcanzada = 0
+                ya_respondidas = set()
+            else:
+                sala_id, estado, participante_id, tiempo_previo, alcanzada = partida
+                if estado == 'finalizada':
+                    raise PartidaIndividualError('La partida ya terminó', 409)
+                tiempo_previo = float(tiempo_previo or 0)
+                alcanzada = alcanzada or 0
+                cursor.execute('''
+                    SELECT id_pregunta FROM respuestas_participantes
+                    WHERE id_participante = %s AND id_sala = %s
+                ''', (participante_id, sala_id))
+                ya_respondidas = {fila[0] for fila in cursor.fetchall()}
+            
+            # Las preguntas se responden en orden: no se vuelve a una que ya
+            # pasó (agotada o guardada)
+            alcanzada = max(alcanzada, max((numeros[i] for i in ya_respondidas), default=0))
+            validas = []
+            for numero, (id_pregunta, id_opcion, tiempo) in sorted(elegidas.items()):
+                if id_pregunta in ya_respondidas or numero <= alcanzada:
+                    continue
+                clave = mazo.clave.get(id_opcion)
+                if clave is None or clave[0] != id_pregunta:
+                    raise PartidaIndividualError(f'La opción elegida no pertenece a la pregunta {numero}')
+                validas.append((numero, id_pregunta, id_opcion, tiempo, 1 if clave[1] else 0))
+                ya_respondidas.add(id_pregunta)
+            
+            tiempo_nuevo = sum(respuesta[3] for respuesta in validas)
+            if tiempo_previo + tiempo_nuevo > transcurrido + MARGEN_TIEMPO_INDIVIDUAL:
+                raise PartidaIndividualError('Los tiempos de respuesta no son posibles')
+            
+            # Cota inferior: las preguntas sin respuesta cuentan con el tiempo límite
+            alcanzada = max(alcanzada, ultima)
+            declarado = tiempo_previo + tiempo_nuevo + (alcanzada - len(ya_respondidas)) * tiempo_limite
+            minimo = transcurrido - alcanzada * PAUSA_INDIVIDUAL - tiempo_limite - MARGEN_TIEMPO_INDIVIDUAL
+            if validas and declarado < minimo:
+                piso = _piso_tiempos([r[3] for r in validas], minimo - declarado, tiempo_limite)
+                validas = [r[:3] + (max(r[3], piso),) + r[4:] for r in validas]
+                tiempo_nuevo = sum(respuesta[3] for respuesta in validas)
+            
+            nuevas = [
+                (numero, id_pregunta, id_opcion, tiempo, es_correcta, calcular_puntaje(tiempo) if es_correcta else 0)
+                for numero, id_pregunta, id_opcion, tiempo, es_correcta in validas
+            ]
+            
+            if nuevas:
+                # El XP se liquida aquí mismo, en esta transacción
+                cursor.executemany('''
+                    INSERT INTO respuestas_participantes
+                    (id_participante, id_sala, id_pregunta, id_opcion_seleccionada, tiempo_respuesta, es_correcta,
+                     puntaje_obtenido, xp_liquidado)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, 1)
+                ''', [
+                    (participante_id, sala_id, id_pregunta, id_opcion, tiempo, es_correcta, puntaje)
+                    for _, id_pregunta, id_opcion, tiempo, es_correcta, puntaje in nuevas
+                ])
+                cursor.execute('''
+                    UPDATE ranking_sala
+                    SET puntaje_total = puntaje_total + %s,
+                        respuestas_correctas = respuestas_correctas + %s,
+                        tiempo_total_respuestas = tiempo_total_respuestas + %s
+                    WHERE id_participante = %s AND id_sala = %s
+                ''', (sum(r[5] for r in nuevas), sum(r[4] for r in nuevas), tiempo_nuevo, participante_id, sala_id))
+                
+                for _, id_pregunta, _, tiempo, es_correcta, _ in nuevas:
+                    _procesar_xp_respuesta(cursor, participante_id, sala_id, id_pregunta, es_correcta, tiempo)
+            
+            if not final:
+                cursor.execute('UPDATE salas_juego SET pregunta_actual = %s WHERE id_sala = %s', (alcanzada, sala_id))
+            else:
+                cursor.execute('''
+                    UPDATE salas_juego
+                    SET estado = 'finalizada', pregunta_actual = total_preguntas
+                    WHERE id_sala = %s
+                ''', (sala_id,))
+                cursor.execute('''
+                    UPDATE participantes_sala SET estado = 'finalizado' WHERE id_participante = %s
+                ''', (participante_id,))
+            
+            cursor.execute('''
+                SELECT puntaje_total, respuestas_correctas FROM ranking_sala
+                WHERE id_participante = %s AND id_sala = %s
+            ''', (participante_id, sala_id))
+            puntaje_total, respuestas_correctas = cursor.fetchone()
+            
+            conexion.commit()
+    finally:
+        conexion.close()
+    
+    print(f"🎮 [INDIVIDUAL] Sala {sala_id}: {len(nuevas)} respuestas registradas"
+          f"{' (partida finalizada)' if final else ''}")
+    
+    if final:
+        try:
+            from controladores import controlador_recompensas
+            controlador_recompensas.asignar_recompensas_top3(sala_id)
+        except Exception as e_recompensas:
+            print(f"⚠️ Error al asignar recompensas (no crítico): {e_recompensas}")
+    
+    return {
+        'sala_id': sala_id,
+        'participante_id': participante_id,
+        'finalizada': bool(final),
+        'resultados': [
+            {'numero_pregunta': numero, 'es_correcta': bool(es_correcta), 'puntaje_obtenido': puntaje}
+            for numero, _, _, _, es_correcta, puntaje in nuevas
+        ],
+        'puntaje_total': puntaje_total,
+        'respuestas_correctas': respuestas_correctas
+    }
@@ -1,7 +1,48 @@
-from bd import obtener_conexion
+from bd import obtener_conexion, obtener_conexion_lectura
+import pymysql.cursors
 
 def obtener_participaciones():
     return []
 
 def obtener_participaciones_por_usuario(usuario_id):
-    return []
+    """
+    Historial de participaciones del estudiante en salas finalizadas, con su
+    resultado en el ranking de cada sala (la más reciente primero)
+    
+    Args:
+        usuario_id: ID del estudiante
+        
+    Returns:
+        Lista de diccionarios (una fila por participación)
+    """
+    conexion = obtener_conexion_lectura()
+    try:
+        with conexion.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute('''
+                SELECT
+                    p.id_participante,
+                    p.nombre_participante,
+                    s.id_sala,
+                    s.pin_sala,
+                    s.estado as estado_sala,
+                    c.titulo as titulo_cuestionario,
+                    c.id_cuestionario,
+                    s.total_preguntas,
+                    s.fecha_creacion as fecha_inicio,
+                    r.puntaje_total,
+                    r.respuestas_correctas,
+                    r.tiempo_total_respuestas,
+                    r.posicion,
+                    g.nombre_grupo
+                FROM participantes_sala p
+                INNER JOIN salas_juego s ON p.id_sala = s.id_sala
+                INNER JOIN cuestionarios c ON s.id_cuestionario = c.id_cuestionario
+                LEFT JOIN ranking_sala r ON p.id_participante = r.id_participante AND p.id_sala = r.id_sala
+                LEFT JOIN grupos_sala g ON p.id_grupo = g.id_grupo
+                WHERE p.id_usuario = %s
+                AND s.estado = 'finalizada'
+                ORDER BY s.fecha_creacion DESC
+            ''', (usuario_id,))
+            return cursor.fetchall()
+    finally:
+        conexion.close()
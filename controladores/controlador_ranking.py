@@ -1,4 +1,4 @@
-from bd import obtener_conexion
+from bd import obtener_conexion_lectura
 import pymysql.cursors
 
 def obtener_ranking_global():
@@ -7,7 +7,7 @@ def obtener_ranking_global():
     basado en sus puntajes acumulados de todas las participaciones
     """
     try:
-        conexion = obtener_conexion()
+        conexion = obtener_conexion_lectura()
         cursor = conexion.cursor(pymysql.cursors.DictCursor)
         
         # Query para obtener el ranking global
@@ -78,7 +78,7 @@ def obtener_ranking_global_por_docente(id_docente):
     pero solo en los cuestionarios creados por un docente específico
     """
     try:
-        conexion = obtener_conexion()
+        conexion = obtener_conexion_lectura()
         cursor = conexion.cursor(pymysql.cursors.DictCursor)
         
         # Query para obtener el ranking filtrado por cuestionarios del docente
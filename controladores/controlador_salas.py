@@ -1,20 +1,25 @@
+from datetime import datetime
+
 from bd import obtener_conexion
+from tiempo_real import admision, asignador_pines, bus, pines, presencia
 
 def crear_sala(nombre, cuestionario_id, docente_id, **kwargs):
-    import random
-    pin_sala = str(random.randint(100000, 999999))
     max_participantes = kwargs.get('max_participantes', 30)
     modo_juego = kwargs.get('modo_juego', 'individual')
     
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
-            cursor.execute(
-                'INSERT INTO salas_juego (pin_sala, id_cuestionario, modo_juego, estado, max_participantes) VALUES (%s, %s, %s, %s, %s)', 
-                (pin_sala, cuestionario_id, modo_juego, 'esperando', max_participantes)
-            )
+            def insertar(pin_sala):
+                cursor.execute(
+                    'INSERT INTO salas_juego (pin_sala, id_cuestionario, modo_juego, estado, max_participantes) VALUES (%s, %s, %s, %s, %s)', 
+                    (pin_sala, cuestionario_id, modo_juego, 'esperando', max_participantes)
+                )
+                return cursor.lastrowid
+            
+            _, sala_id = asignador_pines.insertar_con_pin('sala', insertar)
             conexion.commit()
-            return cursor.lastrowid
+            return sala_id
     finally:
         conexion.close()
 
@@ -27,10 +32,16 @@ def obtener_sala_por_id(id_sala):
     finally:
         conexion.close()
 
-def obtener_participantes_sala(sala_id):
+@presencia.cargador
+def _cargar_participantes_sala(sala_id):
+    """Estado de la sala, participantes conectados, id de los desconectados y participantes ausentes, para tiempo_real.presencia"""
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
+            cursor.execute('SELECT estado FROM salas_juego WHERE id_sala = %s', (sala_id,))
+            sala = cursor.fetchone()
+            if not sala:
+                return None
             cursor.execute('''
                 SELECT 
                     ps.id_participante, 
@@ -39,7 +50,8 @@ def obtener_participantes_sala(sala_id):
                     ps.fecha_union, 
                     ps.estado,
                     ps.id_grupo,
-                    gs.nombre_grupo
+                    gs.nombre_grupo,
+                    ps.ausente
                 FROM participantes_sala ps
                 LEFT JOIN grupos_sala gs ON ps.id_grupo = gs.id_grupo
                 WHERE ps.id_sala = %s AND ps.estado != 'desconectado'
@@ -47,8 +59,9 @@ def obtener_participantes_sala(sala_id):
             ''', (sala_id,))
             
             participantes = []
+            ausentes = []
             for row in cursor.fetchall():
-                participantes.append({
+                (ausentes if row[7] else participantes).append({
                     'id_participante': row[0],
                     'id_usuario': row[1],
                     'nombre_participante': row[2],
@@ -57,11 +70,35 @@ def obtener_participantes_sala(sala_id):
                     'id_grupo': row[5],
                     'nombre_grupo': row[6]
                 })
-            return participantes
+
+            cursor.execute('''
+                SELECT id_participante FROM participantes_sala
+                WHERE id_sala = %s AND estado = 'desconectado'
+            ''', (sala_id,))
+            desconectados = [fila[0] for fila in cursor.fetchall()]
+            return sala[0], participantes, desconectados, ausentes
     finally:
         conexion.close()
 
+def obtener_participantes_sala(sala_id):
+    """Participantes conectados de la sala (registro de presencia en memoria)"""
+    return presencia.participantes(sala_id)
+
+def contar_participantes_sala(sala_id):
+    """Número de participantes conectados de la sala, sin copiar la lista"""
+    return presencia.contar(sala_id)
+
+def contar_participantes_por_estado(sala_id):
+    """Contadores de participantes de la sala (ver tiempo_real.presencia.conteos)"""
+    return presencia.conteos(sala_id)
+
 def obtener_sala_por_codigo(pin_sala):
+    """Sala con ese PIN, desde la caché en memoria (tiempo_real.pines)"""
+    return pines.obtener(pin_sala)
+
+@pines.cargador
+def _cargar_sala_por_codigo(pin_sala):
+    """Lee la sala por PIN de la base de datos, para tiempo_real.pines"""
     conexion = obtener_conexion()
     try:
         with conexion.cursor() as cursor:
@@ -86,6 +123,18 @@ def obtener_sala_por_codigo(pin_sala):
     finally:
         conexion.close()
 
+@asignador_pines.comprobador
+def _pines_en_uso(candidatos):
+    """PIN de la lista que ya usa alguna sala, en una sola consulta, para tiempo_real.asignador_pines"""
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            marcadores = ', '.join(['%s'] * len(candidatos))
+            cursor.execute(f'SELECT pin_sala FROM salas_juego WHERE pin_sala IN ({marcadores})', list(candidatos))
+            return {fila[0] for fila in cursor.fetchall()}
+    finally:
+        conexion.close()
+
 def agregar_participante_sala(sala_id, nombre_participante, id_usuario=None):
     """Agrega un participante a una sala de juego"""
     conexion = obtener_conexion()
@@ -107,16 +156,130 @@ def agregar_participante_sala(sala_id, nombre_participante, id_usuario=None):
                 raise ValueError("El participante ya está en la sala")
             
             # Insertar nuevo participante
+            fecha_union = datetime.now().replace(microsecond=0)
             cursor.execute('''
-                INSERT INTO participantes_sala (id_sala, id_usuario, nombre_participante, estado) 
-                VALUES (%s, %s, %s, 'esperando')
-            ''', (sala_id, id_usuario, nombre_participante))
+                INSERT INTO participantes_sala (id_sala, id_usuario, nombre_participante, fecha_union, estado) 
+                VALUES (%s, %s, %s, %s, 'esperando')
+            ''', (sala_id, id_usuario, nombre_participante, fecha_union))
             
             conexion.commit()
-            return cursor.lastrowid
+            participante_id = cursor.lastrowid
+            _registrar_union(sala_id, participante_id, nombre_participante, id_usuario, fecha_union)
+            return participante_id
     finally:
         conexion.close()
 
+@admision.escritor
+def insertar_participantes(solicitudes):
+    """
+    Inserta un lote de uniones (tiempo_real.admision) en una sola transacción
+    La fila de cada sala se bloquea (FOR UPDATE) antes de contar sus
+    participantes, así que las uniones de todos los procesos de servidor se
+    escriben de una en una por sala y max_participantes se respeta siempre.
+    
+    Args:
+        solicitudes: Lista de admision.Solicitud ya validadas en memoria
+        
+    Returns:
+        Lista, en el mismo orden, con el ID de participante insertado o el
+        admision.Rechazo de la unión si la sala ya no está esperando o está llena
+    """
+    salas_ids = sorted({solicitud.sala_id for solicitud in solicitudes})
+    marcadores = ', '.join(['%s'] * len(salas_ids))
+    conexion = obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(f'''
+                SELECT id_sala, estado, max_participantes FROM salas_juego
+                WHERE id_sala IN ({marcadores})
+                FOR UPDATE
+            ''', salas_ids)
+            salas = {fila[0]: (fila[1], fila[2] or admision.MAX_PARTICIPANTES_POR_DEFECTO)
+                     for fila in cursor.fetchall()}
+            # Quien vuelve a unirse tras caducar en la sala de espera (ausente)
+            # deja libre su fila anterior: no debe entrar dos veces al juego
+            condiciones, args = [], []
+            for solicitud in solicitudes:
+                if solicitud.id_usuario:
+                    condiciones.append('(id_sala = %s AND id_usuario = %s)')
+                    args += [solicitud.sala_id, solicitud.id_usuario]
+                else:
+                    condiciones.append('(id_sala = %s AND nombre_participante = %s)')
+                    args += [solicitud.sala_id, solicitud.nombre_participante]
+            cursor.execute(f'''
+                UPDATE participantes_sala SET estado = 'desconectado'
+                WHERE estado = 'esperando' AND ausente = 1 AND ({' OR '.join(condiciones)})
+            ''', args)
+            # Se cuenta después de obtener el bloqueo para ver las uniones ya confirmadas
+            cursor.execute(f'''
+                SELECT id_sala, COUNT(*) FROM participantes_sala
+                WHERE id_sala IN ({marcadores}) AND estado <> 'desconectado'
+                GROUP BY id_sala
+            ''', salas_ids)
+            ocupadas = dict(cursor.fetchall())
+            
+            resultados = []
+            filas = []
+            for solicitud in solicitudes:
+                estado, max_participantes = salas.get(solicitud.sala_id, (None, 0))
+                if estado != 'esperando':
+                    resultados.append(admision.rechazo_por_estado(estado))
+                elif ocupadas.get(solicitud.sala_id, 0) >= max_participantes:
+                    resultados.append(admision.rechazo_por_capacidad(max_participantes))
+                else:
+                    ocupadas[solicitud.sala_id] = ocupadas.get(solicitud.sala_id, 0) + 1
+                    resultados.append(None)
+                    filas.append(solicitud)
+            
+            if filas:
+                cursor.execute('''
+                    INSERT INTO participantes_sala (id_sala, id_usuario, nombre_participante, fecha_union, estado) 
+                    VALUES ''' + ', '.join(["(%s, %s, %s, %s, 'esperando')"] * len(filas)),
+                    [valor for solicitud in filas
+                     for valor in (solicitud.sala_id, solicitud.id_usuario,
+                                   solicitud.nombre_participante, solicitud.fecha_union)])
+                # Las salas siguen bloqueadas: sus últimas filas son las de este INSERT,
+                # numeradas en el orden de VALUES
+                cursor.execute(f'''
+                    SELECT id_participante FROM participantes_sala
+                    WHERE id_sala IN ({marcadores})
+                    ORDER BY id_participante DESC
+                    LIMIT %s
+                ''', salas_ids + [len(filas)])
+                ids = iter(sorted(fila[0] for fila in cursor.fetchall()))
+                resultados = [next(ids) if resultado is None else resultado for resultado in resultados]
+            conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+    
+    for solicitud, resultado in zip(solicitudes, resultados):
+        if not isinstance(resultado, admision.Rechazo):
+            _registrar_union(solicitud.sala_id, resultado, solicitud.nombre_participante,
+                             solicitud.id_usuario, solicitud.fecha_union)
+    return resultados
+
+def _registrar_union(sala_id, participante_id, nombre_participante, id_usuario, fecha_union):
+    """Anota la unión ya confirmada en presencia y la publica en el bus"""
+    participante = {
+        'id_participante': participante_id,
+        'id_usuario': id_usuario,
+        'nombre_participante': nombre_participante,
+        'fecha_union': fecha_union,
+        'estado': 'esperando',
+        'id_grupo': None,
+        'nombre_grupo': None
+    }
+    presencia.unir(sala_id, participante)
+    bus.publicar(sala_id, 'participant_joined', presencia.datos_union(participante))
+
+def _sala_del_participante(cursor, participante_id):
+    cursor.execute('SELECT id_sala FROM participantes_sala WHERE id_participante = %s', (participante_id,))
+    fila = cursor.fetchone()
+    return fila[0] if fila else None
+
 def eliminar_participante_sala(participante_id):
     """Elimina un participante de una sala (marca como desconectado)"""
     conexion = obtener_conexion()
@@ -127,8 +290,13 @@ def eliminar_participante_sala(participante_id):
                 SET estado = 'desconectado' 
                 WHERE id_participante = %s
             ''', (participante_id,))
+            actualizado = cursor.rowcount > 0
+            sala_id = _sala_del_participante(cursor, participante_id)
             conexion.commit()
-            return cursor.rowcount > 0
+            if sala_id:
+                presencia.salir(sala_id, participante_id)
+                bus.publicar(sala_id, 'participant_left', {'participantes': [participante_id]})
+            return actualizado
     finally:
         conexion.close()
 
@@ -143,6 +311,7 @@ def actualizar_estado_sala(sala_id, nuevo_estado):
                 WHERE id_sala = %s
             ''', (nuevo_estado, sala_id))
             conexion.commit()
+            bus.publicar(sala_id, 'sala_modificada')
             return cursor.rowcount > 0
     finally:
         conexion.close()
@@ -183,6 +352,7 @@ def crear_grupos_sala(sala_id, num_grupos, nombres=None):
                 print(f"   ✅ Creado: {nombre_grupo} (ID: {cursor.lastrowid})")
             
             conexion.commit()
+            bus.publicar(sala_id, 'sala_modificada')
             print(f"✅ [CONTROLADOR] {len(ids_grupos)} grupos creados exitosamente")
             return ids_grupos
     except Exception as e:
@@ -259,8 +429,12 @@ def asignar_participante_grupo(participante_id, grupo_id):
                 SET id_grupo = %s 
                 WHERE id_participante = %s
             ''', (grupo_id, participante_id))
+            actualizado = cursor.rowcount > 0
+            sala_id = _sala_del_participante(cursor, participante_id)
             conexion.commit()
-            return cursor.rowcount > 0
+            if sala_id:
+                bus.publicar(sala_id, 'sala_modificada')
+            return actualizado
     finally:
         conexion.close()
 
@@ -285,6 +459,7 @@ def habilitar_grupos_sala(sala_id, habilitar=True, num_grupos=3):
                 WHERE id_sala = %s
             ''', (1 if habilitar else 0, num_grupos if habilitar else 0, sala_id))
             conexion.commit()
+            bus.publicar(sala_id, 'sala_modificada')
             return cursor.rowcount > 0
     finally:
         conexion.close()
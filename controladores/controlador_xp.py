@@ -4,7 +4,7 @@ Controlador para el sistema de XP, Niveles e Insignias
 Gestiona la experiencia de los estudiantes y el desbloqueo de logros
 """
 
-from bd import obtener_conexion
+from bd import obtener_conexion, obtener_conexion_lectura
 from datetime import datetime
 import math
 
@@ -40,92 +40,105 @@ def calcular_nivel_por_xp(xp_total):
 
 # ==================== GESTIÓN DE XP ====================
 
-def otorgar_xp(id_usuario, cantidad_xp, razon, id_sala=None, id_pregunta=None):
+def otorgar_xp(id_usuario, cantidad_xp, razon, id_sala=None, id_pregunta=None, cursor=None):
     """
     Otorga XP a un usuario y actualiza su nivel si es necesario
     
+    Args:
+        cursor: Cursor opcional para ejecutar dentro de una transacción existente
+    
     Returns:
         dict con información de la transacción (xp_ganado, nivel_anterior, nivel_nuevo, subio_nivel, insignias_nuevas)
     """
-    conexion = obtener_conexion()
+    cerrar_conexion = False
+    conexion_local = None
+    
+    if cursor is None:
+        conexion_local = obtener_conexion()
+        cursor = conexion_local.cursor()
+        cerrar_conexion = True
+
     try:
-        with conexion.cursor() as cursor:
-            # Obtener experiencia actual
-            cursor.execute('''
-                SELECT xp_actual, nivel_actual, xp_total_acumulado 
-                FROM experiencia_usuarios 
-                WHERE id_usuario = %s
-            ''', (id_usuario,))
-            
-            exp_data = cursor.fetchone()
-            if not exp_data:
-                # Crear registro si no existe (solo para estudiantes)
-                cursor.execute('SELECT tipo_usuario FROM usuarios WHERE id_usuario = %s', (id_usuario,))
-                user_type = cursor.fetchone()
-                if user_type and user_type[0] == 'estudiante':
-                    cursor.execute('''
-                        INSERT INTO experiencia_usuarios (id_usuario, xp_actual, nivel_actual, xp_total_acumulado)
-                        VALUES (%s, 0, 1, 0)
-                    ''', (id_usuario,))
-                    exp_data = (0, 1, 0)
-                else:
-                    return None  # No otorgar XP a docentes
-            
-            xp_actual, nivel_actual, xp_total = exp_data
-            nuevo_xp_actual = xp_actual + cantidad_xp
-            nuevo_xp_total = xp_total + cantidad_xp
-            nivel_anterior = nivel_actual
-            
-            # Calcular si subió de nivel
+        # Obtener experiencia actual
+        cursor.execute('''
+            SELECT xp_actual, nivel_actual, xp_total_acumulado 
+            FROM experiencia_usuarios 
+            WHERE id_usuario = %s
+        ''', (id_usuario,))
+        
+        exp_data = cursor.fetchone()
+        if not exp_data:
+            # Crear registro si no existe (solo para estudiantes)
+            cursor.execute('SELECT tipo_usuario FROM usuarios WHERE id_usuario = %s', (id_usuario,))
+            user_type = cursor.fetchone()
+            if user_type and user_type[0] == 'estudiante':
+                cursor.execute('''
+                    INSERT INTO experiencia_usuarios (id_usuario, xp_actual, nivel_actual, xp_total_acumulado)
+                    VALUES (%s, 0, 1, 0)
+                ''', (id_usuario,))
+                exp_data = (0, 1, 0)
+            else:
+                return None  # No otorgar XP a docentes
+        
+        xp_actual, nivel_actual, xp_total = exp_data
+        nuevo_xp_actual = xp_actual + cantidad_xp
+        nuevo_xp_total = xp_total + cantidad_xp
+        nivel_anterior = nivel_actual
+        
+        # Calcular si subió de nivel
+        xp_necesario = calcular_xp_para_nivel(nivel_actual + 1)
+        niveles_ganados = 0
+        
+        while nuevo_xp_actual >= xp_necesario:
+            nuevo_xp_actual -= xp_necesario
+            nivel_actual += 1
+            niveles_ganados += 1
             xp_necesario = calcular_xp_para_nivel(nivel_actual + 1)
-            niveles_ganados = 0
-            
-            while nuevo_xp_actual >= xp_necesario:
-                nuevo_xp_actual -= xp_necesario
-                nivel_actual += 1
-                niveles_ganados += 1
-                xp_necesario = calcular_xp_para_nivel(nivel_actual + 1)
-            
-            # Actualizar experiencia
-            cursor.execute('''
-                UPDATE experiencia_usuarios 
-                SET xp_actual = %s, nivel_actual = %s, xp_total_acumulado = %s
-                WHERE id_usuario = %s
-            ''', (nuevo_xp_actual, nivel_actual, nuevo_xp_total, id_usuario))
-            
-            # Registrar en historial
+        
+        # Actualizar experiencia
+        cursor.execute('''
+            UPDATE experiencia_usuarios 
+            SET xp_actual = %s, nivel_actual = %s, xp_total_acumulado = %s
+            WHERE id_usuario = %s
+        ''', (nuevo_xp_actual, nivel_actual, nuevo_xp_total, id_usuario))
+        
+        # Registrar en historial
+        cursor.execute('''
+            INSERT INTO historial_xp (id_usuario, cantidad_xp, razon, id_sala, id_pregunta)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', (id_usuario, cantidad_xp, razon, id_sala, id_pregunta))
+        
+        # Bonus por subir de nivel
+        if niveles_ganados > 0:
+            bonus_xp = niveles_ganados * 50
             cursor.execute('''
-                INSERT INTO historial_xp (id_usuario, cantidad_xp, razon, id_sala, id_pregunta)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (id_usuario, cantidad_xp, razon, id_sala, id_pregunta))
-            
-            # Bonus por subir de nivel
-            if niveles_ganados > 0:
-                bonus_xp = niveles_ganados * 50
-                cursor.execute('''
-                    INSERT INTO historial_xp (id_usuario, cantidad_xp, razon)
-                    VALUES (%s, %s, 'bonus_nivel')
-                ''', (id_usuario, bonus_xp))
-            
-            conexion.commit()
-            
-            # Verificar insignias desbloqueadas
-            insignias_nuevas = verificar_y_desbloquear_insignias(id_usuario)
-            
-            return {
-                'xp_ganado': cantidad_xp,
-                'xp_actual': nuevo_xp_actual,
-                'xp_total': nuevo_xp_total,
-                'nivel_anterior': nivel_anterior,
-                'nivel_nuevo': nivel_actual,
-                'subio_nivel': niveles_ganados > 0,
-                'niveles_ganados': niveles_ganados,
-                'xp_para_siguiente_nivel': xp_necesario,
-                'porcentaje_nivel': round((nuevo_xp_actual / xp_necesario) * 100, 1),
-                'insignias_nuevas': insignias_nuevas
-            }
+                INSERT INTO historial_xp (id_usuario, cantidad_xp, razon)
+                VALUES (%s, %s, 'bonus_nivel')
+            ''', (id_usuario, bonus_xp))
+        
+        # Verificar insignias desbloqueadas
+        insignias_nuevas = verificar_y_desbloquear_insignias(id_usuario, cursor)
+        
+        # Confirmar después de las insignias: al cerrar, el pool deshace lo pendiente
+        if cerrar_conexion:
+            conexion_local.commit()
+        
+        return {
+            'xp_ganado': cantidad_xp,
+            'xp_actual': nuevo_xp_actual,
+            'xp_total': nuevo_xp_total,
+            'nivel_anterior': nivel_anterior,
+            'nivel_nuevo': nivel_actual,
+            'subio_nivel': niveles_ganados > 0,
+            'niveles_ganados': niveles_ganados,
+            'xp_para_siguiente_nivel': xp_necesario,
+            'porcentaje_nivel': round((nuevo_xp_actual / xp_necesario) * 100, 1),
+            'insignias_nuevas': insignias_nuevas
+        }
     finally:
-        conexion.close()
+        if cerrar_conexion and conexion_local:
+            cursor.close()
+            conexion_local.close()
 
 def calcular_xp_por_respuesta(tiempo_respuesta, es_correcta, racha_actual=0):
     """
@@ -148,65 +161,77 @@ def calcular_xp_por_respuesta(tiempo_respuesta, es_correcta, racha_actual=0):
 
 # ==================== GESTIÓN DE ESTADÍSTICAS ====================
 
-def actualizar_estadisticas_respuesta(id_usuario, es_correcta, tiempo_respuesta):
+def actualizar_estadisticas_respuesta(id_usuario, es_correcta, tiempo_respuesta, cursor=None):
     """
     Actualiza las estadísticas del usuario después de responder una pregunta
+    
+    Args:
+        cursor: Cursor opcional para ejecutar dentro de una transacción existente
     """
-    conexion = obtener_conexion()
+    cerrar_conexion = False
+    conexion_local = None
+    
+    if cursor is None:
+        conexion_local = obtener_conexion()
+        cursor = conexion_local.cursor()
+        cerrar_conexion = True
+
     try:
-        with conexion.cursor() as cursor:
-            # Obtener estadísticas actuales
-            cursor.execute('SELECT * FROM estadisticas_juego WHERE id_usuario = %s', (id_usuario,))
-            stats = cursor.fetchone()
-            
-            if not stats:
-                # Crear estadísticas si no existen
-                cursor.execute('INSERT INTO estadisticas_juego (id_usuario) VALUES (%s)', (id_usuario,))
-                stats = (None, id_usuario, 0, 0, 0, 0, 0, 0, 0.0, 0.0, 0, None, None)
-            
-            # Convertir valores de la BD a int para evitar problemas con Decimal
-            total_correctas = int(stats[3]) if stats[3] else 0
-            total_incorrectas = int(stats[4]) if stats[4] else 0
-            racha_actual = int(stats[5]) if stats[5] else 0
-            racha_maxima = int(stats[6]) if stats[6] else 0
-            
-            # Actualizar racha
-            if es_correcta:
-                total_correctas += 1
-                racha_actual += 1
-                racha_maxima = max(racha_maxima, racha_actual)
-            else:
-                total_incorrectas += 1
-                racha_actual = 0
-            
-            # Calcular nueva precisión
-            total_respuestas = total_correctas + total_incorrectas
-            nueva_precision = (total_correctas / total_respuestas * 100) if total_respuestas > 0 else 0
-            
-            # Actualizar tiempo promedio (convertir Decimal a float para evitar errores)
-            tiempo_promedio_actual = float(stats[8]) if stats[8] else 0.0
-            if tiempo_promedio_actual == 0:
-                nuevo_tiempo_promedio = float(tiempo_respuesta)
-            else:
-                nuevo_tiempo_promedio = (tiempo_promedio_actual * (total_respuestas - 1) + float(tiempo_respuesta)) / total_respuestas
-            
-            cursor.execute('''
-                UPDATE estadisticas_juego 
-                SET total_respuestas_correctas = %s,
-                    total_respuestas_incorrectas = %s,
-                    racha_actual = %s,
-                    racha_maxima = %s,
-                    precision_promedio = %s,
-                    tiempo_promedio_respuesta = %s,
-                    fecha_ultima_partida = NOW()
-                WHERE id_usuario = %s
-            ''', (total_correctas, total_incorrectas, racha_actual, racha_maxima, 
-                  nueva_precision, nuevo_tiempo_promedio, id_usuario))
-            
-            conexion.commit()
-            return racha_actual
+        # Obtener estadísticas actuales
+        cursor.execute('SELECT * FROM estadisticas_juego WHERE id_usuario = %s', (id_usuario,))
+        stats = cursor.fetchone()
+        
+        if not stats:
+            # Crear estadísticas si no existen
+            cursor.execute('INSERT INTO estadisticas_juego (id_usuario) VALUES (%s)', (id_usuario,))
+            stats = (None, id_usuario, 0, 0, 0, 0, 0, 0, 0.0, 0.0, 0, None, None)
+        
+        # Convertir valores de la BD a int para evitar problemas con Decimal
+        total_correctas = int(stats[3]) if stats[3] else 0
+        total_incorrectas = int(stats[4]) if stats[4] else 0
+        racha_actual = int(stats[5]) if stats[5] else 0
+        racha_maxima = int(stats[6]) if stats[6] else 0
+        
+        # Actualizar racha
+        if es_correcta:
+            total_correctas += 1
+            racha_actual += 1
+            racha_maxima = max(racha_maxima, racha_actual)
+        else:
+            total_incorrectas += 1
+            racha_actual = 0
+        
+        # Calcular nueva precisión
+        total_respuestas = total_correctas + total_incorrectas
+        nueva_precision = (total_correctas / total_respuestas * 100) if total_respuestas > 0 else 0
+        
+        # Actualizar tiempo promedio (convertir Decimal a float para evitar errores)
+        tiempo_promedio_actual = float(stats[8]) if stats[8] else 0.0
+        if tiempo_promedio_actual == 0:
+            nuevo_tiempo_promedio = float(tiempo_respuesta)
+        else:
+            nuevo_tiempo_promedio = (tiempo_promedio_actual * (total_respuestas - 1) + float(tiempo_respuesta)) / total_respuestas
+        
+        cursor.execute('''
+            UPDATE estadisticas_juego 
+            SET total_respuestas_correctas = %s,
+                total_respuestas_incorrectas = %s,
+                racha_actual = %s,
+                racha_maxima = %s,
+                precision_promedio = %s,
+                tiempo_promedio_respuesta = %s,
+                fecha_ultima_partida = NOW()
+            WHERE id_usuario = %s
+        ''', (total_correctas, total_incorrectas, racha_actual, racha_maxima, 
+              nueva_precision, nuevo_tiempo_promedio, id_usuario))
+        
+        if cerrar_conexion:
+            conexion_local.commit()
+        return racha_actual
     finally:
-        conexion.close()
+        if cerrar_conexion and conexion_local:
+            cursor.close()
+            conexion_local.close()
 
 def actualizar_estadisticas_partida(id_usuario, gano=False):
     """
@@ -228,105 +253,117 @@ def actualizar_estadisticas_partida(id_usuario, gano=False):
 
 # ==================== GESTIÓN DE INSIGNIAS ====================
 
-def verificar_y_desbloquear_insignias(id_usuario):
+def verificar_y_desbloquear_insignias(id_usuario, cursor=None):
     """
     Verifica si el usuario cumple los requisitos para nuevas insignias
     y las desbloquea automáticamente
     
+    Args:
+        cursor: Cursor opcional para ejecutar dentro de una transacción existente
+    
     Returns:
         Lista de insignias recién desbloqueadas
     """
-    conexion = obtener_conexion()
+    cerrar_conexion = False
+    conexion_local = None
+    
+    if cursor is None:
+        conexion_local = obtener_conexion()
+        cursor = conexion_local.cursor()
+        cerrar_conexion = True
+
     insignias_nuevas = []
     
     try:
-        with conexion.cursor() as cursor:
-            # Obtener estadísticas del usuario
-            cursor.execute('''
-                SELECT e.nivel_actual, s.total_partidas_jugadas, s.racha_maxima, 
-                       s.precision_promedio, s.tiempo_promedio_respuesta
-                FROM experiencia_usuarios e
-                LEFT JOIN estadisticas_juego s ON e.id_usuario = s.id_usuario
-                WHERE e.id_usuario = %s
-            ''', (id_usuario,))
-            
-            stats = cursor.fetchone()
-            if not stats:
-                return []
-            
-            nivel, partidas, racha, precision, tiempo = stats
-            
-            # Valores predeterminados si no hay estadísticas
-            nivel = nivel or 1
-            partidas = partidas or 0
-            racha = racha or 0
-            precision = precision or 0
-            tiempo = tiempo or 0
-            
-            # Obtener insignias aún no desbloqueadas
-            cursor.execute('''
-                SELECT ic.id_insignia, ic.nombre, ic.descripcion, ic.icono, ic.tipo,
-                       ic.requisito_tipo, ic.requisito_valor, ic.xp_bonus, ic.rareza, ic.color_hex
-                FROM insignias_catalogo ic
-                WHERE ic.activo = TRUE
-                AND ic.id_insignia NOT IN (
-                    SELECT id_insignia FROM insignias_usuarios WHERE id_usuario = %s
-                )
-            ''', (id_usuario,))
-            
-            insignias_disponibles = cursor.fetchall()
-            
-            for insignia in insignias_disponibles:
-                id_insignia, nombre, descripcion, icono, tipo, req_tipo, req_valor, xp_bonus, rareza, color = insignia
-                cumple_requisito = False
-                
-                # Verificar según tipo de requisito
-                if req_tipo == 'nivel' and nivel >= req_valor:
-                    cumple_requisito = True
-                elif req_tipo == 'partidas' and partidas >= req_valor:
-                    cumple_requisito = True
-                elif req_tipo == 'racha' and racha >= req_valor:
-                    cumple_requisito = True
-                elif req_tipo == 'precision' and precision >= req_valor:
-                    cumple_requisito = True
-                elif req_tipo == 'velocidad' and tiempo > 0 and tiempo <= req_valor:
-                    cumple_requisito = True
+        # Obtener estadísticas del usuario
+        cursor.execute('''
+            SELECT e.nivel_actual, s.total_partidas_jugadas, s.racha_maxima, 
+                   s.precision_promedio, s.tiempo_promedio_respuesta
+            FROM experiencia_usuarios e
+            LEFT JOIN estadisticas_juego s ON e.id_usuario = s.id_usuario
+            WHERE e.id_usuario = %s
+        ''', (id_usuario,))
+        
+        stats = cursor.fetchone()
+        if not stats:
+            return []
+        
+        nivel, partidas, racha, precision, tiempo = stats
+        
+        # Valores predeterminados si no hay estadísticas
+        nivel = nivel or 1
+        partidas = partidas or 0
+        racha = racha or 0
+        precision = precision or 0
+        tiempo = tiempo or 0
+        
+        # Obtener insignias aún no desbloqueadas
+        cursor.execute('''
+            SELECT ic.id_insignia, ic.nombre, ic.descripcion, ic.icono, ic.tipo,
+                   ic.requisito_tipo, ic.requisito_valor, ic.xp_bonus, ic.rareza, ic.color_hex
+            FROM insignias_catalogo ic
+            WHERE ic.activo = TRUE
+            AND ic.id_insignia NOT IN (
+                SELECT id_insignia FROM insignias_usuarios WHERE id_usuario = %s
+            )
+        ''', (id_usuario,))
+        
+        insignias_disponibles = cursor.fetchall()
+        
+        for insignia in insignias_disponibles:
+            id_insignia, nombre, descripcion, icono, tipo, req_tipo, req_valor, xp_bonus, rareza, color = insignia
+            cumple_requisito = False
+            
+            # Verificar según tipo de requisito
+            if req_tipo == 'nivel' and nivel >= req_valor:
+                cumple_requisito = True
+            elif req_tipo == 'partidas' and partidas >= req_valor:
+                cumple_requisito = True
+            elif req_tipo == 'racha' and racha >= req_valor:
+                cumple_requisito = True
+            elif req_tipo == 'precision' and precision >= req_valor:
+                cumple_requisito = True
+            elif req_tipo == 'velocidad' and tiempo > 0 and tiempo <= req_valor:
+                cumple_requisito = True
+            
+            # Desbloquear si cumple
+            if cumple_requisito:
+                cursor.execute('''
+                    INSERT INTO insignias_usuarios (id_usuario, id_insignia)
+                    VALUES (%s, %s)
+                ''', (id_usuario, id_insignia))
                 
-                # Desbloquear si cumple
-                if cumple_requisito:
+                # Otorgar XP bonus
+                if xp_bonus > 0:
                     cursor.execute('''
-                        INSERT INTO insignias_usuarios (id_usuario, id_insignia)
-                        VALUES (%s, %s)
-                    ''', (id_usuario, id_insignia))
+                        INSERT INTO historial_xp (id_usuario, cantidad_xp, razon)
+                        VALUES (%s, %s, %s)
+                    ''', (id_usuario, xp_bonus, f'insignia_{nombre}'))
                     
-                    # Otorgar XP bonus
-                    if xp_bonus > 0:
-                        cursor.execute('''
-                            INSERT INTO historial_xp (id_usuario, cantidad_xp, razon)
-                            VALUES (%s, %s, %s)
-                        ''', (id_usuario, xp_bonus, f'insignia_{nombre}'))
-                        
-                        cursor.execute('''
-                            UPDATE experiencia_usuarios 
-                            SET xp_actual = xp_actual + %s, xp_total_acumulado = xp_total_acumulado + %s
-                            WHERE id_usuario = %s
-                        ''', (xp_bonus, xp_bonus, id_usuario))
-                    
-                    insignias_nuevas.append({
-                        'id': id_insignia,
-                        'nombre': nombre,
-                        'descripcion': descripcion,
-                        'icono': icono,
-                        'tipo': tipo,
-                        'xp_bonus': xp_bonus,
-                        'rareza': rareza,
-                        'color': color
-                    })
-            
-            conexion.commit()
-            return insignias_nuevas
+                    cursor.execute('''
+                        UPDATE experiencia_usuarios 
+                        SET xp_actual = xp_actual + %s, xp_total_acumulado = xp_total_acumulado + %s
+                        WHERE id_usuario = %s
+                    ''', (xp_bonus, xp_bonus, id_usuario))
+                
+                insignias_nuevas.append({
+                    'id': id_insignia,
+                    'nombre': nombre,
+                    'descripcion': descripcion,
+                    'icono': icono,
+                    'tipo': tipo,
+                    'xp_bonus': xp_bonus,
+                    'rareza': rareza,
+                    'color': color
+                })
+        
+        if cerrar_conexion:
+            conexion_local.commit()
+        return insignias_nuevas
     finally:
-        conexion.close()
+        if cerrar_conexion and conexion_local:
+            cursor.close()
+            conexion_local.close()
 
 def obtener_insignias_usuario(id_usuario):
     """
@@ -627,7 +664,7 @@ def obtener_ranking_global(limite=100):
     """
     Obtiene el ranking global de XP
     """
-    conexion = obtener_conexion()
+    conexion = obtener_conexion_lectura()
     try:
         with conexion.cursor() as cursor:
             cursor.execute('''
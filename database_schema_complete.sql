@@ -108,9 +108,12 @@ CREATE TABLE `salas_juego` (
   `pregunta_actual` INT DEFAULT '0',
   `total_preguntas` INT DEFAULT '0',
   `tiempo_inicio_juego` DATETIME DEFAULT NULL,
+  `avance_automatico` TINYINT(1) DEFAULT '0' COMMENT 'El servidor avanza al vencer el tiempo o responder todos',
+  `clave_partida` VARCHAR(32) DEFAULT NULL COMMENT 'Clave del mazo firmado de una partida individual',
   `fecha_creacion` DATETIME DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`id_sala`),
   UNIQUE KEY `UQ_salas_pin` (`pin_sala`),
+  UNIQUE KEY `UQ_salas_clave_partida` (`clave_partida`),
   CONSTRAINT `FK_salas_juego_id_cuestionario` FOREIGN KEY (`id_cuestionario`) REFERENCES `cuestionarios` (`id_cuestionario`) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
@@ -141,6 +144,7 @@ CREATE TABLE `participantes_sala` (
   `id_grupo` INT DEFAULT NULL,
   `fecha_union` DATETIME DEFAULT CURRENT_TIMESTAMP,
   `estado` VARCHAR(20) DEFAULT 'esperando' COMMENT 'esperando, jugando, finalizado, desconectado',
+  `ausente` TINYINT(1) NOT NULL DEFAULT '0' COMMENT 'Sin latidos en la sala de espera (conserva su plaza en el juego)',
   PRIMARY KEY (`id_participante`),
   CONSTRAINT `FK_participantes_sala_id_sala` FOREIGN KEY (`id_sala`) REFERENCES `salas_juego` (`id_sala`) ON DELETE CASCADE,
   CONSTRAINT `FK_participantes_sala_id_usuario` FOREIGN KEY (`id_usuario`) REFERENCES `usuarios` (`id_usuario`) ON DELETE SET NULL,
@@ -160,6 +164,7 @@ CREATE TABLE `estado_juego_sala` (
   `pregunta_actual` INT NOT NULL DEFAULT '0',
   `tiempo_inicio_pregunta` DATETIME DEFAULT NULL,
   `estado_pregunta` VARCHAR(20) DEFAULT 'esperando' COMMENT 'esperando, respondiendo, finalizada',
+  `mazo` MEDIUMTEXT DEFAULT NULL COMMENT 'Preguntas, opciones y clave fijadas al iniciar el juego (JSON)',
   PRIMARY KEY (`id_estado`),
   UNIQUE KEY `UK_estado_sala` (`id_sala`),
   CONSTRAINT `FK_estado_juego_id_sala` FOREIGN KEY (`id_sala`) REFERENCES `salas_juego` (`id_sala`) ON DELETE CASCADE
@@ -179,6 +184,7 @@ CREATE TABLE `respuestas_participantes` (
   `es_correcta` TINYINT(1) DEFAULT '0',
   `puntaje_obtenido` INT DEFAULT '0',
   `fecha_respuesta` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  `xp_liquidado` TINYINT(1) NOT NULL DEFAULT '0' COMMENT 'XP, estadísticas e insignias ya aplicados',
   PRIMARY KEY (`id_respuesta_participante`),
   UNIQUE KEY `UK_participante_pregunta` (`id_participante`,`id_sala`,`id_pregunta`),
   CONSTRAINT `FK_respuestas_part_participante` FOREIGN KEY (`id_participante`) REFERENCES `participantes_sala` (`id_participante`) ON DELETE CASCADE,
@@ -187,7 +193,8 @@ CREATE TABLE `respuestas_participantes` (
   CONSTRAINT `FK_respuestas_part_opcion` FOREIGN KEY (`id_opcion_seleccionada`) REFERENCES `opciones_respuesta` (`id_opcion`) ON DELETE SET NULL,
   INDEX `idx_respuestas_part_sala` (`id_sala`),
   INDEX `idx_respuestas_part_pregunta` (`id_pregunta`),
-  INDEX `idx_respuestas_part_tiempo` (`tiempo_respuesta`)
+  INDEX `idx_respuestas_part_tiempo` (`tiempo_respuesta`),
+  INDEX `idx_respuestas_xp_pendiente` (`xp_liquidado`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 -- ================================================================================
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Configuración de gunicorn para producción: gunicorn wsgi:app
+Workers gevent: cada petición es un greenlet, así las esperas largas y los
+flujos SSE no ocupan un hilo del sistema ni una conexión a la base de datos.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:5000'
+
+# Salas, clasificación, temporizadores, presencia, admisión y mazos viven en
+# memoria y se sincronizan por tiempo_real.bus: con el bus 'proceso' cada worker
+# tendría su propia copia, así que solo se admite un worker
+_bus_compartido = (os.environ.get('BUS_BACKEND') or 'proceso').lower() != 'proceso'
+if os.environ.get('GUNICORN_WORKERS'):
+    workers = int(os.environ['GUNICORN_WORKERS'])
+else:
+    workers = multiprocessing.cpu_count() * 2 + 1 if _bus_compartido else 1
+if workers > 1 and not _bus_compartido:
+    raise RuntimeError(
+        f'GUNICORN_WORKERS={workers} requiere BUS_BACKEND=broker (con BUS_BACKEND=proceso '
+        'cada worker tendría su propio estado de las salas)'
+    )
+worker_class = 'gevent'
+# Peticiones simultáneas por worker (incluye esperas largas y flujos SSE abiertos)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 1000)
+# Mayor que la espera larga (25 s) para no cortar peticiones sanas
+timeout = 60
+graceful_timeout = 30
+# Sin --preload: cada worker importa main ya parcheado por gevent y abre su
+# propio diario de ingesta; el maestro no mantiene conexiones ni hilos
+preload_app = False
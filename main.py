@@ -17,23 +17,32 @@ import json
 import random
 import traceback
 import re
+import threading
+from functools import wraps
 from io import BytesIO
 from datetime import datetime, timedelta
 
 # Flask y extensiones
 from flask import (
     Flask, render_template, request, redirect, url_for, flash, 
-    jsonify, Response, session, send_file, current_app, make_response
+    jsonify, Response, session, send_file, current_app, make_response, stream_with_context
 )
 from werkzeug.exceptions import InternalServerError
 from dotenv import load_dotenv
-from itsdangerous import URLSafeTimedSerializer
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 import pymysql.cursors
 import requests
 
+# Cargar variables de entorno (antes de importar los módulos que leen su configuración)
+load_dotenv()
+
 # Configuración y base de datos
 from config import config
-from bd import verificar_conexion, obtener_conexion, inicializar_usuarios_prueba
+from bd import (
+    verificar_conexion, obtener_conexion, obtener_conexion_lectura, inicializar_usuarios_prueba,
+    obtener_pool, obtener_enrutador_replica,
+    con_unidad_de_trabajo, cerrar_unidad_de_trabajo
+)
 from extensions import mail
 
 # Utilidades de autenticación
@@ -67,6 +76,12 @@ from controladores import (
 # APIs CRUD
 from api_crud import api_crud
 
+# Estado de juego en memoria e ingesta de respuestas
+from tiempo_real import (
+    admision, asignador_pines, bus, clasificacion, eventos, ingesta, liquidacion_xp, pines, presencia, temporizador,
+    versiones
+)
+
 # Verificar disponibilidad de MSAL para OneDrive
 try:
     import msal
@@ -76,9 +91,6 @@ except ImportError:
     print("⚠️  WARNING: msal no está instalado. La funcionalidad de OneDrive no estará disponible.")
     print("   Para instalar: pip install msal")
 
-# Cargar variables de entorno
-load_dotenv()
-
 # ==================== CONFIGURACIÓN DE LA APLICACIÓN ====================
 
 # Crear instancia de Flask
@@ -138,6 +150,7 @@ def fix_session():
         '/api/recompensas',
         '/api/otorgar_recompensas_automaticas',
         '/api/ranking-xp',
+        '/api/individual/',
         '/unirse-juego'
     ]
     
@@ -157,6 +170,12 @@ def fix_session():
         session['usuario_tipo'] = session['tipo_usuario']
 
 
+@app.teardown_request
+def cerrar_unidad_de_trabajo_pendiente(error=None):
+    """Confirma o deshace la unidad de trabajo que haya quedado abierta en la petición"""
+    cerrar_unidad_de_trabajo(error)
+
+
 # ==================== FUNCIONES HELPER ====================
 
 def es_sala_automatica(pin_sala):
@@ -186,6 +205,43 @@ def admin_required(f):
     return docente_required(f)
 
 
+# ==================== RESPUESTAS CONDICIONALES (ETag) ====================
+
+def respuesta_condicional(sala_id, recurso, generar):
+    """
+    Responde 304 sin cuerpo si el cliente ya tiene la versión actual de la sala
+    (If-None-Match); si no, genera la respuesta y le añade el ETag.
+
+    Args:
+        sala_id: ID de la sala
+        recurso: nombre del endpoint (forma parte de la etiqueta)
+        generar: función sin argumentos que produce la respuesta completa
+    """
+    etiqueta = versiones.etag(sala_id, recurso)
+    no_modificada = etiqueta in request.if_none_match
+    versiones.registrar_validacion(no_modificada)
+    if no_modificada:
+        respuesta = app.response_class(status=304)
+    else:
+        respuesta = make_response(generar())
+        if respuesta.status_code != 200:
+            return respuesta
+    respuesta.set_etag(etiqueta)
+    # El navegador guarda el cuerpo pero revalida en cada sondeo
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+
+def con_etag_sala(recurso):
+    """Decorador para rutas con sala_id: ver respuesta_condicional"""
+    def decorador(f):
+        @wraps(f)
+        def decorada(sala_id, *args, **kwargs):
+            return respuesta_condicional(sala_id, recurso, lambda: f(sala_id, *args, **kwargs))
+        return decorada
+    return decorador
+
+
 # ==================== FUNCIONES DE SALAS ====================
 
 def verificar_y_crear_tabla_salas():
@@ -232,6 +288,132 @@ def verificar_y_crear_tabla_salas():
             conexion.close()
         return False
 
+def verificar_columna_avance_automatico():
+    """
+    Añade la columna salas_juego.avance_automatico a las bases de datos creadas
+    antes de existir el avance automático de preguntas.
+    
+    Returns:
+        bool: True si la columna existe o se añadió, False en caso de error
+    """
+    try:
+        conexion = obtener_conexion()
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SHOW COLUMNS FROM salas_juego LIKE 'avance_automatico'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE salas_juego ADD COLUMN avance_automatico TINYINT(1) DEFAULT 0")
+                    conexion.commit()
+                    print("✅ Columna salas_juego.avance_automatico añadida")
+        finally:
+            conexion.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error al verificar la columna avance_automatico: {e}")
+        return False
+
+def verificar_columna_mazo_sala():
+    """
+    Añade la columna estado_juego_sala.mazo (copia del mazo fijada al iniciar el
+    juego, ver tiempo_real.mazos) a las bases de datos creadas antes de existir.
+    
+    Returns:
+        bool: True si la columna existe o se añadió, False en caso de error
+    """
+    try:
+        conexion = obtener_conexion()
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SHOW COLUMNS FROM estado_juego_sala LIKE 'mazo'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE estado_juego_sala ADD COLUMN mazo MEDIUMTEXT DEFAULT NULL")
+                    conexion.commit()
+                    print("✅ Columna estado_juego_sala.mazo añadida")
+        finally:
+            conexion.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error al verificar la columna mazo: {e}")
+        return False
+
+def verificar_columna_xp_liquidado():
+    """
+    Añade la columna respuestas_participantes.xp_liquidado (ver
+    tiempo_real.liquidacion_xp) a las bases de datos creadas antes de existir.
+    Las respuestas anteriores se dan por liquidadas.
+    
+    Returns:
+        bool: True si la columna existe o se añadió, False en caso de error
+    """
+    try:
+        conexion = obtener_conexion()
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SHOW COLUMNS FROM respuestas_participantes LIKE 'xp_liquidado'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE respuestas_participantes ADD COLUMN xp_liquidado TINYINT(1) NOT NULL DEFAULT 0")
+                    cursor.execute("UPDATE respuestas_participantes SET xp_liquidado = 1")
+                    cursor.execute("CREATE INDEX idx_respuestas_xp_pendiente ON respuestas_participantes (xp_liquidado)")
+                    conexion.commit()
+                    print("✅ Columna respuestas_participantes.xp_liquidado añadida")
+        finally:
+            conexion.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error al verificar la columna xp_liquidado: {e}")
+        return False
+
+def verificar_columna_ausente_participante():
+    """
+    Añade la columna participantes_sala.ausente (participantes en espera que
+    caducaron sin latidos, ver tiempo_real.presencia) a las bases de datos
+    creadas antes de existir.
+    
+    Returns:
+        bool: True si la columna existe o se añadió, False en caso de error
+    """
+    try:
+        conexion = obtener_conexion()
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SHOW COLUMNS FROM participantes_sala LIKE 'ausente'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE participantes_sala ADD COLUMN ausente TINYINT(1) NOT NULL DEFAULT 0")
+                    conexion.commit()
+                    print("✅ Columna participantes_sala.ausente añadida")
+        finally:
+            conexion.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error al verificar la columna ausente: {e}")
+        return False
+
+def verificar_columna_clave_partida():
+    """
+    Añade la columna salas_juego.clave_partida (clave del mazo firmado que
+    identifica una partida individual hasta que su sala existe) a las bases
+    de datos creadas antes de existir.
+    
+    Returns:
+        bool: True si la columna existe o se añadió, False en caso de error
+    """
+    try:
+        conexion = obtener_conexion()
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SHOW COLUMNS FROM salas_juego LIKE 'clave_partida'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE salas_juego ADD COLUMN clave_partida VARCHAR(32) DEFAULT NULL")
+                    cursor.execute("CREATE UNIQUE INDEX UQ_salas_clave_partida ON salas_juego (clave_partida)")
+                    conexion.commit()
+                    print("✅ Columna salas_juego.clave_partida añadida")
+        finally:
+            conexion.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error al verificar la columna clave_partida: {e}")
+        return False
+
 def crear_sala_simple(cuestionario_id):
     """
     Crea una sala de juego simple para un cuestionario.
@@ -243,37 +425,27 @@ def crear_sala_simple(cuestionario_id):
         tuple: (sala_id, pin_sala) si tiene éxito, (None, None) si falla
     """
     try:
-        print(f"DEBUG: crear_sala_simple - Iniciando con cuestionario_id: {cuestionario_id}")
-
         # Verificar que la tabla exista
         if not verificar_y_crear_tabla_salas():
             return None, None
 
-        pin_sala = str(random.randint(100000, 999999))
-        print(f"DEBUG: crear_sala_simple - PIN generado: {pin_sala}")
-
         conexion = obtener_conexion()
-        print(f"DEBUG: crear_sala_simple - Conexión obtenida: {conexion}")
-
         cursor = conexion.cursor()
         query = "INSERT INTO salas_juego (pin_sala, id_cuestionario, modo_juego, estado) VALUES (%s, %s, %s, %s)"
-        valores = (pin_sala, cuestionario_id, 'individual', 'esperando')
-        print(f"DEBUG: crear_sala_simple - Query: {query}")
-        print(f"DEBUG: crear_sala_simple - Valores: {valores}")
 
-        cursor.execute(query, valores)
-        conexion.commit()
-        sala_id = cursor.lastrowid
+        def insertar(pin_sala):
+            cursor.execute(query, (pin_sala, cuestionario_id, 'individual', 'esperando'))
+            return cursor.lastrowid
 
-        print(f"DEBUG: crear_sala_simple - Sala creada exitosamente con ID: {sala_id}")
+        # PIN de la reserva de tiempo_real.asignador_pines: un solo INSERT
+        pin_sala, sala_id = asignador_pines.insertar_con_pin('sala', insertar)
+        conexion.commit()
         conexion.close()
 
         return sala_id, pin_sala
 
     except Exception as e:
-        print(f"DEBUG: ERROR en crear_sala_simple: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        print(f"❌ Error al crear sala: {e}")
         if 'conexion' in locals():
             conexion.close()
         return None, None
@@ -1378,7 +1550,7 @@ def exportar_dashboard_docente_excel():
         ranking_global = controlador_ranking.obtener_ranking_global_por_docente(id_docente)
         
         # Obtener información del docente
-        conexion = obtener_conexion()
+        conexion = obtener_conexion_lectura()
         cursor = conexion.cursor()
         cursor.execute("""
             SELECT nombre, apellidos FROM usuarios WHERE id_usuario = %s
@@ -1500,7 +1672,7 @@ def exportar_dashboard_docente_onedrive():
         ranking_global = controlador_ranking.obtener_ranking_global_por_docente(id_docente)
         
         # Obtener información del docente
-        conexion = obtener_conexion()
+        conexion = obtener_conexion_lectura()
         cursor = conexion.cursor()
         cursor.execute("""
             SELECT nombre, apellidos, email FROM usuarios WHERE id_usuario = %s
@@ -1679,7 +1851,7 @@ def exportar_dashboard_docente_pdf():
         cuestionarios = obtener_cuestionarios_por_docente_simple(id_docente)
         
         # Obtener información del docente
-        conexion = obtener_conexion()
+        conexion = obtener_conexion_lectura()
         cursor = conexion.cursor()
         cursor.execute("""
             SELECT nombre, apellidos FROM usuarios WHERE id_usuario = %s
@@ -1842,39 +2014,8 @@ def historial_estudiante():
         return redirect(url_for('dashboard_admin'))
 
     try:
-        import pymysql.cursors
-        conexion = obtener_conexion()
-        cursor = conexion.cursor(pymysql.cursors.DictCursor)
-
         # Obtener historial del estudiante desde participantes_sala y ranking_sala
-        query = '''
-            SELECT
-                p.id_participante,
-                p.nombre_participante,
-                s.id_sala,
-                s.pin_sala,
-                s.estado as estado_sala,
-                c.titulo as titulo_cuestionario,
-                c.id_cuestionario,
-                s.total_preguntas,
-                s.fecha_creacion as fecha_inicio,
-                r.puntaje_total,
-                r.respuestas_correctas,
-                r.tiempo_total_respuestas,
-                r.posicion,
-                g.nombre_grupo
-            FROM participantes_sala p
-            INNER JOIN salas_juego s ON p.id_sala = s.id_sala
-            INNER JOIN cuestionarios c ON s.id_cuestionario = c.id_cuestionario
-            LEFT JOIN ranking_sala r ON p.id_participante = r.id_participante AND p.id_sala = r.id_sala
-            LEFT JOIN grupos_sala g ON p.id_grupo = g.id_grupo
-            WHERE p.id_usuario = %s
-            AND s.estado = 'finalizada'
-            ORDER BY s.fecha_creacion DESC
-        '''
-
-        cursor.execute(query, (session['usuario_id'],))
-        participaciones_raw = cursor.fetchall()
+        participaciones_raw = controlador_participaciones.obtener_participaciones_por_usuario(session['usuario_id'])
 
         # Procesar datos para calcular precisión y duración
         participaciones = []
@@ -1908,9 +2049,6 @@ def historial_estudiante():
                 'pin_sala': part['pin_sala']
             })
 
-        cursor.close()
-        conexion.close()
-
     except Exception as e:
         print(f"ERROR en historial_estudiante: {e}")
         import traceback
@@ -2179,6 +2317,29 @@ def otorgar_recompensas():
     """Otorgar recompensas"""
     return render_template('OtorgarRecompensas.html')
 
+@app.route('/admin/metricas')
+@login_required
+@admin_required
+def metricas_sistema():
+    """Métricas internas de rendimiento (pool de conexiones, etc.)"""
+    enrutador = obtener_enrutador_replica()
+    return jsonify({
+        'success': True,
+        'bd': obtener_pool().estadisticas(),
+        'ingesta': ingesta.estadisticas(),
+        'liquidacion_xp': liquidacion_xp.estadisticas(),
+        'eventos': eventos.estadisticas(),
+        'bus': bus.estadisticas(),
+        'clasificacion': clasificacion.estadisticas(),
+        'versiones': versiones.estadisticas(),
+        'temporizador': temporizador.estadisticas(),
+        'presencia': presencia.estadisticas(),
+        'admision': admision.estadisticas(),
+        'pines': pines.estadisticas(),
+        'asignador_pines': asignador_pines.estadisticas(),
+        'replica': enrutador.estadisticas() if enrutador else None
+    })
+
 
 # ==================== RUTAS DE SALAS Y JUEGO ====================
 
@@ -2257,21 +2418,8 @@ def unirse_sala_route(codigo):
         if not nombre_participante:
             raise ValueError("El nombre del participante es requerido")
 
-        # Buscar la sala por código
-        sala = controlador_salas.obtener_sala_por_codigo(codigo)
-        if not sala:
-            raise ValueError("Sala no encontrada")
-
-        if sala['estado'] != 'esperando':
-            raise ValueError("La sala no está disponible para unirse")
-
-        # Verificar límite de participantes
-        participantes_actuales = controlador_salas.obtener_participantes_sala(sala['id'])
-        if len(participantes_actuales) >= sala['max_participantes']:
-            raise ValueError("La sala ha alcanzado el límite de participantes")
-
-        # Agregar el participante a la sala
-        participante_id = controlador_salas.agregar_participante_sala(sala['id'], nombre_participante)
+        # Sala, estado, capacidad y repetidos se comprueban en memoria; la inserción va por lotes
+        sala, participante_id = admision.admitir(codigo, nombre_participante)
 
         session['participante_id'] = participante_id
         session['sala_id'] = sala['id']
@@ -2494,7 +2642,38 @@ def juego_sala(sala_id):
 
 # ==================== RUTAS DEL SISTEMA DE JUEGO EN TIEMPO REAL ====================
 
+# Tiempo máximo que una espera larga mantiene abierta la petición
+ESPERA_LARGA_MAX = 25
+
+@app.route('/api/sala/<int:sala_id>/esperar')
+def esperar_cambio_sala(sala_id):
+    """
+    Espera larga: mantiene la petición abierta hasta que cambie el estado de
+    juego de la sala (inicio, avance, fin) respecto a ?desde=<version>, o hasta
+    que venza el tiempo, y devuelve el estado actual con su nueva versión.
+    Sin ?desde responde en el acto. No usa la base de datos mientras espera.
+    """
+    try:
+        desde = request.args.get('desde', '')
+        espera = min(request.args.get('timeout', ESPERA_LARGA_MAX, type=float), ESPERA_LARGA_MAX)
+        version = versiones.esperar_cambio(sala_id, desde, max(0.0, espera))
+        instantanea = controlador_juego.obtener_instantanea_sala(sala_id)
+        if instantanea['estado'] is None:
+            return jsonify({'success': False, 'error': 'Sala no encontrada'}), 404
+
+        return jsonify({
+            'success': True,
+            'version': version,
+            'cambio': version != desde,
+            'estado': instantanea['estado'],
+            'pregunta': instantanea['pregunta']
+        })
+    except Exception as e:
+        print(f"ERROR esperar_cambio_sala: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/sala/<int:sala_id>/pregunta-actual')
+@con_etag_sala('pregunta-actual')
 def obtener_pregunta_actual(sala_id):
     """API para obtener la pregunta actual que se está mostrando"""
     try:
@@ -2503,17 +2682,7 @@ def obtener_pregunta_actual(sala_id):
         if not pregunta:
             return jsonify({'success': False, 'error': 'No hay pregunta activa'}), 404
 
-        # Obtener configuración de tiempo de la sala (por defecto 30 segundos)
-        conexion = obtener_conexion()
-        cursor = conexion.cursor()
-        cursor.execute("SELECT tiempo_por_pregunta FROM salas_juego WHERE id_sala = %s", (sala_id,))
-        resultado = cursor.fetchone()
-        tiempo_pregunta = resultado[0] if resultado and resultado[0] else 30
-        conexion.close()
-
-        # Agregar tiempo de pregunta a la respuesta
-        pregunta['tiempo_limite'] = tiempo_pregunta
-
+        # La pregunta ya incluye 'tiempo_limite' (tiempo_por_pregunta de la sala)
         return jsonify({
             'success': True,
             'pregunta': pregunta
@@ -2525,6 +2694,7 @@ def obtener_pregunta_actual(sala_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/sala/<int:sala_id>/responder', methods=['POST'])
+@con_unidad_de_trabajo
 def responder_pregunta_juego(sala_id):
     """Registra la respuesta de un participante a la pregunta actual"""
     try:
@@ -2565,12 +2735,56 @@ def responder_pregunta_juego(sala_id):
             'mensaje': 'Respuesta registrada. Esperando a que el docente avance.'
         })
 
+    except controlador_juego.RespuestaInvalidaError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"ERROR responder_pregunta_juego: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/sala/<int:sala_id>/xp')
+def obtener_xp_liquidado(sala_id):
+    """Entrega el XP e insignias ya liquidados de las respuestas del participante"""
+    participante_id = session.get('participante_id')
+    if not participante_id:
+        return jsonify({'success': False, 'error': 'No hay sesión de participante'}), 401
+
+    return jsonify({
+        'success': True,
+        'xp': liquidacion_xp.recoger(participante_id, sala_id)
+    })
+
+@app.route('/api/sala/<int:sala_id>/eventos')
+def eventos_sala(sala_id):
+    """
+    Flujo Server-Sent Events con los eventos de la sala
+    (participant_joined, participant_left, game_started, question_changed,
+    answer_count, ranking_updated, game_finished). Los clientes vuelven al sondeo si se corta.
+    """
+    suscripcion = eventos.suscribir(sala_id)
+
+    def generar():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                pendientes = suscripcion.esperar(15)
+                if suscripcion.cerrada:
+                    break
+                if not pendientes:
+                    yield ': ping\n\n'  # mantiene viva la conexión a través de proxies
+                    continue
+                for evento in pendientes:
+                    yield eventos.formatear_sse(evento)
+        finally:
+            eventos.cancelar(suscripcion)
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/sala/<int:sala_id>/siguiente-pregunta', methods=['POST'])
 def avanzar_pregunta(sala_id):
     """Avanza a la siguiente pregunta (docente o estudiante en modo individual)"""
@@ -2589,6 +2803,8 @@ def avanzar_pregunta(sala_id):
                 return jsonify({'success': False, 'error': 'No hay sesión de participante'}), 401
 
             # Verificar que el estudiante haya respondido la pregunta actual
+            # (con ingesta diferida, su respuesta puede seguir en la cola)
+            ingesta.vaciar()
             conexion = obtener_conexion()
             try:
                 with conexion.cursor() as cursor:
@@ -2612,24 +2828,14 @@ def avanzar_pregunta(sala_id):
                     id_cuestionario = estado_result[1]      # id_cuestionario
 
                     # Obtener el id_pregunta correspondiente al número de pregunta actual
-                    cursor.execute('''
-                        SELECT p.id_pregunta
-                        FROM cuestionario_preguntas cp
-                        JOIN preguntas p ON cp.id_pregunta = p.id_pregunta
-                        WHERE cp.id_cuestionario = %s
-                        ORDER BY cp.orden
-                        LIMIT %s, 1
-                    ''', (id_cuestionario, num_pregunta_actual - 1))
-
-                    pregunta_result = cursor.fetchone()
-                    if not pregunta_result:
+                    mazo = controlador_juego.obtener_mazo_sala(sala_id, id_cuestionario, cursor)
+                    id_pregunta_actual = mazo.id_pregunta(num_pregunta_actual)
+                    if not id_pregunta_actual:
                         return jsonify({
                             'success': False,
                             'error': 'No se pudo obtener la pregunta actual'
                         }), 500
 
-                    id_pregunta_actual = pregunta_result[0]  # id_pregunta
-
                     # Verificar si el estudiante respondió esta pregunta
                     cursor.execute('''
                         SELECT COUNT(*) as count
@@ -2661,16 +2867,49 @@ def avanzar_pregunta(sala_id):
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/sala/<int:sala_id>/avance-automatico', methods=['POST'])
+@login_required
+@docente_required
+def configurar_avance_automatico(sala_id):
+    """
+    Activa o desactiva el avance automático de la sala (JSON: {"activo": true|false}).
+    Con él activo el servidor pasa de pregunta al agotarse el tiempo o cuando
+    responden todos, y finaliza el juego tras la última.
+    """
+    try:
+        datos = request.get_json(silent=True) or {}
+        activo = bool(datos.get('activo'))
+        if not controlador_juego.configurar_avance_automatico(sala_id, activo):
+            return jsonify({'success': False, 'error': 'Sala no encontrada'}), 404
+        return jsonify({'success': True, 'avance_automatico': activo})
+    except Exception as e:
+        print(f"ERROR configurar_avance_automatico: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/sala/<int:sala_id>/ranking')
+@con_etag_sala('ranking')
 def obtener_ranking(sala_id):
-    """Obtiene el ranking actual de la sala"""
+    """
+    Obtiene el ranking actual de la sala (clasificación en memoria)
+    Parámetros opcionales: top=K (solo los K primeros) y participante=ID
+    (añade su posición y los `radio` vecinos por delante y por detrás)
+    """
     try:
-        ranking = controlador_juego.obtener_ranking_sala(sala_id)
+        top = request.args.get('top', type=int)
+        ranking = controlador_juego.obtener_ranking_sala(sala_id, top)
 
-        return jsonify({
+        respuesta = {
             'success': True,
             'ranking': ranking
-        })
+        }
+        participante_id = request.args.get('participante', type=int)
+        if participante_id:
+            respuesta['participante'] = controlador_juego.obtener_posicion_participante(
+                sala_id, participante_id, request.args.get('radio', 2, type=int)
+            )
+        return jsonify(respuesta)
     except Exception as e:
         print(f"ERROR obtener_ranking: {e}")
         import traceback
@@ -2693,6 +2932,29 @@ def obtener_estadisticas_pregunta(sala_id):
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/sala/<int:sala_id>/panel')
+@con_etag_sala('panel')
+def obtener_panel_sala(sala_id):
+    """
+    Panel de control del docente en una sola respuesta: pregunta actual,
+    estadísticas, detalle de respuestas y ranking.
+    ?campos=estadisticas,ranking devuelve solo esas secciones.
+    """
+    try:
+        campos = controlador_juego.CAMPOS_PANEL
+        if request.args.get('campos'):
+            campos = [c for c in request.args['campos'].split(',') if c in controlador_juego.CAMPOS_PANEL]
+
+        return jsonify({
+            'success': True,
+            'panel': controlador_juego.obtener_panel_control(sala_id, campos)
+        })
+    except Exception as e:
+        print(f"ERROR obtener_panel_sala: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/sala/<int:sala_id>/detalle-respuestas')
 def obtener_detalle_respuestas(sala_id):
     """Obtiene el detalle de qué estudiantes han respondido la pregunta actual"""
@@ -3010,6 +3272,7 @@ def esperar_juego(sala_id):
 # ========== APIs para actualizaciones en tiempo real ==========
 
 @app.route('/api/sala/<int:sala_id>/participantes')
+@con_etag_sala('participantes')
 def api_obtener_participantes(sala_id):
     """API para obtener lista de participantes en tiempo real"""
     try:
@@ -3039,7 +3302,40 @@ def api_obtener_participantes(sala_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/sala/<int:sala_id>/conteos')
+@con_etag_sala('conteos')
+def api_obtener_conteos_sala(sala_id):
+    """
+    Variante ligera de /participantes: solo contadores de participantes por
+    estado y de respuestas por pregunta, sin la lista. Se sirve desde memoria.
+    """
+    try:
+        participantes = controlador_salas.contar_participantes_por_estado(sala_id)
+        if participantes is None:
+            return jsonify({'success': False, 'error': 'Sala no encontrada'}), 404
+
+        return jsonify({
+            'success': True,
+            'participantes': participantes,
+            'respuestas': controlador_juego.obtener_conteos_respuestas(sala_id)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sala/<int:sala_id>/latido', methods=['POST'])
+def api_latido_participante(sala_id):
+    """
+    Latido de la sala de espera: mantiene al participante como conectado
+    (ver tiempo_real.presencia). No consulta MySQL si la sala está en memoria.
+    """
+    participante_id = session.get('participante_id')
+    if not participante_id or session.get('sala_id') != sala_id:
+        return jsonify({'success': False, 'error': 'No hay sesión de participante'}), 401
+
+    return jsonify({'success': True, 'presente': presencia.latido(sala_id, participante_id)})
+
 @app.route('/api/sala/<int:sala_id>/estado')
+@con_etag_sala('estado')
 def api_obtener_estado_sala(sala_id):
     """API para obtener el estado actual de la sala"""
     try:
@@ -3047,17 +3343,17 @@ def api_obtener_estado_sala(sala_id):
         if not sala:
             return jsonify({'success': False, 'error': 'Sala no encontrada'}), 404
 
-        participantes = controlador_salas.obtener_participantes_sala(sala_id)
+        total_participantes = controlador_salas.contar_participantes_sala(sala_id)
         
         # Asegurar que el estado siempre tenga un valor
         estado_actual = sala.get('estado') or 'esperando'
         
-        print(f"🔍 [API ESTADO] Sala {sala_id}: estado='{estado_actual}', participantes={len(participantes)}")
+        print(f"🔍 [API ESTADO] Sala {sala_id}: estado='{estado_actual}', participantes={total_participantes}")
 
         return jsonify({
             'success': True,
             'estado': estado_actual,
-            'total_participantes': len(participantes),
+            'total_participantes': total_participantes,
             'sala': {
                 'id': sala.get('id'),
                 'pin_sala': sala.get('pin_sala'),
@@ -3079,14 +3375,14 @@ def api_verificar_sala_por_pin(pin):
         if not pin or len(pin) != 6 or not pin.isdigit():
             return jsonify({'success': False, 'error': 'PIN inválido'}), 400
 
-        # Buscar sala por PIN
+        # Buscar sala por PIN (caché en memoria; sin consultas una vez cargada)
         sala = controlador_salas.obtener_sala_por_codigo(pin)
 
         if not sala:
             return jsonify({'success': False, 'error': 'No existe una sala con ese PIN'}), 404
 
-        # Obtener participantes actuales
-        participantes = controlador_salas.obtener_participantes_sala(sala['id'])
+        # Participantes actuales: contador que mantiene tiempo_real.presencia
+        participantes_actuales = controlador_salas.contar_participantes_sala(sala['id'])
 
         return jsonify({
             'success': True,
@@ -3096,7 +3392,7 @@ def api_verificar_sala_por_pin(pin):
                 'pin_sala': sala.get('pin_sala'),
                 'estado': sala.get('estado'),
                 'max_participantes': sala.get('max_participantes', 30),
-                'participantes_actuales': len(participantes)
+                'participantes_actuales': participantes_actuales
             }
         })
     except Exception as e:
@@ -3123,28 +3419,31 @@ def api_obtener_participantes_por_pin(pin):
             print(f"❌ Sala no encontrada con PIN: {pin}")
             return jsonify({'success': False, 'error': 'Sala no encontrada'}), 404
 
-        # Obtener participantes
-        participantes = controlador_salas.obtener_participantes_sala(sala['id'])
+        def generar():
+            # Obtener participantes
+            participantes = controlador_salas.obtener_participantes_sala(sala['id'])
+
+            print(f"✅ Participantes encontrados: {len(participantes)}")
+
+            # Formatear participantes para el frontend
+            participantes_formateados = []
+            for p in participantes:
+                participantes_formateados.append({
+                    'id': p['id_participante'],
+                    'nombre': p['nombre_participante'],
+                    'estado': p['estado'],
+                    'fecha_union': p['fecha_union'].isoformat() if p['fecha_union'] else None,
+                    'id_grupo': p.get('id_grupo'),  # ID del grupo si está asignado
+                    'nombre_grupo': p.get('nombre_grupo')  # Nombre del grupo si está asignado
+                })
 
-        print(f"✅ Participantes encontrados: {len(participantes)}")
-
-        # Formatear participantes para el frontend
-        participantes_formateados = []
-        for p in participantes:
-            participantes_formateados.append({
-                'id': p['id_participante'],
-                'nombre': p['nombre_participante'],
-                'estado': p['estado'],
-                'fecha_union': p['fecha_union'].isoformat() if p['fecha_union'] else None,
-                'id_grupo': p.get('id_grupo'),  # ID del grupo si está asignado
-                'nombre_grupo': p.get('nombre_grupo')  # Nombre del grupo si está asignado
+            return jsonify({
+                'success': True,
+                'participantes': participantes_formateados,
+                'total': len(participantes_formateados)
             })
 
-        return jsonify({
-            'success': True,
-            'participantes': participantes_formateados,
-            'total': len(participantes_formateados)
-        })
+        return respuesta_condicional(sala['id'], 'participantes-pin', generar)
 
     except Exception as e:
         print(f"❌ ERROR en api_obtener_participantes_por_pin: {e}")
@@ -3183,47 +3482,16 @@ def unirse_juego():
             print(f"❌ Error: PIN inválido (longitud: {len(pin_sala)})")
             return jsonify({'success': False, 'error': 'El PIN debe ser de 6 dígitos'}), 400
 
-        # Buscar la sala por PIN
-        print(f"🔍 Buscando sala con PIN: {pin_sala}")
-        sala = controlador_salas.obtener_sala_por_codigo(pin_sala)
-        print(f"📋 Sala encontrada: {sala}")
-
-        if not sala:
-            print(f"❌ Error: No se encontró sala con PIN {pin_sala}")
-            return jsonify({'success': False, 'error': 'Sala no encontrada. Verifica el PIN'}), 404
-
-        print(f"✅ Sala encontrada - ID: {sala['id']}, Estado: {sala['estado']}")
-
-        # Verificar que la sala está en estado 'esperando'
-        if sala['estado'] != 'esperando':
-            if sala['estado'] == 'en_curso':
-                return jsonify({'success': False, 'error': 'La sala ya está en curso. No puedes unirte'}), 400
-            elif sala['estado'] == 'finalizada':
-                return jsonify({'success': False, 'error': 'La sala ha finalizado'}), 400
-            else:
-                return jsonify({'success': False, 'error': f'La sala no está disponible (estado: {sala["estado"]}'}), 400
-
-        # Verificar límite de participantes
-        print(f"📊 Obteniendo participantes actuales de sala {sala['id']}...")
-        participantes_actuales = controlador_salas.obtener_participantes_sala(sala['id'])
-        max_participantes = sala.get('max_participantes') or 30  # Default 30 si es None
-
-        print(f"👥 Participantes actuales: {len(participantes_actuales)}/{max_participantes}")
-        print(f"   Lista: {participantes_actuales}")
-
-        if max_participantes and len(participantes_actuales) >= max_participantes:
-            print(f"❌ Error: Sala llena")
-            return jsonify({'success': False, 'error': f'La sala está llena ({max_participantes} participantes máximo)'}), 400
-
-        # Agregar el participante a la sala
+        # Sala, estado, capacidad y repetidos se comprueban en memoria (tiempo_real.admision);
+        # la inserción se escribe junto con las demás uniones que llegan a la vez
         id_usuario = session.get('usuario_id')  # Si está logueado
-        print(f"➕ Agregando participante: {nombre_estudiante} (usuario_id: {id_usuario})")
+        print(f"➕ Admitiendo participante: {nombre_estudiante} (usuario_id: {id_usuario}) en sala con PIN {pin_sala}")
 
         try:
-            participante_id = controlador_salas.agregar_participante_sala(sala['id'], nombre_estudiante, id_usuario)
-        except ValueError as ve:
-            print(f"❌ Error al agregar: {ve}")
-            return jsonify({'success': False, 'error': str(ve)}), 400
+            sala, participante_id = admision.admitir(pin_sala, nombre_estudiante, id_usuario)
+        except admision.Rechazo as rechazo:
+            print(f"❌ Unión rechazada: {rechazo}")
+            return jsonify({'success': False, 'error': str(rechazo)}), rechazo.codigo
 
         print(f"✅ Participante agregado exitosamente!")
         print(f"   - ID Participante: {participante_id}")
@@ -5169,105 +5437,99 @@ def obtener_salas_por_cuestionario(cuestionario_id):
 @app.route('/jugar-individual/<int:cuestionario_id>', methods=['POST'])
 @login_required
 def jugar_individual(cuestionario_id):
-    """Crear una sala automática individual para que el estudiante juegue solo"""
-    try:
-        if session.get('usuario_tipo') != 'estudiante':
-            return jsonify({'success': False, 'error': 'Solo estudiantes pueden jugar en modo individual'}), 403
-
-        import random
-        import string
-        import pymysql.cursors
-
-        conexion = obtener_conexion()
-        cursor = conexion.cursor(pymysql.cursors.DictCursor)
-
-        # Verificar que el cuestionario existe y está publicado
-        cursor.execute('''
-            SELECT id_cuestionario, titulo
-            FROM cuestionarios
-            WHERE id_cuestionario = %s AND estado = 'publicado'
-        ''', (cuestionario_id,))
-
-        cuestionario = cursor.fetchone()
-        if not cuestionario:
-            cursor.close()
-            conexion.close()
-            return jsonify({'success': False, 'error': 'Cuestionario no encontrado o no está publicado'}), 404
-
-        # Obtener preguntas del cuestionario
-        cursor.execute('''
-            SELECT COUNT(*) as total
-            FROM cuestionario_preguntas
-            WHERE id_cuestionario = %s
-        ''', (cuestionario_id,))
-
-        total_preguntas = cursor.fetchone()['total']
-
-        if total_preguntas == 0:
-            cursor.close()
-            conexion.close()
-            return jsonify({'success': False, 'error': 'El cuestionario no tiene preguntas'}), 400
-
-        # Generar PIN único de 8 caracteres alfanuméricos (para modo automático/individual)
-        # Formato: AUTO-XXXX donde X son letras y números
-        while True:
-            codigo_aleatorio = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-            pin_sala = f'AUTO{codigo_aleatorio}'
-            cursor.execute('SELECT id_sala FROM salas_juego WHERE pin_sala = %s', (pin_sala,))
-            if not cursor.fetchone():
-                break
-
-        # Crear sala automática en modo individual
-        cursor.execute('''
-            INSERT INTO salas_juego
-            (id_cuestionario, pin_sala, estado, modo_juego, total_preguntas, fecha_creacion, grupos_habilitados, num_grupos)
-            VALUES (%s, %s, 'en_curso', 'individual', %s, NOW(), 0, 0)
-        ''', (cuestionario_id, pin_sala, total_preguntas))
-
-        id_sala = cursor.lastrowid
-
-        # Crear participante automáticamente
-        nombre_participante = f"{session['usuario_nombre']} {session['usuario_apellidos']}"
-        cursor.execute('''
-            INSERT INTO participantes_sala
-            (id_sala, id_usuario, nombre_participante, estado, fecha_union)
-            VALUES (%s, %s, %s, 'jugando', NOW())
-        ''', (id_sala, session['usuario_id'], nombre_participante))
+    """
+    Ruta anterior del modo individual. Ya no crea la sala: redirige a la
+    pantalla de juego individual, que la crea con el primer lote de respuestas.
+    """
+    if session.get('usuario_tipo') != 'estudiante':
+        return jsonify({'success': False, 'error': 'Solo estudiantes pueden jugar en modo individual'}), 403
 
-        id_participante = cursor.lastrowid
+    return jsonify({
+        'success': True,
+        'redirect': url_for('juego_individual', cuestionario_id=cuestionario_id)
+    })
 
-        # Crear entrada en ranking_sala
-        cursor.execute('''
-            INSERT INTO ranking_sala
-            (id_participante, id_sala, puntaje_total, respuestas_correctas, tiempo_total_respuestas, posicion)
-            VALUES (%s, %s, 0, 0, 0, 1)
-        ''', (id_participante, id_sala))
+# Modo individual evaluado en el navegador: un solo mazo firmado y las
+# respuestas en lotes (ver controlador_juego, sección MODO INDIVIDUAL)
+MAZO_INDIVIDUAL_SALT = 'mazo-individual'
+# Horas que un mazo firmado admite respuestas
+MAZO_INDIVIDUAL_VIGENCIA = 6 * 3600
 
-        # Crear estado del juego (empezar en pregunta 1)
-        cursor.execute('''
-            INSERT INTO estado_juego_sala
-            (id_sala, pregunta_actual, estado_pregunta, tiempo_inicio_pregunta)
-            VALUES (%s, 1, 'mostrando', NOW())
-        ''', (id_sala,))
+@app.route('/juego-individual/<int:cuestionario_id>')
+@login_required
+def juego_individual(cuestionario_id):
+    """Pantalla de juego individual: el estudiante responde a su ritmo"""
+    if session.get('usuario_tipo') != 'estudiante':
+        flash('Solo estudiantes pueden jugar en modo individual', 'error')
+        return redirect(url_for('dashboard_estudiante'))
+    return render_template('JuegoIndividual.html', cuestionario_id=cuestionario_id)
 
-        conexion.commit()
-        cursor.close()
-        conexion.close()
+@app.route('/api/individual/<int:cuestionario_id>/mazo', methods=['POST'])
+@login_required
+def api_mazo_individual(cuestionario_id):
+    """Entrega todas las preguntas de la partida (sin respuestas) y su firma"""
+    try:
+        if session.get('usuario_tipo') != 'estudiante':
+            return jsonify({'success': False, 'error': 'Solo estudiantes pueden jugar en modo individual'}), 403
 
-        # Guardar en sesión
-        session['sala_actual'] = id_sala
-        session['participante_id'] = id_participante
+        partida = controlador_juego.preparar_partida_individual(cuestionario_id, session['usuario_id'])
+        if partida is None:
+            return jsonify({'success': False, 'error': 'Cuestionario no encontrado, no publicado o sin preguntas'}), 404
 
+        mazo, datos = partida
         return jsonify({
             'success': True,
-            'message': 'Sala individual creada exitosamente',
-            'sala_id': id_sala,
-            'pin_sala': pin_sala,
-            'redirect': url_for('juego_estudiante', sala_id=id_sala)
+            'mazo': mazo,
+            'firma': serializer.dumps(datos, salt=MAZO_INDIVIDUAL_SALT)
         })
+    except Exception as e:
+        print(f"ERROR api_mazo_individual: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/individual/respuestas', methods=['POST'])
+@login_required
+def api_respuestas_individuales():
+    """
+    Recibe un lote de respuestas de una partida individual:
+    {firma, respuestas: [{numero_pregunta, id_opcion, tiempo_respuesta}], final}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            datos, emitido_en = serializer.loads(
+                data.get('firma') or '', salt=MAZO_INDIVIDUAL_SALT,
+                max_age=MAZO_INDIVIDUAL_VIGENCIA, return_timestamp=True
+            )
+        except BadSignature:
+            return jsonify({'success': False, 'error': 'La partida no es válida o ha caducado'}), 400
+
+        respuestas = data.get('respuestas') or []
+        if not isinstance(respuestas, list):
+            return jsonify({'success': False, 'error': 'Formato de respuestas inválido'}), 400
+
+        final = bool(data.get('final'))
+        resultado = controlador_juego.registrar_respuestas_individuales(
+            datos,
+            emitido_en.timestamp(),
+            session['usuario_id'],
+            f"{session['usuario_nombre']} {session['usuario_apellidos']}",
+            respuestas,
+            final
+        )
 
+        if final:
+            session['sala_actual'] = resultado['sala_id']
+            session['participante_id'] = resultado['participante_id']
+            resultado['redirect'] = url_for('ver_resultados_juego', sala_id=resultado['sala_id'])
+
+        return jsonify({'success': True, **resultado})
+
+    except controlador_juego.PartidaIndividualError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.codigo
     except Exception as e:
-        print(f"ERROR en jugar_individual: {e}")
+        print(f"ERROR api_respuestas_individuales: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -5495,8 +5757,7 @@ def api_iniciar_juego_sala(sala_id):
             return jsonify({'success': False, 'error': 'Sala no encontrada'}), 404
 
         # Verificar que hay usuarios conectados
-        usuarios = controlador_salas.obtener_participantes_sala(sala_id)
-        if not usuarios or len(usuarios) == 0:
+        if controlador_salas.contar_participantes_sala(sala_id) == 0:
             return jsonify({'success': False, 'error': 'No hay estudiantes conectados'}), 400
 
         # Iniciar juego usando el controlador (esto establece estado 'en_curso')
@@ -6917,6 +7178,44 @@ def perfil():
     conexion.close()
     return render_template('MiPerfil.html', usuario=usuario)
 
+# ==================== ARRANQUE DEL PROCESO ====================
+# Se ejecuta al importar este módulo, también bajo gunicorn/uwsgi (una vez por
+# proceso que importa main; con --preload, el maestro)
+
+try:
+    # Respuestas aceptadas que un proceso caído no llegó a escribir en MySQL
+    ingesta.recuperar()
+except Exception as e:
+    print(f"⚠️ No se pudieron recuperar los diarios de respuestas (lo reintentará la ingesta): {e}")
+
+# Migraciones de salas_juego.avance_automatico, estado_juego_sala.mazo,
+# respuestas_participantes.xp_liquidado, participantes_sala.ausente y
+# salas_juego.clave_partida: las consultas del juego leen las columnas, así que
+# se aseguran antes de atender peticiones. Si la base de datos no responde al
+# importar, se reintenta en las siguientes peticiones.
+def _verificar_columnas_juego():
+    avance = verificar_columna_avance_automatico()
+    mazo = verificar_columna_mazo_sala()
+    xp = verificar_columna_xp_liquidado()
+    ausente = verificar_columna_ausente_participante()
+    clave = verificar_columna_clave_partida()
+    return avance and mazo and xp and ausente and clave
+
+_columnas_juego_listas = _verificar_columnas_juego()
+_columnas_juego_lock = threading.Lock()
+
+@app.before_request
+def asegurar_columnas_juego():
+    global _columnas_juego_listas
+    if _columnas_juego_listas:
+        return
+    with _columnas_juego_lock:
+        if not _columnas_juego_listas:
+            _columnas_juego_listas = _verificar_columnas_juego()
+
+# XP de respuestas confirmadas que un proceso anterior no llegó a liquidar
+liquidacion_xp.iniciar()
+
 if __name__ == '__main__':
     # Verificar conexión e inicializar usuarios de prueba
     print("Iniciando Brain RUSH...")
@@ -0,0 +1,54 @@
+/**
+ * Eventos en tiempo real de una sala (Server-Sent Events)
+ * Se conecta a /api/sala/<id>/eventos y llama al manejador de cada tipo de evento.
+ * Mientras `conectado` es true las páginas pueden saltarse su sondeo periódico;
+ * si el navegador no soporta EventSource o la conexión se corta, el sondeo
+ * sigue funcionando como respaldo.
+ */
+
+/**
+ * @param {number} salaId - ID de la sala
+ * @param {Object} manejadores - { tipo_evento: function(datos) }, más
+ *        `alReconectar` (opcional) para refrescar el estado tras un corte
+ * @returns {{conectado: boolean, cerrar: function}}
+ */
+function suscribirEventosSala(salaId, manejadores = {}) {
+    const suscripcion = { conectado: false, cerrar: () => {} };
+    if (!window.EventSource) return suscripcion;
+
+    const fuente = new EventSource(`/api/sala/${salaId}/eventos`);
+    let huboCorte = false;
+
+    fuente.onopen = () => {
+        suscripcion.conectado = true;
+        if (huboCorte && manejadores.alReconectar) {
+            manejadores.alReconectar();
+        }
+        huboCorte = false;
+    };
+
+    // EventSource reintenta solo; mientras tanto se vuelve al sondeo
+    fuente.onerror = () => {
+        suscripcion.conectado = false;
+        huboCorte = true;
+    };
+
+    Object.entries(manejadores).forEach(([tipo, manejador]) => {
+        if (tipo === 'alReconectar') return;
+        fuente.addEventListener(tipo, (evento) => {
+            let datos = {};
+            try {
+                datos = JSON.parse(evento.data);
+            } catch (error) {
+                console.error('Evento de sala con datos inválidos:', error);
+            }
+            manejador(datos);
+        });
+    });
+
+    suscripcion.cerrar = () => {
+        suscripcion.conectado = false;
+        fuente.close();
+    };
+    return suscripcion;
+}
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Admisión de participantes por lotes (avalanchas de uniones)
+Cuando el docente muestra el PIN, decenas o cientos de estudiantes se unen en
+pocos segundos. Cada unión pasa por aquí:
+
+1. PIN y estado de la sala se comprueban contra la caché de tiempo_real.pines.
+2. Repetidos y capacidad se comprueban contra tiempo_real.presencia y las
+   plazas reservadas en memoria, todo bajo un único lock: la reserva de la
+   plaza es atómica y max_participantes se respeta sin leer la lista.
+3. La inserción se encola; un hilo junta las que llegan en ADMISION_ESPERA_MS
+   (hasta ADMISION_LOTE_MAX) y las escribe en una sola transacción con la
+   función registrada con @escritor. La petición espera su resultado.
+4. El escritor bloquea las filas de las salas y vuelve a comprobar estado y
+   capacidad en MySQL antes de insertar: es la comprobación que ven todos los
+   procesos de servidor. Las uniones que ya no caben se devuelven como Rechazo.
+
+Si un lote falla, sus uniones se reintentan una a una para que un error no
+rechace a todo el lote. Una unión que agota ESPERA_MAXIMA en la cola se retira
+sin escribirse; si su lote ya se está escribiendo, espera el resultado.
+
+Con varios procesos de servidor las plazas se reservan por proceso y la
+comprobación en memoria es solo un filtro rápido; la capacidad la garantiza
+el paso 4, que serializa las escrituras de cada sala con el bloqueo de su fila.
+"""
+
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+from tiempo_real import pines, presencia
+
+LOTE_MAX = int(os.environ.get('ADMISION_LOTE_MAX') or 50)
+ESPERA_MS = float(os.environ.get('ADMISION_ESPERA_MS') or 5)
+# Tiempo máximo que una petición espera a que se escriba su lote
+ESPERA_MAXIMA = 10
+MAX_PARTICIPANTES_POR_DEFECTO = 30
+
+
+class Rechazo(ValueError):
+    """Unión rechazada; el mensaje se muestra al estudiante"""
+
+    def __init__(self, mensaje, codigo=400):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+def rechazo_por_estado(estado):
+    """Rechazo para una sala que ya no está esperando participantes"""
+    if estado == 'en_curso':
+        return Rechazo('La sala ya está en curso. No puedes unirte')
+    if estado == 'finalizada':
+        return Rechazo('La sala ha finalizado')
+    return Rechazo(f"La sala no está disponible (estado: {estado})")
+
+
+def rechazo_por_capacidad(max_participantes):
+    """Rechazo para una sala sin plazas libres"""
+    return Rechazo(f'La sala está llena ({max_participantes} participantes máximo)')
+
+
+Solicitud = namedtuple('Solicitud', ('sala_id', 'nombre_participante', 'id_usuario', 'fecha_union'))
+
+
+class _Pendiente:
+    """Solicitud encolada y su resultado"""
+
+    __slots__ = ('solicitud', 'evento', 'participante_id', 'error')
+
+    def __init__(self, solicitud):
+        self.solicitud = solicitud
+        self.evento = threading.Event()
+        self.participante_id = None
+        self.error = None
+
+
+_reservas = {}  # sala_id -> claves de las uniones en vuelo
+_cola = deque()
+_cond = threading.Condition()
+_lock = threading.Lock()
+_escribir = None
+_hilo = None
+_metricas = {
+    'admitidas': 0, 'rechazadas': 0, 'escritas': 0, 'lotes': 0, 'lote_max': 0,
+    'reintentos_individuales': 0, 'errores': 0,
+    'total_escritura_ms': 0.0
+}
+
+
+def escritor(funcion):
+    """
+    Registra la función que inserta un lote de Solicitud en una transacción
+    y devuelve la lista paralela de resultados: el id_participante insertado
+    o el Rechazo de la unión si la sala ya no la admite
+    """
+    global _escribir
+    _escribir = funcion
+    return funcion
+
+
+def _clave(nombre_participante, id_usuario):
+    return ('usuario', id_usuario) if id_usuario else ('nombre', nombre_participante)
+
+
+def admitir(pin, nombre_participante, id_usuario=None):
+    """
+    Admite a un participante en la sala del PIN
+
+    Args:
+        pin: PIN de la sala
+        nombre_participante: Nombre a mostrar
+        id_usuario: ID del estudiante si inició sesión
+
+    Returns:
+        (sala, participante_id); sala es el diccionario de obtener_sala_por_codigo
+
+    Raises:
+        Rechazo: sala inexistente, no disponible, llena o participante repetido
+    """
+    sala = pines.obtener(pin)
+    if sala is None:
+        _rechazar()
+        raise Rechazo('Sala no encontrada. Verifica el PIN', 404)
+
+    if sala['estado'] != 'esperando':
+        _rechazar()
+        raise rechazo_por_estado(sala['estado'])
+
+    # Carga la presencia de la sala fuera del lock (solo la primera vez)
+    presencia.contar(sala['id'])
+    max_participantes = sala.get('max_participantes') or MAX_PARTICIPANTES_POR_DEFECTO
+    clave = _clave(nombre_participante, id_usuario)
+    with _lock:
+        reservas = _reservas.setdefault(sala['id'], set())
+        if clave in reservas or presencia.repetido(sala['id'], nombre_participante, id_usuario):
+            _metricas['rechazadas'] += 1
+            raise Rechazo('El participante ya está en la sala')
+        # Una reserva cuyo participante ya se anotó en presencia no se cuenta dos veces
+        en_vuelo = sum(1 for tipo, valor in reservas
+                       if not presencia.repetido(sala['id'], valor if tipo == 'nombre' else None,
+                                                 valor if tipo == 'usuario' else None))
+        if presencia.contar(sala['id']) + en_vuelo >= max_participantes:
+            _metricas['rechazadas'] += 1
+            raise rechazo_por_capacidad(max_participantes)
+        reservas.add(clave)
+
+    try:
+        pendiente = _Pendiente(Solicitud(
+            sala['id'], nombre_participante, id_usuario, datetime.now().replace(microsecond=0)
+        ))
+        with _cond:
+            _cola.append(pendiente)
+            _cond.notify()
+        _asegurar_hilo()
+        if not pendiente.evento.wait(ESPERA_MAXIMA):
+            with _cond:
+                try:
+                    _cola.remove(pendiente)
+                    en_cola = True
+                except ValueError:
+                    en_cola = False
+            if en_cola:
+                # Retirada antes de escribirse: la unión no existe y puede reintentarse
+                raise RuntimeError('Tiempo de espera agotado al registrar la unión')
+            # Su lote ya se está escribiendo: se conserva la reserva hasta saber
+            # el resultado, para no dejar un participante fantasma ni duplicarlo
+            pendiente.evento.wait()
+        if pendiente.error is not None:
+            raise pendiente.error
+    finally:
+        # La plaza ya cuenta en presencia (o la unión falló): se libera la reserva
+        with _lock:
+            reservas.discard(clave)
+            if not reservas and _reservas.get(sala['id']) is reservas:
+                del _reservas[sala['id']]
+
+    with _lock:
+        _metricas['admitidas'] += 1
+    return sala, pendiente.participante_id
+
+
+def _rechazar():
+    with _lock:
+        _metricas['rechazadas'] += 1
+
+
+def _asignar(pendiente, resultado):
+    if isinstance(resultado, Rechazo):
+        pendiente.error = resultado
+        _rechazar()
+    else:
+        pendiente.participante_id = resultado
+
+
+def _escribir_lote(lote):
+    inicio = time.perf_counter()
+    try:
+        resultados = _escribir([p.solicitud for p in lote])
+        for pendiente, resultado in zip(lote, resultados):
+            _asignar(pendiente, resultado)
+    except Exception as e:
+        print(f"⚠️ [ADMISION] Lote de {len(lote)} uniones falló ({e}); se reintentan una a una")
+        with _lock:
+            _metricas['errores'] += 1
+        for pendiente in lote:
+            try:
+                _asignar(pendiente, _escribir([pendiente.solicitud])[0])
+                with _lock:
+                    _metricas['reintentos_individuales'] += 1
+            except Exception as error:
+                pendiente.error = error
+    finally:
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        with _lock:
+            _metricas['lotes'] += 1
+            _metricas['escritas'] += len(lote)
+            _metricas['lote_max'] = max(_metricas['lote_max'], len(lote))
+            _metricas['total_escritura_ms'] += duracion_ms
+        for pendiente in lote:
+            pendiente.evento.set()
+
+
+def _bucle():
+    while True:
+        with _cond:
+            while not _cola:
+                _cond.wait()
+        # Dar tiempo a que lleguen más uniones y escribirlas juntas
+        if len(_cola) < LOTE_MAX:
+            time.sleep(ESPERA_MS / 1000)
+        with _cond:
+            lote = [_cola.popleft() for _ in range(min(LOTE_MAX, len(_cola)))]
+        if lote:
+            _escribir_lote(lote)
+
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is not None:
+        return
+    with _cond:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='admision-participantes', daemon=True)
+            _hilo.start()
+
+
+def estadisticas():
+    with _lock:
+        lotes = _metricas['lotes']
+        return {
+            'en_cola': len(_cola),
+            'reservas_en_vuelo': sum(len(r) for r in _reservas.values()),
+            'admitidas': _metricas['admitidas'],
+            'rechazadas': _metricas['rechazadas'],
+            'lotes': lotes,
+            'lote_promedio': round(_metricas['escritas'] / lotes, 1) if lotes else 0.0,
+            'lote_max': _metricas['lote_max'],
+            'escritura_promedio_ms': round(_metricas['total_escritura_ms'] / lotes, 2) if lotes else 0.0,
+            'reintentos_individuales': _metricas['reintentos_individuales'],
+            'errores': _metricas['errores']
+        }
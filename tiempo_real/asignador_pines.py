@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Asignación de PIN para salas nuevas
+Antes, cada sala nueva probaba PIN al azar con un SELECT por intento hasta dar
+con uno libre; cuantas más salas hay, más intentos. Aquí cada espacio de PIN
+tiene una reserva de códigos ya comprobados como libres:
+
+    sala  6 dígitos (100000-999999), salas con docente
+    auto  AUTO + 4 letras o dígitos, salas automáticas (modo individual)
+
+Un hilo rellena la reserva cuando baja de PINES_RESERVA_MIN, hasta
+PINES_RESERVA_MAX, comprobando todos los candidatos en una sola consulta con
+la función registrada con @comprobador. Crear una sala es entonces un solo
+INSERT (insertar_con_pin). Si la reserva está vacía (arranque), la petición
+la rellena ella misma con una sola comprobación.
+
+Los PIN de las salas eliminadas vuelven a la reserva (mensaje sala_eliminada
+con el PIN en sus datos). Las salas finalizadas conservan su PIN: pin_sala es
+único en salas_juego y el historial sigue apuntando a esa fila.
+
+Con varios procesos de servidor cada uno tiene su reserva; si dos toman el
+mismo PIN, el INSERT del segundo falla por clave duplicada e insertar_con_pin
+lo repite con el siguiente.
+"""
+
+import os
+import random
+import string
+import threading
+from collections import deque
+
+from tiempo_real import bus
+
+RESERVA_MIN = int(os.environ.get('PINES_RESERVA_MIN') or 20)
+RESERVA_MAX = int(os.environ.get('PINES_RESERVA_MAX') or 100)
+# Intentos de INSERT por sala ante PIN duplicados
+REINTENTOS = 5
+# Código de MySQL para clave duplicada
+ER_DUP_ENTRY = 1062
+
+_ALFANUMERICO = string.ascii_uppercase + string.digits
+_GENERADORES = {
+    'sala': lambda aleatorio: str(aleatorio.randint(100000, 999999)),
+    'auto': lambda aleatorio: 'AUTO' + ''.join(aleatorio.choices(_ALFANUMERICO, k=4))
+}
+
+_reservas = {espacio: deque() for espacio in _GENERADORES}
+_lock = threading.Lock()
+_cond = threading.Condition(_lock)
+_aleatorio = random.SystemRandom()
+_comprobar = None
+_hilo = None
+_metricas = {
+    'asignados': 0, 'recargas': 0, 'recargas_en_peticion': 0, 'candidatos': 0,
+    'ocupados': 0, 'reciclados': 0, 'colisiones': 0
+}
+
+
+def comprobador(funcion):
+    """
+    Registra la función que recibe una lista de PIN candidatos y devuelve
+    el conjunto de los que ya usa alguna sala (una sola consulta)
+    """
+    global _comprobar
+    _comprobar = funcion
+    return funcion
+
+
+def espacio_de(pin):
+    """Espacio al que pertenece un PIN, o None si no tiene formato válido"""
+    pin = str(pin or '')
+    if len(pin) == 8 and pin.startswith('AUTO'):
+        return 'auto'
+    if len(pin) == 6 and pin.isdigit() and pin[0] != '0':
+        return 'sala'
+    return None
+
+
+def tomar(espacio):
+    """
+    Saca un PIN libre de la reserva del espacio
+
+    Args:
+        espacio: 'sala' o 'auto'
+
+    Returns:
+        PIN (str)
+    """
+    while True:
+        with _cond:
+            reserva = _reservas[espacio]
+            if reserva:
+                pin = reserva.popleft()
+                _metricas['asignados'] += 1
+                if len(reserva) < RESERVA_MIN:
+                    _cond.notify()
+                break
+        # Reserva vacía: se rellena en esta petición
+        _recargar(espacio, en_peticion=True)
+
+    _asegurar_hilo()
+    return pin
+
+
+def devolver(pin):
+    """Devuelve a la reserva un PIN que sigue libre (sala eliminada o INSERT fallido)"""
+    espacio = espacio_de(pin)
+    if espacio is None:
+        return
+    with _cond:
+        reserva = _reservas[espacio]
+        if pin not in reserva and len(reserva) < RESERVA_MAX:
+            reserva.appendleft(pin)
+            _metricas['reciclados'] += 1
+
+
+def insertar_con_pin(espacio, insertar):
+    """
+    Crea una sala con un PIN de la reserva
+
+    Args:
+        espacio: 'sala' o 'auto'
+        insertar: funcion(pin) que ejecuta el INSERT de la sala y devuelve
+            lo que deba devolverse al llamador (normalmente el id_sala)
+
+    Returns:
+        (pin, resultado de insertar)
+    """
+    for intento in range(REINTENTOS):
+        pin = tomar(espacio)
+        try:
+            return pin, insertar(pin)
+        except Exception as e:
+            # pymysql.err.IntegrityError: args = (código, mensaje)
+            if e.args[:1] != (ER_DUP_ENTRY,):
+                devolver(pin)
+                raise
+            with _lock:
+                _metricas['colisiones'] += 1
+            if intento == REINTENTOS - 1:
+                raise
+
+
+def _recargar(espacio, en_peticion=False):
+    """Completa la reserva del espacio con candidatos comprobados en una consulta"""
+    generar = _GENERADORES[espacio]
+    with _lock:
+        reserva = _reservas[espacio]
+        faltan = RESERVA_MAX - len(reserva)
+        if faltan <= 0:
+            return
+        en_reserva = set(reserva)
+    candidatos = set()
+    while len(candidatos) < faltan:
+        pin = generar(_aleatorio)
+        if pin not in en_reserva:
+            candidatos.add(pin)
+    candidatos = list(candidatos)
+
+    ocupados = _comprobar(candidatos)
+    libres = [pin for pin in candidatos if pin not in ocupados]
+
+    with _cond:
+        reserva = _reservas[espacio]
+        en_reserva = set(reserva)
+        for pin in libres:
+            if len(reserva) >= RESERVA_MAX:
+                break
+            if pin not in en_reserva:
+                reserva.append(pin)
+        _metricas['recargas'] += 1
+        if en_peticion:
+            _metricas['recargas_en_peticion'] += 1
+        _metricas['candidatos'] += len(candidatos)
+        _metricas['ocupados'] += len(ocupados)
+
+
+def _bucle():
+    while True:
+        with _cond:
+            while all(len(reserva) >= RESERVA_MIN for reserva in _reservas.values()):
+                _cond.wait()
+            pendientes = [espacio for espacio, reserva in _reservas.items() if len(reserva) < RESERVA_MIN]
+        for espacio in pendientes:
+            try:
+                _recargar(espacio)
+            except Exception as e:
+                print(f"⚠️ [PINES] No se pudo recargar la reserva '{espacio}': {e}")
+                # Sin base de datos: las peticiones recargan por su cuenta
+                with _cond:
+                    _cond.wait(5)
+
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is not None:
+        return
+    with _cond:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='asignador-pines', daemon=True)
+            _hilo.start()
+
+
+@bus.al_recibir
+def _reciclar(mensaje, remoto):
+    # Solo el proceso que eliminó la sala recicla el PIN: si todos lo hicieran,
+    # varios procesos lo repartirían a la vez
+    if mensaje.tipo == 'sala_eliminada' and not remoto and mensaje.datos.get('pin'):
+        devolver(mensaje.datos['pin'])
+
+
+def estadisticas():
+    with _lock:
+        return {
+            'reserva': {espacio: len(reserva) for espacio, reserva in _reservas.items()},
+            'reserva_min': RESERVA_MIN,
+            'reserva_max': RESERVA_MAX,
+            'asignados': _metricas['asignados'],
+            'recargas': _metricas['recargas'],
+            'recargas_en_peticion': _metricas['recargas_en_peticion'],
+            'candidatos_comprobados': _metricas['candidatos'],
+            'candidatos_ocupados': _metricas['ocupados'],
+            'reciclados': _metricas['reciclados'],
+            'colisiones': _metricas['colisiones']
+        }
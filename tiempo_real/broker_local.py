@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Broker de mensajes local para el backend 'broker' del bus
+Sustituto mínimo de un broker real para desarrollo y pruebas con varios
+workers: reenvía cada línea JSON recibida a todas las conexiones suscritas a
+un patrón que coincida con su canal (fnmatch, p. ej. "sala:*").
+
+Uso:
+    python -m tiempo_real.broker_local [--host 127.0.0.1] [--puerto 7400]
+"""
+
+import argparse
+import fnmatch
+import json
+import socketserver
+import threading
+
+
+class _Cliente(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.patrones = set()
+        self.lock_escritura = threading.Lock()
+        with self.server.lock:
+            self.server.clientes.add(self)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.clientes.discard(self)
+        super().finish()
+
+    def handle(self):
+        for linea in self.rfile:
+            try:
+                datos = json.loads(linea)
+            except ValueError:
+                continue
+            if 'suscribir' in datos:
+                self.patrones.add(datos['suscribir'])
+            elif 'canal' in datos:
+                self.server.difundir(datos['canal'], linea)
+
+    def enviar(self, linea):
+        with self.lock_escritura:
+            try:
+                self.wfile.write(linea)
+                self.wfile.flush()
+            except OSError:
+                pass
+
+
+class BrokerLocal(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, direccion):
+        self.clientes = set()
+        self.lock = threading.Lock()
+        self.difundidos = 0
+        super().__init__(direccion, _Cliente)
+
+    def difundir(self, nombre_canal, linea):
+        with self.lock:
+            destinos = [c for c in self.clientes
+                        if any(fnmatch.fnmatchcase(nombre_canal, p) for p in c.patrones)]
+            self.difundidos += 1
+        for cliente in destinos:
+            cliente.enviar(linea)
+
+
+def iniciar(host='127.0.0.1', puerto=7400):
+    """Arranca el broker en un hilo y lo devuelve (para pruebas dentro del proceso)"""
+    broker = BrokerLocal((host, puerto))
+    threading.Thread(target=broker.serve_forever, name='broker-local', daemon=True).start()
+    return broker
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Broker local del bus de salas')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=7400)
+    args = parser.parse_args()
+
+    broker = BrokerLocal((args.host, args.puerto))
+    print(f"📡 Broker local escuchando en {args.host}:{args.puerto}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        broker.server_close()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Bus de mensajes de sala entre procesos (publicación/suscripción)
+Los controladores publican aquí cada cambio de estado de una sala; el bus lo
+entrega a los manejadores registrados con @al_recibir en este proceso y, con
+un broker, a los de los demás procesos del servidor.
+
+Cada mensaje viaja por el canal de su sala ("sala:<id>"). Los manejadores
+reciben (mensaje, remoto): remoto es True cuando el cambio lo hizo otro
+proceso, que es cuando hay que invalidar las cachés en memoria.
+
+Backends (BUS_BACKEND):
+    proceso  Entrega directa dentro del proceso (un solo worker, por defecto)
+    broker   Además reenvía a un broker TCP de líneas JSON (BUS_BROKER_URL,
+             host:puerto); tiempo_real.broker_local es un broker de reemplazo
+             para desarrollo y pruebas
+
+Se pueden añadir otros backends con registrar_backend().
+La entrega entre procesos es "como mucho una vez": si el broker se cae, los
+mensajes se pierden y, al reconectar, los manejadores reciben un mensaje
+'bus_reconectado' para descartar todo lo que tengan en caché.
+"""
+
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+BACKEND = (os.environ.get('BUS_BACKEND') or 'proceso').lower()
+BROKER_URL = os.environ.get('BUS_BROKER_URL') or '127.0.0.1:7400'
+PATRON_CANALES = 'sala:*'
+ESPERA_RECONEXION = 1.0
+
+# Identifica a este proceso para reconocer sus propios mensajes en el broker
+PROCESO = uuid.uuid4().hex
+
+Mensaje = namedtuple('Mensaje', ('id', 'sala_id', 'tipo', 'datos', 'origen'))
+
+_ids = itertools.count(1)
+_manejadores = []
+_backends = {}
+_bus = None
+_lock = threading.Lock()
+_metricas = {'publicados': 0, 'recibidos_remotos': 0, 'errores_manejador': 0}
+
+
+def canal(sala_id):
+    return f'sala:{sala_id}'
+
+
+def al_recibir(funcion):
+    """Registra un manejador funcion(mensaje, remoto) para todos los mensajes"""
+    _manejadores.append(funcion)
+    return funcion
+
+
+def _despachar(mensaje, remoto):
+    for manejador in list(_manejadores):
+        try:
+            manejador(mensaje, remoto)
+        except Exception as e:
+            _metricas['errores_manejador'] += 1
+            print(f"⚠️ [BUS] Error en manejador de '{mensaje.tipo}' (sala {mensaje.sala_id}): {e}")
+
+
+class BusEnProceso:
+    """Entrega los mensajes solo a los manejadores de este proceso"""
+
+    nombre = 'proceso'
+
+    def enviar(self, mensaje):
+        pass
+
+    def estadisticas(self):
+        return {}
+
+
+class BusBroker(BusEnProceso):
+    """
+    Reenvía los mensajes a un broker TCP y entrega los que llegan de otros procesos.
+
+    Protocolo: una línea JSON por mensaje. Al conectar se envía
+    {"suscribir": "sala:*"}; después {"canal": ..., "mensaje": {...}} en ambos sentidos.
+    """
+
+    nombre = 'broker'
+
+    def __init__(self, url=None):
+        host, _, puerto = (url or BROKER_URL).rpartition(':')
+        self.direccion = (host or '127.0.0.1', int(puerto))
+        self._socket = None
+        self._lock_envio = threading.Lock()
+        self._metricas = {'enviados': 0, 'descartados': 0, 'reconexiones': 0}
+        self._hilo = threading.Thread(target=self._bucle_lectura, name='bus-broker', daemon=True)
+        self._hilo.start()
+
+    def enviar(self, mensaje):
+        linea = json.dumps({
+            'canal': canal(mensaje.sala_id),
+            'mensaje': mensaje._asdict()
+        }, default=str) + '\n'
+        with self._lock_envio:
+            if self._socket is None:
+                self._metricas['descartados'] += 1
+                return
+            try:
+                self._socket.sendall(linea.encode('utf-8'))
+                self._metricas['enviados'] += 1
+            except OSError as e:
+                self._metricas['descartados'] += 1
+                print(f"⚠️ [BUS] No se pudo enviar al broker {self.direccion}: {e}")
+                self._cerrar_socket()
+
+    def _cerrar_socket(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+    def _conectar(self):
+        conexion = socket.create_connection(self.direccion, timeout=5)
+        conexion.settimeout(None)
+        conexion.sendall((json.dumps({'suscribir': PATRON_CANALES}) + '\n').encode('utf-8'))
+        with self._lock_envio:
+            self._socket = conexion
+        return conexion
+
+    def _bucle_lectura(self):
+        primera = True
+        while True:
+            try:
+                conexion = self._conectar()
+            except OSError:
+                time.sleep(ESPERA_RECONEXION)
+                continue
+
+            if primera:
+                print(f"✅ [BUS] Conectado al broker {self.direccion[0]}:{self.direccion[1]}")
+            else:
+                self._metricas['reconexiones'] += 1
+                print(f"🔄 [BUS] Reconectado al broker; se invalidan las cachés de sala")
+                _despachar(Mensaje(0, None, 'bus_reconectado', {}, None), True)
+            primera = False
+
+            try:
+                for linea in conexion.makefile('r', encoding='utf-8'):
+                    self._recibir(linea)
+            except OSError:
+                pass
+            with self._lock_envio:
+                if self._socket is conexion:
+                    self._cerrar_socket()
+            print(f"⚠️ [BUS] Conexión con el broker perdida, reintentando...")
+            time.sleep(ESPERA_RECONEXION)
+
+    def _recibir(self, linea):
+        try:
+            datos = json.loads(linea)['mensaje']
+            mensaje = Mensaje(datos['id'], datos['sala_id'], datos['tipo'], datos['datos'] or {}, datos['origen'])
+        except (ValueError, KeyError, TypeError):
+            return
+        if mensaje.origen == PROCESO:
+            return
+        _metricas['recibidos_remotos'] += 1
+        _despachar(mensaje, True)
+
+    def estadisticas(self):
+        return {
+            'broker': f'{self.direccion[0]}:{self.direccion[1]}',
+            'conectado': self._socket is not None,
+            'enviados': self._metricas['enviados'],
+            'descartados': self._metricas['descartados'],
+            'reconexiones': self._metricas['reconexiones']
+        }
+
+
+def registrar_backend(nombre, fabrica):
+    """Registra un backend; fabrica() devuelve un objeto con nombre, enviar(mensaje) y estadisticas()"""
+    _backends[nombre] = fabrica
+
+
+registrar_backend('proceso', BusEnProceso)
+registrar_backend('broker', BusBroker)
+
+
+def _obtener_bus():
+    global _bus
+    if _bus is None:
+        with _lock:
+            if _bus is None:
+                fabrica = _backends.get(BACKEND)
+                if fabrica is None:
+                    print(f"⚠️ [BUS] Backend '{BACKEND}' desconocido, se usa 'proceso'")
+                    fabrica = BusEnProceso
+                _bus = fabrica()
+    return _bus
+
+
+def publicar(sala_id, tipo, datos=None):
+    """
+    Publica un cambio de estado de la sala.
+    Los manejadores de este proceso lo reciben en el acto (remoto=False) y el
+    backend lo reenvía a los demás procesos.
+    """
+    mensaje = Mensaje(next(_ids), sala_id, tipo, datos or {}, PROCESO)
+    _metricas['publicados'] += 1
+    _despachar(mensaje, False)
+    _obtener_bus().enviar(mensaje)
+    return mensaje
+
+
+def estadisticas():
+    bus = _obtener_bus()
+    resultado = {
+        'backend': bus.nombre,
+        'manejadores': len(_manejadores),
+        'publicados': _metricas['publicados'],
+        'recibidos_remotos': _metricas['recibidos_remotos'],
+        'errores_manejador': _metricas['errores_manejador']
+    }
+    resultado.update(bus.estadisticas())
+    return resultado
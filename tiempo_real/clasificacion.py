@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Clasificación en vivo de las salas en juego
+Cada sala activa tiene su ranking ordenado en memoria (puntaje DESC, tiempo ASC)
+que se actualiza al puntuar cada respuesta, en lugar de repetir el JOIN de
+cuatro tablas con ORDER BY en cada sondeo de /api/sala/<id>/ranking. MySQL solo
+se lee al cargar en frío una sala que no está en memoria.
+
+El orden se guarda en una lista de claves (-puntaje, tiempo, id_participante)
+ordenada con bisect: buscar la posición de un participante es O(log n) y
+moverlo al sumar puntos desplaza la lista (un memmove, despreciable con los
+tamaños de una sala).
+
+Las actualizaciones llegan por tiempo_real.bus ('answer_recorded'), tanto de
+este proceso como de los demás workers. Cada respuesta anunciada se recuerda
+RETENCION_ANUNCIADAS segundos aunque la sala no esté cargada: al cargarla en
+frío se suman las que MySQL todavía no tiene (siguen en la cola de ingesta de
+algún worker o llegaron durante la lectura), así no se pierde ninguna.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from tiempo_real import bus
+
+# Las salas finalizadas se conservan para el podio y después se retiran
+TTL_FINALIZADAS = 3600
+# Segundos que se recuerda una respuesta anunciada (más que lo que tarda la
+# ingesta diferida en escribirla)
+RETENCION_ANUNCIADAS = 300
+
+
+class Clasificacion:
+    """Ranking ordenado de una sala"""
+
+    def __init__(self, sala_id, filas=()):
+        """
+        Args:
+            sala_id: ID de la sala
+            filas: iterable de dicts con id_participante, nombre_completo,
+                   puntos_totales, respuestas_correctas, tiempo_total_respuestas y numero_grupo
+        """
+        self.sala_id = sala_id
+        self.finalizada_en = None
+        self._lock = threading.Lock()
+        self._participantes = {}
+        self._orden = []
+        for fila in filas:
+            entrada = dict(fila)
+            entrada['tiempo_total_respuestas'] = float(entrada['tiempo_total_respuestas'] or 0)
+            self._participantes[entrada['id_participante']] = entrada
+            self._orden.append(self._clave(entrada))
+        self._orden.sort()
+
+    @staticmethod
+    def _clave(entrada):
+        return (-entrada['puntos_totales'], entrada['tiempo_total_respuestas'], entrada['id_participante'])
+
+    def __len__(self):
+        return len(self._orden)
+
+    def __contains__(self, participante_id):
+        return participante_id in self._participantes
+
+    def sumar(self, participante_id, puntaje, es_correcta, tiempo_respuesta):
+        """
+        Suma una respuesta puntuada y recoloca al participante
+
+        Returns:
+            False si el participante no está en la clasificación
+        """
+        with self._lock:
+            entrada = self._participantes.get(participante_id)
+            if entrada is None:
+                return False
+            indice = bisect_left(self._orden, self._clave(entrada))
+            del self._orden[indice]
+            entrada['puntos_totales'] += puntaje
+            entrada['respuestas_correctas'] += 1 if es_correcta else 0
+            entrada['tiempo_total_respuestas'] += float(tiempo_respuesta)
+            insort(self._orden, self._clave(entrada))
+            return True
+
+    def _fila(self, indice):
+        entrada = dict(self._participantes[self._orden[indice][2]])
+        entrada['posicion'] = indice + 1
+        return entrada
+
+    def top(self, k=None):
+        """Devuelve los k primeros (todos si k es None) con su posición"""
+        with self._lock:
+            limite = len(self._orden) if k is None else min(k, len(self._orden))
+            return [self._fila(i) for i in range(limite)]
+
+    def posicion(self, participante_id):
+        """Devuelve la posición (desde 1) del participante o None"""
+        with self._lock:
+            entrada = self._participantes.get(participante_id)
+            if entrada is None:
+                return None
+            return bisect_left(self._orden, self._clave(entrada)) + 1
+
+    def vecinos(self, participante_id, radio=2):
+        """
+        Devuelve el participante y los `radio` que tiene por delante y por detrás
+
+        Returns:
+            Lista de filas con su posición (vacía si el participante no está)
+        """
+        with self._lock:
+            entrada = self._participantes.get(participante_id)
+            if entrada is None:
+                return []
+            indice = bisect_left(self._orden, self._clave(entrada))
+            desde = max(0, indice - radio)
+            hasta = min(len(self._orden), indice + radio + 1)
+            return [self._fila(i) for i in range(desde, hasta)]
+
+
+_salas = {}
+_anunciadas = {}  # sala_id -> OrderedDict (id_participante, id_pregunta) -> (instante, puntaje, es_correcta, tiempo)
+_lock = threading.Lock()
+_metricas = {'aciertos': 0, 'cargas': 0, 'actualizaciones': 0}
+
+
+def obtener(sala_id):
+    """Devuelve la Clasificacion registrada o None"""
+    with _lock:
+        clasificacion = _salas.get(sala_id)
+        if clasificacion is not None:
+            _metricas['aciertos'] += 1
+        return clasificacion
+
+
+def registrar(sala_id, filas, finalizada=False, persistidas=None):
+    """
+    Crea y registra la clasificación de una sala a partir de sus filas de ranking
+
+    Args:
+        sala_id: ID de la sala
+        filas: Filas de ranking leídas de MySQL
+        finalizada: True si la sala ya terminó (se retira tras TTL_FINALIZADAS)
+        persistidas: Conjunto de (id_participante, id_pregunta) que ya estaban en
+                     MySQL al leer las filas; las demás respuestas anunciadas se
+                     suman. None si no se consultó (no se suma ninguna)
+    """
+    clasificacion = Clasificacion(sala_id, filas)
+    if finalizada:
+        clasificacion.finalizada_en = time.monotonic()
+    with _lock:
+        if persistidas is not None:
+            for clave, (_, puntaje, es_correcta, tiempo) in _anunciadas.get(sala_id, {}).items():
+                if clave not in persistidas:
+                    clasificacion.sumar(clave[0], puntaje, es_correcta, tiempo)
+        _salas[sala_id] = clasificacion
+        _metricas['cargas'] += 1
+        _purgar_finalizadas()
+        _purgar_anunciadas()
+    return clasificacion
+
+
+def descartar(sala_id):
+    """Elimina la clasificación; la siguiente consulta la recargará desde MySQL"""
+    with _lock:
+        _salas.pop(sala_id, None)
+
+
+def sumar(sala_id, participante_id, puntaje, es_correcta, tiempo_respuesta, id_pregunta=None):
+    """
+    Suma una respuesta a la clasificación de la sala, si está cargada.
+    Un participante desconocido (se unió después de cargarla) obliga a recargarla.
+    Con id_pregunta la respuesta se recuerda para las cargas en frío (ver registrar).
+    """
+    with _lock:
+        if id_pregunta is not None:
+            anunciadas = _anunciadas.setdefault(sala_id, OrderedDict())
+            anunciadas[(participante_id, id_pregunta)] = (
+                time.monotonic(), puntaje, es_correcta, tiempo_respuesta
+            )
+            anunciadas.move_to_end((participante_id, id_pregunta))
+        # Leída bajo el mismo lock: o registrar() ya vio la respuesta o la sala
+        # ya estaba registrada y se suma aquí, nunca las dos cosas
+        clasificacion = _salas.get(sala_id)
+    if clasificacion is None:
+        return
+    if clasificacion.sumar(participante_id, puntaje, es_correcta, tiempo_respuesta):
+        _metricas['actualizaciones'] += 1
+    else:
+        descartar(sala_id)
+
+
+def _purgar_finalizadas():
+    ahora = time.monotonic()
+    caducadas = [sala_id for sala_id, c in _salas.items()
+                 if c.finalizada_en is not None and ahora - c.finalizada_en > TTL_FINALIZADAS]
+    for sala_id in caducadas:
+        del _salas[sala_id]
+
+
+def _purgar_anunciadas():
+    limite = time.monotonic() - RETENCION_ANUNCIADAS
+    for sala_id in list(_anunciadas):
+        anunciadas = _anunciadas[sala_id]
+        while anunciadas and next(iter(anunciadas.values()))[0] < limite:
+            anunciadas.popitem(last=False)
+        if not anunciadas:
+            del _anunciadas[sala_id]
+
+
+@bus.al_recibir
+def _actualizar(mensaje, remoto):
+    if mensaje.tipo == 'answer_recorded' and 'puntaje' in mensaje.datos:
+        datos = mensaje.datos
+        sumar(mensaje.sala_id, datos['id_participante'], datos['puntaje'],
+              datos['es_correcta'], datos['tiempo_respuesta'], datos.get('id_pregunta'))
+    elif mensaje.tipo in ('game_started', 'game_finished', 'sala_eliminada'):
+        # Al iniciar se reinician los puntajes y al finalizar se recarga el
+        # ranking definitivo de MySQL: en ambos casos se descarta
+        descartar(mensaje.sala_id)
+        if mensaje.tipo != 'game_finished':
+            # Las respuestas de la partida anterior ya no cuentan
+            with _lock:
+                _anunciadas.pop(mensaje.sala_id, None)
+    elif mensaje.tipo == 'bus_reconectado':
+        # Pudo perderse alguna respuesta de otro worker
+        with _lock:
+            _salas.clear()
+
+
+def estadisticas():
+    with _lock:
+        return {
+            'salas': len(_salas),
+            'participantes': sum(len(c) for c in _salas.values()),
+            'aciertos': _metricas['aciertos'],
+            'cargas': _metricas['cargas'],
+            'actualizaciones': _metricas['actualizaciones']
+        }
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Registro en memoria del estado de las salas en juego
+Mantiene la pregunta actual, su hora de inicio, el tiempo límite y la pregunta
+ya preparada para responder los sondeos de los clientes sin consultar MySQL.
+
+controlador_juego lo actualiza al iniciar, avanzar y finalizar cada juego
+(escritura directa: primero MySQL, luego memoria).
+
+También cuenta, por sala, cuántos participantes respondieron cada pregunta
+del juego (respondidas()); sobrevive al cambio de pregunta y se reinicia al
+empezar un juego.
+"""
+
+import os
+import threading
+import time
+
+from tiempo_real import bus
+
+# Con varios procesos de servidor, cada uno tiene su propio registro; los cambios
+# de los demás llegan por tiempo_real.bus y descartan la sala afectada.
+# ESTADO_SALAS_TTL (segundos) obliga además a revalidar contra MySQL pasado ese
+# tiempo, como red de seguridad si el bus pierde mensajes; 0 = nunca caduca.
+TTL_REVALIDACION = float(os.environ.get('ESTADO_SALAS_TTL') or 0)
+
+# Las salas finalizadas se conservan un tiempo para responder "juego terminado"
+# sin consultar MySQL, y después se retiran del registro
+TTL_FINALIZADAS = 3600
+
+
+class EstadoSala:
+    """Estado de juego de una sala activa"""
+
+    __slots__ = (
+        'sala_id', 'estado', 'id_cuestionario', 'numero_pregunta', 'total_preguntas',
+        'tiempo_inicio', 'estado_pregunta', 'tiempo_limite', 'pregunta', 'actualizado_en',
+        'total_participantes', 'respondieron', 'avance_automatico'
+    )
+
+    def __init__(self, sala_id, estado='en_curso', id_cuestionario=None, numero_pregunta=0,
+                 total_preguntas=0, tiempo_inicio=None, estado_pregunta='mostrando',
+                 tiempo_limite=30, pregunta=None, total_participantes=0, respondieron=None,
+                 avance_automatico=False):
+        self.sala_id = sala_id
+        self.estado = estado
+        self.id_cuestionario = id_cuestionario
+        self.numero_pregunta = numero_pregunta
+        self.total_preguntas = total_preguntas
+        self.tiempo_inicio = tiempo_inicio
+        self.estado_pregunta = estado_pregunta
+        self.tiempo_limite = tiempo_limite
+        self.pregunta = pregunta  # {'id_pregunta', 'enunciado', 'tipo', 'opciones'}
+        self.actualizado_en = time.monotonic()
+        self.total_participantes = total_participantes
+        # Participantes que ya respondieron la pregunta actual
+        self.respondieron = set(respondieron or ())
+        # La sala avanza sola al vencer el tiempo (ver tiempo_real.temporizador)
+        self.avance_automatico = bool(avance_automatico)
+
+    def pregunta_actual(self):
+        """
+        Devuelve la pregunta actual con el mismo formato que
+        controlador_juego.obtener_pregunta_actual_sala, o None si no hay pregunta activa
+        """
+        if self.estado == 'finalizada' or not self.pregunta:
+            return None
+        datos = dict(self.pregunta)
+        datos.update({
+            'numero_pregunta': self.numero_pregunta,
+            'total_preguntas': self.total_preguntas,
+            'tiempo_inicio': self.tiempo_inicio,
+            'estado': self.estado_pregunta,
+            'tiempo_limite': self.tiempo_limite,
+            'avance_automatico': self.avance_automatico
+        })
+        return datos
+
+
+_salas = {}
+_respondidas = {}  # sala_id -> {numero_pregunta: participantes que respondieron}
+_lock = threading.Lock()
+
+_aciertos = 0
+_fallos = 0
+
+
+def _caducada(entrada, ahora):
+    if entrada.estado == 'finalizada':
+        return ahora - entrada.actualizado_en > TTL_FINALIZADAS
+    return TTL_REVALIDACION > 0 and ahora - entrada.actualizado_en > TTL_REVALIDACION
+
+
+def obtener(sala_id):
+    """Devuelve el EstadoSala registrado o None si no está (o caducó)"""
+    global _aciertos, _fallos
+    with _lock:
+        entrada = _salas.get(sala_id)
+        if entrada is not None and _caducada(entrada, time.monotonic()):
+            del _salas[sala_id]
+            entrada = None
+        if entrada is None:
+            _fallos += 1
+        else:
+            _aciertos += 1
+        return entrada
+
+
+def registrar(estado_sala):
+    """Registra (o reemplaza) el estado de una sala"""
+    estado_sala.actualizado_en = time.monotonic()
+    with _lock:
+        _salas[estado_sala.sala_id] = estado_sala
+        _purgar_finalizadas()
+
+
+def actualizar(sala_id, **campos):
+    """
+    Modifica campos del estado de una sala registrada.
+
+    Returns:
+        True si la sala estaba registrada, False en caso contrario
+    """
+    with _lock:
+        entrada = _salas.get(sala_id)
+        if entrada is None:
+            return False
+        for campo, valor in campos.items():
+            setattr(entrada, campo, valor)
+        entrada.actualizado_en = time.monotonic()
+        return True
+
+
+def marcar_respuesta(sala_id, participante_id):
+    """
+    Anota que el participante respondió la pregunta actual
+
+    Returns:
+        (respondieron, total_participantes) o None si la sala no está registrada
+    """
+    with _lock:
+        entrada = _salas.get(sala_id)
+        if entrada is None:
+            return None
+        if participante_id not in entrada.respondieron:
+            entrada.respondieron.add(participante_id)
+            conteos = _respondidas.setdefault(sala_id, {})
+            conteos[entrada.numero_pregunta] = conteos.get(entrada.numero_pregunta, 0) + 1
+        return len(entrada.respondieron), entrada.total_participantes
+
+
+def respondidas(sala_id):
+    """
+    Participantes que respondieron cada pregunta del juego
+
+    Returns:
+        Diccionario {numero_pregunta: respuestas}; vacío si no hay datos en memoria
+    """
+    with _lock:
+        return dict(_respondidas.get(sala_id, {}))
+
+
+def completar_respondidas(sala_id, conteos):
+    """
+    Completa los conteos por pregunta con los leídos de MySQL al recargar la
+    sala; se queda con el mayor (puede haber respuestas aún sin escribir)
+    """
+    with _lock:
+        actuales = _respondidas.setdefault(sala_id, {})
+        for numero_pregunta, respuestas in conteos.items():
+            actuales[numero_pregunta] = max(actuales.get(numero_pregunta, 0), respuestas)
+
+
+def finalizar(sala_id):
+    """Marca la sala como finalizada (los sondeos responden sin pregunta activa)"""
+    with _lock:
+        entrada = _salas.get(sala_id)
+        if entrada is None:
+            entrada = EstadoSala(sala_id)
+            _salas[sala_id] = entrada
+        entrada.estado = 'finalizada'
+        entrada.pregunta = None
+        entrada.actualizado_en = time.monotonic()
+
+
+def descartar(sala_id):
+    """Elimina la sala del registro; el siguiente sondeo la recargará desde MySQL"""
+    with _lock:
+        _salas.pop(sala_id, None)
+
+
+def vaciar():
+    """Descarta todas las salas del registro (p. ej. tras perder mensajes del bus)"""
+    with _lock:
+        _salas.clear()
+        _respondidas.clear()
+
+
+def _purgar_finalizadas():
+    ahora = time.monotonic()
+    caducadas = [sala_id for sala_id, e in _salas.items()
+                 if e.estado == 'finalizada' and ahora - e.actualizado_en > TTL_FINALIZADAS]
+    for sala_id in caducadas:
+        del _salas[sala_id]
+        _respondidas.pop(sala_id, None)
+
+
+@bus.al_recibir
+def _invalidar(mensaje, remoto):
+    """
+    Mantiene el registro al día con los cambios publicados en el bus.
+    Los de este proceso ya se escribieron aquí; los de otros workers descartan la
+    sala para que el siguiente sondeo la recargue desde MySQL.
+    """
+    if mensaje.tipo == 'bus_reconectado':
+        vaciar()
+        return
+    if mensaje.tipo == 'game_started':
+        with _lock:
+            _respondidas.pop(mensaje.sala_id, None)
+    if mensaje.tipo in ('sala_modificada', 'sala_eliminada', 'participant_left'):
+        descartar(mensaje.sala_id)
+    elif remoto and mensaje.tipo in ('game_started', 'question_changed', 'participant_joined'):
+        descartar(mensaje.sala_id)
+    elif remoto and mensaje.tipo == 'game_finished':
+        finalizar(mensaje.sala_id)
+
+
+def estadisticas():
+    with _lock:
+        consultas = _aciertos + _fallos
+        return {
+            'salas_registradas': len(_salas),
+            'salas_en_curso': sum(1 for e in _salas.values() if e.estado != 'finalizada'),
+            'aciertos': _aciertos,
+            'fallos': _fallos,
+            'tasa_aciertos': round(_aciertos / consultas * 100, 1) if consultas else 0.0
+        }
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Eventos de sala para los clientes (Server-Sent Events)
+Los controladores publican eventos tipados por sala y cada conexión abierta en
+/api/sala/<id>/eventos tiene una suscripción con su propia cola.
+
+Los controladores no publican aquí directamente sino en tiempo_real.bus; este
+módulo entrega a sus suscriptores los mensajes del bus de los tipos de abajo,
+vengan de este proceso o de otro worker.
+
+Tipos de evento:
+    participant_joined, participant_left, game_started, question_changed,
+    answer_count, ranking_updated, game_finished
+
+answer_count y ranking_updated solo interesan por su último valor: si un
+cliente no ha leído todavía el anterior, el nuevo lo reemplaza en su cola.
+
+Cada suscripción espera con una Condition y no consume CPU mientras no hay
+eventos; con un servidor de hilos cada flujo abierto ocupa un hilo, así que en
+producción conviene un worker cooperativo (gunicorn -k gevent).
+"""
+
+import itertools
+import json
+import threading
+from collections import deque, namedtuple
+
+from tiempo_real import bus
+
+TIPOS = (
+    'participant_joined', 'participant_left', 'game_started', 'question_changed',
+    'answer_count', 'ranking_updated', 'game_finished'
+)
+COALESCIBLES = ('answer_count', 'ranking_updated')
+COLA_MAX_SUSCRIPCION = 100
+
+Evento = namedtuple('Evento', ('id', 'tipo', 'sala_id', 'datos'))
+
+_ids = itertools.count(1)
+_suscripciones = {}  # sala_id -> set de Suscripcion
+_lock = threading.Lock()
+_metricas = {'publicados': 0, 'entregados': 0, 'descartados': 0}
+
+
+class Suscripcion:
+    """Cola de eventos de un cliente conectado a una sala"""
+
+    def __init__(self, sala_id):
+        self.sala_id = sala_id
+        self.cerrada = False
+        self._eventos = deque()
+        self._cond = threading.Condition()
+
+    def entregar(self, evento):
+        with self._cond:
+            if evento.tipo in COALESCIBLES:
+                for indice, pendiente in enumerate(self._eventos):
+                    if pendiente.tipo == evento.tipo:
+                        del self._eventos[indice]
+                        break
+            if len(self._eventos) >= COLA_MAX_SUSCRIPCION:
+                self._eventos.popleft()
+                _metricas['descartados'] += 1
+            self._eventos.append(evento)
+            self._cond.notify()
+
+    def esperar(self, timeout):
+        """
+        Espera hasta `timeout` segundos por eventos nuevos
+
+        Returns:
+            Lista de eventos pendientes (vacía si venció el tiempo o se cerró)
+        """
+        with self._cond:
+            if not self._eventos and not self.cerrada:
+                self._cond.wait(timeout)
+            eventos = list(self._eventos)
+            self._eventos.clear()
+            return eventos
+
+    def cerrar(self):
+        with self._cond:
+            self.cerrada = True
+            self._cond.notify()
+
+
+def publicar(sala_id, tipo, datos=None):
+    """Publica un evento a los clientes de este proceso suscritos a la sala"""
+    evento = Evento(next(_ids), tipo, sala_id, datos or {})
+    with _lock:
+        suscriptores = list(_suscripciones.get(sala_id, ()))
+        _metricas['publicados'] += 1
+        _metricas['entregados'] += len(suscriptores)
+    for suscripcion in suscriptores:
+        suscripcion.entregar(evento)
+    return evento
+
+
+@bus.al_recibir
+def _reenviar_mensaje_bus(mensaje, remoto):
+    if mensaje.tipo in TIPOS:
+        publicar(mensaje.sala_id, mensaje.tipo, mensaje.datos)
+
+
+def suscribir(sala_id):
+    """Abre una suscripción a los eventos de la sala"""
+    suscripcion = Suscripcion(sala_id)
+    with _lock:
+        _suscripciones.setdefault(sala_id, set()).add(suscripcion)
+    return suscripcion
+
+
+def cancelar(suscripcion):
+    """Cierra la suscripción y la retira de la sala"""
+    suscripcion.cerrar()
+    with _lock:
+        suscriptores = _suscripciones.get(suscripcion.sala_id)
+        if suscriptores is not None:
+            suscriptores.discard(suscripcion)
+            if not suscriptores:
+                del _suscripciones[suscripcion.sala_id]
+
+
+def formatear_sse(evento):
+    """Serializa un evento con el formato de text/event-stream"""
+    datos = json.dumps(evento.datos, default=str)
+    return f'id: {evento.id}\nevent: {evento.tipo}\ndata: {datos}\n\n'
+
+
+def estadisticas():
+    with _lock:
+        return {
+            'salas_con_suscriptores': len(_suscripciones),
+            'suscripciones': sum(len(s) for s in _suscripciones.values()),
+            'publicados': _metricas['publicados'],
+            'entregados': _metricas['entregados'],
+            'descartados': _metricas['descartados']
+        }
@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+"""
+Ingesta diferida de respuestas (write-behind)
+Con INGESTA_DIFERIDA=1 las respuestas ya corregidas en memoria se confirman al
+estudiante de inmediato y se encolan; un hilo de vaciado las escribe en MySQL por
+lotes (executemany, una transacción) cada INGESTA_INTERVALO_MS milisegundos o al
+juntar INGESTA_LOTE_MAX respuestas.
+
+Durabilidad:
+  - Cada respuesta se anota en un diario local antes de confirmarse al cliente;
+    tras un corte, recuperar() reescribe las que no llegaron a MySQL.
+  - controlador_juego vacía la cola antes de avanzar de pregunta y al finalizar
+    con vaciar_sala(): con varios procesos de servidor pide por tiempo_real.bus
+    ('vaciar_respuestas') a cada worker que anunció respuestas de la sala que
+    vacíe la suya y espera sus confirmaciones ('respuestas_vaciadas') hasta
+    INGESTA_BARRERA_S segundos. Si alguno no confirma a tiempo, el lote que
+    escriba después llega a los @al_persistir, que rehacen el resultado final.
+  - Si la cola está llena, encolar() devuelve False y la respuesta se escribe
+    directamente en la petición (no se pierde ni se rechaza).
+
+Cada proceso escribe su propio diario (INGESTA_DIARIO.<pid>) y lo mantiene
+bloqueado (flock) mientras vive; si otro proceso vivo ya tiene esa ruta, el
+primer encolar() falla en lugar de mezclar los dos diarios. recuperar()
+reescribe los diarios que nadie tiene bloqueados (su proceso terminó): main lo
+llama al importarse y el hilo de vaciado lo repite cada
+INGESTA_RECUPERACION_S segundos, para los procesos que el servidor reinicia.
+"""
+
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+from tiempo_real import bus
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueos, solo se recupera el diario del propio PID
+    fcntl = None
+
+ACTIVA = os.environ.get('INGESTA_DIFERIDA', '0').lower() in ('1', 'true', 'si')
+INTERVALO_MS = int(os.environ.get('INGESTA_INTERVALO_MS') or 200)
+LOTE_MAX = int(os.environ.get('INGESTA_LOTE_MAX') or 500)
+COLA_MAX = int(os.environ.get('INGESTA_COLA_MAX') or 10000)
+# Base de la ruta del diario; cada proceso añade su PID
+RUTA_DIARIO = os.environ.get('INGESTA_DIARIO') or os.path.join(tempfile.gettempdir(), 'brain_rush_respuestas.diario')
+RECUPERACION_S = float(os.environ.get('INGESTA_RECUPERACION_S') or 30)
+# fsync por respuesta: sobrevive a un corte de energía, no solo a la caída del proceso
+DIARIO_FSYNC = os.environ.get('INGESTA_DIARIO_FSYNC', '0').lower() in ('1', 'true', 'si')
+# Segundos que vaciar_sala espera la confirmación de los demás workers
+BARRERA_S = float(os.environ.get('INGESTA_BARRERA_S') or 3)
+
+Respuesta = namedtuple('Respuesta', (
+    'secuencia', 'participante_id', 'sala_id', 'id_pregunta', 'id_opcion',
+    'tiempo_respuesta', 'es_correcta', 'puntaje'
+))
+
+
+# ==================== DIARIO LOCAL ====================
+
+class Diario:
+    """
+    Diario de solo-añadir con una línea JSON por respuesta encolada y marcas
+    {"ok": secuencia} por cada lote confirmado en MySQL
+    """
+
+    def __init__(self, ruta, fsync=False):
+        self.ruta = ruta
+        self.fsync = fsync
+        self._archivo = None
+        # Descriptor que mantiene el bloqueo del diario mientras el proceso vive
+        self._candado = None
+
+    def _abrir(self):
+        if self._candado is None:
+            candado = open(self.ruta, 'a', encoding='utf-8')
+            if not _bloquear(candado):
+                candado.close()
+                raise RuntimeError(
+                    f"El diario {self.ruta} ya lo usa otro proceso; "
+                    f"cada proceso de servidor necesita su propio INGESTA_DIARIO"
+                )
+            self._candado = candado
+        if self._archivo is None:
+            self._archivo = open(self.ruta, 'a', encoding='utf-8')
+        return self._archivo
+
+    @property
+    def abierto(self):
+        return self._candado is not None
+
+    def _escribir(self, registro):
+        archivo = self._abrir()
+        archivo.write(json.dumps(registro, separators=(',', ':')) + '\n')
+        archivo.flush()
+        if self.fsync:
+            os.fsync(archivo.fileno())
+
+    def anotar(self, respuesta):
+        self._escribir(respuesta._asdict())
+
+    def confirmar(self, secuencia):
+        self._escribir({'ok': secuencia})
+
+    def truncar(self):
+        """Vacía el diario (todas las respuestas anotadas están en MySQL)"""
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+        open(self.ruta, 'w').close()
+
+    def pendientes(self):
+        """Devuelve las respuestas anotadas que no tienen marca de confirmación"""
+        if not os.path.exists(self.ruta):
+            return []
+        respuestas, confirmada = [], 0
+        with open(self.ruta, encoding='utf-8') as archivo:
+            for linea in archivo:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue  # última línea a medio escribir
+                if 'ok' in registro:
+                    confirmada = max(confirmada, registro['ok'])
+                else:
+                    respuestas.append(Respuesta(**registro))
+        return [r for r in respuestas if r.secuencia > confirmada]
+
+
+def _bloquear(archivo):
+    """Bloqueo exclusivo sin esperar; False si otro proceso vivo lo tiene"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _ruta_propia():
+    return f'{RUTA_DIARIO}.{os.getpid()}'
+
+
+# ==================== COLA ====================
+
+_pendientes = deque()
+_cond = threading.Condition()
+_escritura = threading.Lock()
+_recuperacion = threading.Lock()
+_diarios = {}  # pid -> Diario (tras un fork, el hijo abre el suyo)
+_hilo = None
+_secuencia = 0
+_escritores = {}  # sala_id -> procesos (bus.PROCESO) que anunciaron respuestas de la sala
+_barreras = {}  # petición -> procesos que ya confirmaron su vaciado
+
+
+def _diario():
+    """Diario del proceso actual"""
+    pid = os.getpid()
+    diario = _diarios.get(pid)
+    if diario is None:
+        diario = _diarios[pid] = Diario(_ruta_propia(), DIARIO_FSYNC)
+    return diario
+
+# Funciones llamadas con cada lote ya confirmado en MySQL
+_al_persistir = []
+
+_metricas = {
+    'encoladas': 0,
+    'escritas': 0,
+    'lotes': 0,
+    'cola_llena': 0,
+    'errores': 0,
+    'ultimo_vaciado_ms': 0.0,
+    'max_vaciado_ms': 0.0,
+    'total_vaciado_ms': 0.0,
+    'barreras': 0,
+    'barreras_incompletas': 0,
+}
+
+
+def al_persistir(funcion):
+    """Registra una función que recibe cada lote de respuestas ya escrito"""
+    _al_persistir.append(funcion)
+    return funcion
+
+
+def encolar(participante_id, sala_id, id_pregunta, id_opcion, tiempo_respuesta, es_correcta, puntaje):
+    """
+    Encola una respuesta ya corregida y la anota en el diario.
+
+    Returns:
+        True si quedó encolada, False si la cola está llena (escribir directamente)
+    """
+    global _secuencia
+    with _cond:
+        if len(_pendientes) >= COLA_MAX:
+            _metricas['cola_llena'] += 1
+            return False
+        _secuencia += 1
+        respuesta = Respuesta(
+            _secuencia, participante_id, sala_id, id_pregunta, id_opcion,
+            float(tiempo_respuesta), int(es_correcta), puntaje
+        )
+        _diario().anotar(respuesta)
+        _pendientes.append(respuesta)
+        _metricas['encoladas'] += 1
+        if len(_pendientes) >= LOTE_MAX:
+            _cond.notify()
+    _asegurar_hilo()
+    return True
+
+
+def _escribir_lote(lote):
+    """Escribe un lote de respuestas y sus sumas de ranking en una transacción"""
+    from bd import obtener_pool
+
+    # Acumular por participante: una fila de ranking por participante y sala
+    acumulado = {}
+    for r in lote:
+        clave = (r.participante_id, r.sala_id)
+        puntaje, correctas, tiempo = acumulado.get(clave, (0, 0, 0.0))
+        acumulado[clave] = (puntaje + r.puntaje, correctas + r.es_correcta, tiempo + r.tiempo_respuesta)
+
+    conexion = obtener_pool().obtener()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO respuestas_participantes
+                (id_participante, id_sala, id_pregunta, id_opcion_seleccionada, tiempo_respuesta, es_correcta, puntaje_obtenido)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    id_opcion_seleccionada = VALUES(id_opcion_seleccionada),
+                    tiempo_respuesta = VALUES(tiempo_respuesta),
+                    es_correcta = VALUES(es_correcta),
+                    puntaje_obtenido = VALUES(puntaje_obtenido)
+            ''', [(r.participante_id, r.sala_id, r.id_pregunta, r.id_opcion,
+                   r.tiempo_respuesta, r.es_correcta, r.puntaje) for r in lote])
+
+            cursor.executemany('''
+                INSERT INTO ranking_sala (id_participante, id_sala, puntaje_total, respuestas_correctas, tiempo_total_respuestas)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    puntaje_total = puntaje_total + VALUES(puntaje_total),
+                    respuestas_correctas = respuestas_correctas + VALUES(respuestas_correctas),
+                    tiempo_total_respuestas = tiempo_total_respuestas + VALUES(tiempo_total_respuestas)
+            ''', [clave + valores for clave, valores in acumulado.items()])
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+
+
+def vaciar():
+    """
+    Escribe en MySQL todas las respuestas encoladas hasta este momento.
+    Se llama desde el hilo de vaciado y, de forma síncrona, antes de avanzar
+    de pregunta o finalizar un juego.
+
+    Returns:
+        Número de respuestas escritas
+    """
+    escritas = 0
+    with _escritura:
+        while True:
+            with _cond:
+                cantidad = min(LOTE_MAX, len(_pendientes))
+                lote = [_pendientes.popleft() for _ in range(cantidad)]
+            if not lote:
+                break
+
+            inicio = time.perf_counter()
+            try:
+                _escribir_lote(lote)
+            except Exception:
+                with _cond:
+                    _pendientes.extendleft(reversed(lote))
+                    _metricas['errores'] += 1
+                raise
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+
+            with _cond:
+                _diario().confirmar(lote[-1].secuencia)
+                if not _pendientes:
+                    _diario().truncar()
+                _metricas['escritas'] += len(lote)
+                _metricas['lotes'] += 1
+                _metricas['ultimo_vaciado_ms'] = duracion_ms
+                _metricas['max_vaciado_ms'] = max(_metricas['max_vaciado_ms'], duracion_ms)
+                _metricas['total_vaciado_ms'] += duracion_ms
+            escritas += len(lote)
+
+            for funcion in _al_persistir:
+                try:
+                    funcion(lote)
+                except Exception as e:
+                    print(f"⚠️ [INGESTA] Error procesando lote persistido: {e}")
+    return escritas
+
+
+def vaciar_sala(sala_id):
+    """
+    Vacía la cola de este proceso y la de cada worker que anunció respuestas
+    de la sala, y espera a que todos lo confirmen (hasta BARRERA_S segundos)
+
+    Returns:
+        True si todas las respuestas aceptadas de la sala ya están en MySQL
+    """
+    vaciar()
+    if not ACTIVA:
+        return True
+    with _cond:
+        esperados = _escritores.get(sala_id, set()) - {bus.PROCESO}
+        if not esperados:
+            return True
+        peticion = uuid.uuid4().hex
+        confirmados = _barreras[peticion] = set()
+        _metricas['barreras'] += 1
+    try:
+        bus.publicar(sala_id, 'vaciar_respuestas', {'peticion': peticion, 'procesos': sorted(esperados)})
+        limite = time.monotonic() + BARRERA_S
+        with _cond:
+            while not esperados <= confirmados:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                _cond.wait(restante)
+            faltan = esperados - confirmados
+            if faltan:
+                _metricas['barreras_incompletas'] += 1
+                # Un worker que no responde (terminado o sin bus) deja de esperarse;
+                # vuelve a contar en cuanto anuncie otra respuesta de la sala
+                _escritores.get(sala_id, set()).difference_update(faltan)
+    finally:
+        with _cond:
+            _barreras.pop(peticion, None)
+    if faltan:
+        print(f"⚠️ [INGESTA] {len(faltan)} worker(s) no confirmaron el vaciado de la sala {sala_id}; "
+              f"sus respuestas rehacen el resultado al escribirse")
+    return not faltan
+
+
+def _responder_vaciado(sala_id, peticion):
+    try:
+        vaciar()
+        ok = True
+    except Exception as e:
+        print(f"❌ [INGESTA] Error al vaciar la cola a petición de otro worker: {e}")
+        ok = False
+    bus.publicar(sala_id, 'respuestas_vaciadas', {'peticion': peticion, 'proceso': bus.PROCESO, 'ok': ok})
+
+
+@bus.al_recibir
+def _coordinar(mensaje, remoto):
+    """Lleva quién acepta respuestas de cada sala y atiende las barreras de vaciado"""
+    if not ACTIVA or not remoto:
+        return
+    if mensaje.tipo == 'answer_recorded':
+        with _cond:
+            _escritores.setdefault(mensaje.sala_id, set()).add(mensaje.origen)
+    elif mensaje.tipo == 'vaciar_respuestas':
+        if bus.PROCESO in mensaje.datos.get('procesos', ()):
+            # Escribe en MySQL: fuera del hilo que reparte los mensajes del bus
+            threading.Thread(
+                target=_responder_vaciado, args=(mensaje.sala_id, mensaje.datos['peticion']),
+                name='ingesta-barrera', daemon=True
+            ).start()
+    elif mensaje.tipo == 'respuestas_vaciadas':
+        with _cond:
+            confirmados = _barreras.get(mensaje.datos.get('peticion'))
+            if confirmados is not None and mensaje.datos.get('ok'):
+                confirmados.add(mensaje.datos.get('proceso'))
+                _cond.notify_all()
+    elif mensaje.tipo in ('game_finished', 'sala_eliminada'):
+        with _cond:
+            _escritores.pop(mensaje.sala_id, None)
+
+
+def _bucle_vaciado():
+    ultima_recuperacion = time.monotonic()
+    while True:
+        with _cond:
+            if len(_pendientes) < LOTE_MAX:
+                _cond.wait(INTERVALO_MS / 1000)
+            hay_pendientes = bool(_pendientes)
+        if time.monotonic() - ultima_recuperacion >= RECUPERACION_S:
+            ultima_recuperacion = time.monotonic()
+            try:
+                recuperar()
+            except Exception as e:
+                print(f"❌ [INGESTA] Error al recuperar diarios huérfanos (se reintentará): {e}")
+        if not hay_pendientes:
+            continue
+        try:
+            vaciar()
+        except Exception as e:
+            print(f"❌ [INGESTA] Error al escribir respuestas (se reintentará): {e}")
+            time.sleep(INTERVALO_MS / 1000)
+
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is not None:
+        return
+    with _cond:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle_vaciado, name='ingesta-respuestas', daemon=True)
+            _hilo.start()
+
+
+def _diarios_huerfanos():
+    """Rutas de diario que pueden pertenecer a procesos terminados"""
+    propia = _ruta_propia()
+    if fcntl is None:
+        rutas = [propia]
+    else:
+        # Incluye el diario sin PID de versiones anteriores
+        rutas = [RUTA_DIARIO] + [
+            ruta for ruta in glob.glob(glob.escape(RUTA_DIARIO) + '.*')
+            if ruta[len(RUTA_DIARIO) + 1:].isdigit()
+        ]
+    for ruta in rutas:
+        # El diario en uso de este proceso lo vacía vaciar(), no la recuperación
+        if ruta == propia and _diario().abierto:
+            continue
+        if os.path.exists(ruta):
+            yield ruta
+
+
+def recuperar():
+    """
+    Reescribe en MySQL las respuestas que no llegaron a confirmarse en los
+    diarios de procesos terminados (caída o reinicio) y borra esos diarios.
+    Los totales de ranking de los participantes afectados se recalculan desde
+    respuestas_participantes, por lo que repetir la recuperación no duplica
+    puntos.
+
+    Returns:
+        Número de respuestas recuperadas
+    """
+    total = 0
+    with _recuperacion:
+        for ruta in _diarios_huerfanos():
+            try:
+                candado = open(ruta, 'a', encoding='utf-8')
+            except OSError:
+                continue
+            try:
+                if not _bloquear(candado):
+                    continue  # su proceso sigue vivo
+                respuestas = Diario(ruta).pendientes()
+                if respuestas:
+                    _reescribir(respuestas)
+                    total += len(respuestas)
+                    print(f"♻️ [INGESTA] {len(respuestas)} respuestas recuperadas de {ruta}")
+                    for funcion in _al_persistir:
+                        try:
+                            funcion(respuestas)
+                        except Exception as e:
+                            print(f"⚠️ [INGESTA] Error procesando respuestas recuperadas: {e}")
+                os.remove(ruta)
+            finally:
+                candado.close()
+    return total
+
+
+def _reescribir(respuestas):
+    """Escribe respuestas recuperadas y recalcula el ranking de sus participantes"""
+    from bd import obtener_pool
+
+    conexion = obtener_pool().obtener()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO respuestas_participantes
+                (id_participante, id_sala, id_pregunta, id_opcion_seleccionada, tiempo_respuesta, es_correcta, puntaje_obtenido)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    id_opcion_seleccionada = VALUES(id_opcion_seleccionada),
+                    tiempo_respuesta = VALUES(tiempo_respuesta),
+                    es_correcta = VALUES(es_correcta),
+                    puntaje_obtenido = VALUES(puntaje_obtenido)
+            ''', [(r.participante_id, r.sala_id, r.id_pregunta, r.id_opcion,
+                   r.tiempo_respuesta, r.es_correcta, r.puntaje) for r in respuestas])
+
+            for participante_id, sala_id in {(r.participante_id, r.sala_id) for r in respuestas}:
+                cursor.execute('''
+                    INSERT INTO ranking_sala (id_participante, id_sala, puntaje_total, respuestas_correctas, tiempo_total_respuestas)
+                    SELECT %s, %s, COALESCE(SUM(puntaje_obtenido), 0), COALESCE(SUM(es_correcta), 0), COALESCE(SUM(tiempo_respuesta), 0)
+                    FROM respuestas_participantes
+                    WHERE id_participante = %s AND id_sala = %s
+                    ON DUPLICATE KEY UPDATE
+                        puntaje_total = VALUES(puntaje_total),
+                        respuestas_correctas = VALUES(respuestas_correctas),
+                        tiempo_total_respuestas = VALUES(tiempo_total_respuestas)
+                ''', (participante_id, sala_id, participante_id, sala_id))
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+
+
+def estadisticas():
+    with _cond:
+        lotes = _metricas['lotes']
+        return {
+            'activa': ACTIVA,
+            'profundidad_cola': len(_pendientes),
+            'capacidad_cola': COLA_MAX,
+            'encoladas': _metricas['encoladas'],
+            'escritas': _metricas['escritas'],
+            'lotes': lotes,
+            'cola_llena': _metricas['cola_llena'],
+            'errores': _metricas['errores'],
+            'vaciado_ultimo_ms': round(_metricas['ultimo_vaciado_ms'], 2),
+            'vaciado_promedio_ms': round(_metricas['total_vaciado_ms'] / lotes, 2) if lotes else 0.0,
+            'vaciado_max_ms': round(_metricas['max_vaciado_ms'], 2),
+            'barreras': _metricas['barreras'],
+            'barreras_incompletas': _metricas['barreras_incompletas']
+        }
+
+
+def _vaciar_al_salir():
+    if _pendientes:
+        try:
+            vaciar()
+        except Exception as e:
+            print(f"❌ [INGESTA] No se pudo vaciar la cola al salir (quedan en el diario): {e}")
+            return
+    # Todo está en MySQL: el diario de este proceso ya no hace falta
+    diario = _diarios.get(os.getpid())
+    if diario is not None and diario.abierto and not _pendientes:
+        try:
+            os.remove(diario.ruta)
+        except OSError:
+            pass
+
+
+atexit.register(_vaciar_al_salir)
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Liquidación asíncrona de XP e insignias
+Las respuestas ya registradas encolan un trabajo identificado por
+(participante, pregunta); un grupo de hilos actualiza estadísticas, XP e
+insignias fuera de la petición del estudiante. El resultado se publica en
+tiempo_real.bus ('xp_liquidado') y cada worker lo guarda en un buzón por
+participante: /api/sala/<id>/xp lo entrega lo atienda el worker que lo atienda.
+Al entregarlo se publica 'xp_entregado' para que los demás lo retiren; cada
+resultado lleva su id_pregunta y el cliente descarta los repetidos.
+
+- Idempotencia: un mismo (participante, pregunta) se procesa una sola vez,
+  aunque se encole varias veces.
+- Orden: los trabajos de un participante van siempre al mismo hilo, así la
+  racha se calcula en el orden en que respondió.
+- Contrapresión: con la cola llena (LIQUIDACION_XP_COLA_MAX), encolar()
+  devuelve False y quien llama liquida en línea, frenando al productor en lugar
+  de perder XP.
+- Fallos: si un lote falla, sus trabajos se reintentan uno a uno; el que
+  vuelve a fallar se registra con participante y pregunta y queda pendiente.
+- Durabilidad: la cola vive en memoria, pero la liquidación marca la respuesta
+  (respuestas_participantes.xp_liquidado) en su misma transacción. Cada
+  LIQUIDACION_XP_RECUPERACION_S segundos se buscan con la función registrada
+  con @pendientes las respuestas confirmadas sin liquidar; las que siguen así
+  en dos búsquedas seguidas (su worker se reinició o las descartó) se encolan
+  de nuevo. La marca hace que liquidarlas dos veces no sume XP dos veces.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from tiempo_real import bus
+
+HILOS = int(os.environ.get('LIQUIDACION_XP_HILOS') or 2)
+COLA_MAX = int(os.environ.get('LIQUIDACION_XP_COLA_MAX') or 5000)
+LOTE_MAX = 50
+# Claves ya liquidadas que se recuerdan para descartar duplicados
+MEMORIA_PROCESADOS = 100000
+# Notificaciones pendientes que se guardan por participante
+BUZON_MAX = 20
+# Segundos entre búsquedas de respuestas confirmadas sin XP liquidado
+RECUPERACION_S = float(os.environ.get('LIQUIDACION_XP_RECUPERACION_S') or 60)
+
+Trabajo = namedtuple('Trabajo', ('participante_id', 'sala_id', 'id_pregunta', 'es_correcta', 'tiempo_respuesta'))
+
+_cond = threading.Condition()
+_colas = [deque() for _ in range(max(1, HILOS))]
+_pendientes = {}  # (participante_id, id_pregunta) -> Trabajo
+_procesados = OrderedDict()
+_buzones = OrderedDict()  # participante_id -> deque de (sala_id, id_pregunta, xp_info)
+_hilos = []
+_procesar = None
+_buscar_pendientes = None
+
+_metricas = {
+    'encolados': 0,
+    'duplicados': 0,
+    'procesados': 0,
+    'en_linea': 0,
+    'errores': 0,
+    'reintentos_individuales': 0,
+    'descartados': 0,
+    'recuperados': 0,
+    'ultimo_lote_ms': 0.0,
+    'max_lote_ms': 0.0,
+}
+
+
+def procesador(funcion):
+    """
+    Registra la función que liquida un lote de trabajos.
+    Recibe la lista de Trabajo y devuelve una lista paralela con el xp_info de cada uno.
+    """
+    global _procesar
+    _procesar = funcion
+    return funcion
+
+
+def pendientes(funcion):
+    """
+    Registra la función que devuelve los Trabajo de las respuestas confirmadas
+    cuyo XP aún no se ha liquidado
+    """
+    global _buscar_pendientes
+    _buscar_pendientes = funcion
+    return funcion
+
+
+def _clave(trabajo):
+    return (trabajo.participante_id, trabajo.id_pregunta)
+
+
+def encolar(participante_id, sala_id, id_pregunta, es_correcta, tiempo_respuesta):
+    """
+    Encola la liquidación de XP de una respuesta registrada.
+
+    Returns:
+        True si quedó encolada (o ya estaba), False si la cola está llena
+    """
+    trabajo = Trabajo(participante_id, sala_id, id_pregunta, int(es_correcta), float(tiempo_respuesta))
+    clave = _clave(trabajo)
+    with _cond:
+        if clave in _pendientes or clave in _procesados:
+            _metricas['duplicados'] += 1
+            return True
+        if len(_pendientes) >= COLA_MAX:
+            return False
+        _pendientes[clave] = trabajo
+        _colas[participante_id % len(_colas)].append(trabajo)
+        _metricas['encolados'] += 1
+        _cond.notify_all()
+    _asegurar_hilos()
+    return True
+
+
+def liquidar_en_linea(participante_id, sala_id, id_pregunta, es_correcta, tiempo_respuesta):
+    """
+    Liquida una respuesta en el hilo que llama (cola llena).
+
+    Returns:
+        xp_info de la respuesta o None
+    """
+    trabajo = Trabajo(participante_id, sala_id, id_pregunta, int(es_correcta), float(tiempo_respuesta))
+    with _cond:
+        if _clave(trabajo) in _procesados:
+            _metricas['duplicados'] += 1
+            return None
+        _metricas['en_linea'] += 1
+    return _liquidar([trabajo])[0]
+
+
+def enviar(participante_id, sala_id, id_pregunta, es_correcta, tiempo_respuesta):
+    """Encola la liquidación o, si la cola está llena, la hace en línea"""
+    if not encolar(participante_id, sala_id, id_pregunta, es_correcta, tiempo_respuesta):
+        liquidar_en_linea(participante_id, sala_id, id_pregunta, es_correcta, tiempo_respuesta)
+
+
+def _liquidar(lote):
+    inicio = time.perf_counter()
+    resultados = _procesar(lote)
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+
+    with _cond:
+        for trabajo in lote:
+            clave = _clave(trabajo)
+            _procesados[clave] = True
+            _pendientes.pop(clave, None)
+        while len(_procesados) > MEMORIA_PROCESADOS:
+            _procesados.popitem(last=False)
+        _metricas['procesados'] += len(lote)
+        _metricas['ultimo_lote_ms'] = duracion_ms
+        _metricas['max_lote_ms'] = max(_metricas['max_lote_ms'], duracion_ms)
+
+    # El buzón se llena al recibir el mensaje, en este worker y en los demás
+    for trabajo, xp_info in zip(lote, resultados):
+        if xp_info:
+            bus.publicar(trabajo.sala_id, 'xp_liquidado', {
+                'id_participante': trabajo.participante_id,
+                'id_pregunta': trabajo.id_pregunta,
+                'xp_info': xp_info
+            })
+    return resultados
+
+
+def _bucle(indice):
+    cola = _colas[indice]
+    while True:
+        with _cond:
+            while not cola:
+                _cond.wait()
+            lote = [cola.popleft() for _ in range(min(LOTE_MAX, len(cola)))]
+        try:
+            _liquidar(lote)
+        except Exception as e:
+            # El lote va en una sola transacción: no se guardó nada y cada
+            # trabajo se reintenta solo, en orden, para no perder todo el lote
+            print(f"⚠️ [LIQUIDACION_XP] Lote de {len(lote)} respuestas falló ({e}); se reintentan una a una")
+            with _cond:
+                _metricas['errores'] += 1
+            for trabajo in lote:
+                _reintentar(trabajo)
+
+
+def _reintentar(trabajo):
+    """Liquida un trabajo solo; si vuelve a fallar se descarta y se registra"""
+    try:
+        _liquidar([trabajo])
+        with _cond:
+            _metricas['reintentos_individuales'] += 1
+    except Exception as e:
+        with _cond:
+            _metricas['descartados'] += 1
+            _pendientes.pop(_clave(trabajo), None)
+        print(f"❌ [LIQUIDACION_XP] XP sin liquidar: participante {trabajo.participante_id}, "
+              f"sala {trabajo.sala_id}, pregunta {trabajo.id_pregunta} "
+              f"(correcta={trabajo.es_correcta}, tiempo={trabajo.tiempo_respuesta}s): {e}; "
+              f"se reintentará al recuperar pendientes")
+
+
+def _asegurar_hilos():
+    if _hilos:
+        return
+    with _cond:
+        if _hilos:
+            return
+        for indice in range(len(_colas)):
+            hilo = threading.Thread(target=_bucle, args=(indice,), name=f'liquidacion-xp-{indice}', daemon=True)
+            hilo.start()
+            _hilos.append(hilo)
+        hilo = threading.Thread(target=_bucle_recuperacion, name='liquidacion-xp-recuperacion', daemon=True)
+        hilo.start()
+        _hilos.append(hilo)
+
+
+def iniciar():
+    """Arranca los hilos (al iniciar el proceso, para recuperar pendientes sin esperar tráfico)"""
+    _asegurar_hilos()
+
+
+def _bucle_recuperacion():
+    vistos = set()
+    while True:
+        time.sleep(RECUPERACION_S)
+        if _buscar_pendientes is None:
+            continue
+        try:
+            trabajos = _buscar_pendientes()
+        except Exception as e:
+            print(f"⚠️ [LIQUIDACION_XP] No se pudieron buscar respuestas sin liquidar: {e}")
+            continue
+        actuales = {_clave(trabajo): trabajo for trabajo in trabajos}
+        # Solo las que ya estaban en la búsqueda anterior: las recientes pueden
+        # seguir en la cola de otro worker
+        recuperados = 0
+        for clave in actuales.keys() & vistos:
+            trabajo = actuales[clave]
+            with _cond:
+                if clave in _pendientes:
+                    continue
+                _procesados.pop(clave, None)
+            if encolar(*trabajo):
+                recuperados += 1
+        vistos = set(actuales)
+        if recuperados:
+            with _cond:
+                _metricas['recuperados'] += recuperados
+            print(f"🔄 [LIQUIDACION_XP] {recuperados} respuestas sin liquidar encoladas de nuevo")
+
+
+def _guardar(participante_id, sala_id, id_pregunta, xp_info):
+    with _cond:
+        buzon = _buzones.get(participante_id)
+        if buzon is None:
+            buzon = _buzones[participante_id] = deque(maxlen=BUZON_MAX)
+        if all(entrada[1] != id_pregunta for entrada in buzon):
+            buzon.append((sala_id, id_pregunta, xp_info))
+        _buzones.move_to_end(participante_id)
+        while len(_buzones) > MEMORIA_PROCESADOS:
+            _buzones.popitem(last=False)
+
+
+def _retirar(participante_id, preguntas):
+    with _cond:
+        buzon = _buzones.get(participante_id)
+        if buzon:
+            restantes = [entrada for entrada in buzon if entrada[1] not in preguntas]
+            buzon.clear()
+            buzon.extend(restantes)
+
+
+@bus.al_recibir
+def _sincronizar_buzones(mensaje, remoto):
+    datos = mensaje.datos
+    if mensaje.tipo == 'xp_liquidado':
+        _guardar(datos['id_participante'], mensaje.sala_id, datos['id_pregunta'], datos['xp_info'])
+    elif mensaje.tipo == 'xp_entregado' and remoto:
+        _retirar(datos['id_participante'], set(datos['preguntas']))
+
+
+def recoger(participante_id, sala_id=None):
+    """
+    Devuelve y retira las notificaciones de XP pendientes del participante
+
+    Returns:
+        Lista de xp_info (con su id_pregunta) en el orden en que se liquidaron
+    """
+    with _cond:
+        buzon = _buzones.get(participante_id)
+        if not buzon:
+            return []
+        entregadas = [(sala, id_pregunta, xp) for sala, id_pregunta, xp in buzon
+                      if sala_id is None or sala == sala_id]
+        restantes = [entrada for entrada in buzon if sala_id is not None and entrada[0] != sala_id]
+        buzon.clear()
+        buzon.extend(restantes)
+
+    por_sala = {}
+    for sala, id_pregunta, _ in entregadas:
+        por_sala.setdefault(sala, []).append(id_pregunta)
+    for sala, preguntas in por_sala.items():
+        bus.publicar(sala, 'xp_entregado', {'id_participante': participante_id, 'preguntas': preguntas})
+    return [dict(xp, id_pregunta=id_pregunta) for _, id_pregunta, xp in entregadas]
+
+
+def estadisticas():
+    with _cond:
+        return {
+            'hilos': len(_colas),
+            'profundidad_cola': len(_pendientes),
+            'capacidad_cola': COLA_MAX,
+            'encolados': _metricas['encolados'],
+            'duplicados': _metricas['duplicados'],
+            'procesados': _metricas['procesados'],
+            'en_linea': _metricas['en_linea'],
+            'errores': _metricas['errores'],
+            'reintentos_individuales': _metricas['reintentos_individuales'],
+            'descartados': _metricas['descartados'],
+            'recuperados': _metricas['recuperados'],
+            'ultimo_lote_ms': round(_metricas['ultimo_lote_ms'], 2),
+            'max_lote_ms': round(_metricas['max_lote_ms'], 2)
+        }
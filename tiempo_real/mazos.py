@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Mazos de preguntas precalculados por sala
+Al iniciar el juego se carga una sola vez la secuencia ordenada de preguntas del
+cuestionario (enunciados, opciones y clave de respuestas) y se guarda como una
+estructura inmutable. Las consultas de "la pregunta N" pasan a ser un acceso por
+índice en lugar de un ORDER BY ... LIMIT sobre MySQL, y editar el cuestionario
+durante la partida no altera el mazo que ya está en juego.
+
+El worker que inicia el juego publica el mazo completo en el bus
+('mazo_registrado') y los demás registran esa misma copia en lugar de
+reconstruirla desde MySQL, así todos usan el mismo mazo aunque el cuestionario
+se edite a mitad de partida. La misma copia se guarda en
+estado_juego_sala.mazo al iniciar: un worker que perdió el mensaje, o el
+servidor tras reiniciarse, la recupera de ahí y no del cuestionario actual.
+Los mazos de salas que nunca finalizan se retiran tras TTL_INACTIVOS segundos
+sin consultas.
+"""
+
+import json
+import threading
+import time
+from collections import namedtuple
+
+from tiempo_real import bus
+
+# Segundos sin consultas tras los que se retira el mazo de una sala
+TTL_INACTIVOS = 6 * 3600
+
+# opciones: tupla de (id_opcion, texto) en el orden en que se muestran
+PreguntaMazo = namedtuple('PreguntaMazo', ('id_pregunta', 'enunciado', 'tipo', 'opciones'))
+
+
+class Mazo:
+    """Secuencia ordenada e inmutable de preguntas de un cuestionario"""
+
+    __slots__ = ('id_cuestionario', 'preguntas', 'clave')
+
+    def __init__(self, id_cuestionario, preguntas, clave):
+        self.id_cuestionario = id_cuestionario
+        self.preguntas = tuple(preguntas)
+        # id_opcion -> (id_pregunta, es_correcta)
+        self.clave = dict(clave)
+
+    def __len__(self):
+        return len(self.preguntas)
+
+    def pregunta(self, numero_pregunta):
+        """
+        Devuelve la pregunta en la posición indicada (empezando en 1)
+
+        Returns:
+            PreguntaMazo o None si el número está fuera de rango
+        """
+        if 1 <= numero_pregunta <= len(self.preguntas):
+            return self.preguntas[numero_pregunta - 1]
+        return None
+
+    def id_pregunta(self, numero_pregunta):
+        """Devuelve el id_pregunta en la posición indicada o None"""
+        pregunta = self.pregunta(numero_pregunta)
+        return pregunta.id_pregunta if pregunta else None
+
+    def como_diccionario(self, numero_pregunta):
+        """
+        Devuelve la pregunta con el formato que reciben los clientes
+        (id_pregunta, enunciado, tipo y opciones), sin la clave de respuestas
+        """
+        pregunta = self.pregunta(numero_pregunta)
+        if not pregunta:
+            return None
+        return {
+            'id_pregunta': pregunta.id_pregunta,
+            'enunciado': pregunta.enunciado,
+            'tipo': pregunta.tipo,
+            'opciones': [{'id_opcion': id_opcion, 'texto': texto} for id_opcion, texto in pregunta.opciones]
+        }
+
+
+def construir(cursor, id_cuestionario):
+    """
+    Carga el mazo de un cuestionario con dos consultas
+
+    Args:
+        cursor: Cursor abierto (tuplas)
+        id_cuestionario: ID del cuestionario
+
+    Returns:
+        Mazo con las preguntas en el orden de cuestionario_preguntas.orden
+    """
+    cursor.execute('''
+        SELECT p.id_pregunta, p.enunciado, p.tipo
+        FROM cuestionario_preguntas cp
+        JOIN preguntas p ON cp.id_pregunta = p.id_pregunta
+        WHERE cp.id_cuestionario = %s
+        ORDER BY cp.orden
+    ''', (id_cuestionario,))
+    filas_preguntas = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT o.id_pregunta, o.id_opcion, o.texto_opcion, o.es_correcta
+        FROM opciones_respuesta o
+        JOIN cuestionario_preguntas cp ON cp.id_pregunta = o.id_pregunta
+        WHERE cp.id_cuestionario = %s
+        ORDER BY o.id_opcion
+    ''', (id_cuestionario,))
+
+    opciones_por_pregunta = {}
+    clave = {}
+    for id_pregunta, id_opcion, texto, es_correcta in cursor.fetchall():
+        if id_opcion in clave:
+            continue  # la misma pregunta puede figurar dos veces en el cuestionario
+        opciones_por_pregunta.setdefault(id_pregunta, []).append((id_opcion, texto))
+        clave[id_opcion] = (id_pregunta, bool(es_correcta))
+
+    preguntas = [
+        PreguntaMazo(id_pregunta, enunciado, tipo, tuple(opciones_por_pregunta.get(id_pregunta, ())))
+        for id_pregunta, enunciado, tipo in filas_preguntas
+    ]
+    return Mazo(id_cuestionario, preguntas, clave)
+
+
+def _a_datos(mazo):
+    """Convierte el mazo en datos serializables en JSON para el bus"""
+    return {
+        'id_cuestionario': mazo.id_cuestionario,
+        'preguntas': [[p.id_pregunta, p.enunciado, p.tipo, [list(o) for o in p.opciones]]
+                      for p in mazo.preguntas],
+        'clave': [[id_opcion, id_pregunta, es_correcta]
+                  for id_opcion, (id_pregunta, es_correcta) in mazo.clave.items()]
+    }
+
+
+def _desde_datos(datos):
+    """Reconstruye el mazo publicado por otro worker o guardado en MySQL"""
+    preguntas = [
+        PreguntaMazo(id_pregunta, enunciado, tipo, tuple(tuple(o) for o in opciones))
+        for id_pregunta, enunciado, tipo, opciones in datos['preguntas']
+    ]
+    clave = {id_opcion: (id_pregunta, bool(es_correcta))
+             for id_opcion, id_pregunta, es_correcta in datos['clave']}
+    return Mazo(datos['id_cuestionario'], preguntas, clave)
+
+
+def a_json(mazo):
+    """Serializa el mazo para guardarlo en estado_juego_sala.mazo"""
+    return json.dumps(_a_datos(mazo), ensure_ascii=False, separators=(',', ':'))
+
+
+def desde_json(texto):
+    """Reconstruye el mazo guardado con a_json"""
+    return _desde_datos(json.loads(texto))
+
+
+_mazos = {}
+_usados = {}  # sala_id -> time.monotonic() de la última consulta
+_lock = threading.Lock()
+
+
+def obtener(sala_id):
+    """Devuelve el mazo de la sala o None si no hay ninguno registrado"""
+    with _lock:
+        mazo = _mazos.get(sala_id)
+        if mazo is not None:
+            _usados[sala_id] = time.monotonic()
+        return mazo
+
+
+def registrar(sala_id, mazo):
+    """Asocia un mazo a la sala (reemplaza el anterior si lo había)"""
+    with _lock:
+        _mazos[sala_id] = mazo
+        _usados[sala_id] = time.monotonic()
+        _purgar_inactivos()
+
+
+def publicar(sala_id, mazo):
+    """
+    Registra el mazo con el que empieza el juego y lo envía a los demás workers
+    para que todos usen la misma copia
+    """
+    registrar(sala_id, mazo)
+    bus.publicar(sala_id, 'mazo_registrado', _a_datos(mazo))
+
+
+def descartar(sala_id):
+    """Retira el mazo de la sala (al finalizar el juego)"""
+    with _lock:
+        _mazos.pop(sala_id, None)
+        _usados.pop(sala_id, None)
+
+
+def _purgar_inactivos():
+    ahora = time.monotonic()
+    caducados = [sala_id for sala_id, usado in _usados.items() if ahora - usado > TTL_INACTIVOS]
+    for sala_id in caducados:
+        _mazos.pop(sala_id, None)
+        del _usados[sala_id]
+
+
+@bus.al_recibir
+def _invalidar(mensaje, remoto):
+    # El mazo llega antes que game_started; game_finished retira el de los demás workers
+    if remoto and mensaje.tipo == 'mazo_registrado':
+        registrar(mensaje.sala_id, _desde_datos(mensaje.datos))
+    elif mensaje.tipo == 'sala_eliminada' or (remoto and mensaje.tipo == 'game_finished'):
+        descartar(mensaje.sala_id)
+
+
+def obtener_o_construir(cursor, sala_id, id_cuestionario):
+    """
+    Devuelve el mazo de la sala; si no está registrado (por ejemplo, tras
+    reiniciar el servidor con un juego en curso) lo recupera de
+    estado_juego_sala.mazo y lo registra. Solo si la sala no guardó mazo (aún no
+    empezó) se construye desde el cuestionario.
+    """
+    mazo = obtener(sala_id)
+    if mazo is not None and mazo.id_cuestionario == id_cuestionario:
+        return mazo
+    cursor.execute('SELECT mazo FROM estado_juego_sala WHERE id_sala = %s', (sala_id,))
+    fila = cursor.fetchone()
+    if fila and fila[0]:
+        mazo = desde_json(fila[0])
+    else:
+        mazo = construir(cursor, id_cuestionario)
+    registrar(sala_id, mazo)
+    return mazo
+
+
+def estadisticas():
+    with _lock:
+        return {
+            'mazos': len(_mazos),
+            'preguntas': sum(len(m) for m in _mazos.values())
+        }
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Caché PIN -> sala
+Verificar un PIN, entrar a /unirse-sala y cada unión buscan la sala por PIN.
+Los metadatos de la sala (id, estado, max_participantes, modo de juego...)
+se guardan aquí al primer acceso en un LRU de hasta CACHE_PINES_MAX
+entradas, así que las siguientes búsquedas no tocan la base de datos. El
+número de participantes no se guarda: lo mantiene tiempo_real.presencia.
+
+Las entradas se invalidan por sala con los mensajes de tiempo_real.bus que
+cambian la sala (inicio y fin del juego, sala_modificada, sala_eliminada),
+tanto locales como de otros procesos. CACHE_PINES_TTL limita cuánto vive una
+entrada por si la sala se cambia en MySQL sin pasar por el bus.
+
+Los PIN inexistentes no se guardan: una sala recién creada se encuentra en
+la siguiente búsqueda.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from tiempo_real import bus
+
+CAPACIDAD = int(os.environ.get('CACHE_PINES_MAX') or 1000)
+TTL = float(os.environ.get('CACHE_PINES_TTL') or 60)
+
+_entradas = OrderedDict()  # pin -> (sala, cargada_en), de la menos a la más reciente
+_pines = {}  # sala_id -> pin
+_lock = threading.Lock()
+_cargar = None
+# Se incrementa en cada invalidación: una carga que empezó antes no se guarda
+_generacion = 0
+_metricas = {'aciertos': 0, 'fallos': 0, 'caducadas': 0, 'expulsadas': 0, 'invalidaciones': 0}
+
+
+def cargador(funcion):
+    """
+    Registra la función que busca una sala por PIN en la base de datos.
+    Devuelve un diccionario con al menos 'id' y 'estado', o None.
+    """
+    global _cargar
+    _cargar = funcion
+    return funcion
+
+
+def obtener(pin):
+    """
+    Metadatos de la sala con ese PIN
+
+    Args:
+        pin: PIN de la sala
+
+    Returns:
+        Copia del diccionario de la sala, o None si no existe
+    """
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _entradas.get(pin)
+        if entrada is not None:
+            sala, cargada_en = entrada
+            if ahora - cargada_en < TTL:
+                _entradas.move_to_end(pin)
+                _metricas['aciertos'] += 1
+                return dict(sala)
+            _quitar(pin)
+            _metricas['caducadas'] += 1
+        _metricas['fallos'] += 1
+        generacion = _generacion
+
+    sala = _cargar(pin)
+    if sala is None:
+        return None
+    with _lock:
+        if generacion == _generacion:
+            _entradas[pin] = (sala, ahora)
+            _entradas.move_to_end(pin)
+            _pines[sala['id']] = pin
+            while len(_entradas) > CAPACIDAD:
+                _quitar(next(iter(_entradas)))
+                _metricas['expulsadas'] += 1
+    return dict(sala)
+
+
+def _quitar(pin):
+    sala, _ = _entradas.pop(pin)
+    if _pines.get(sala['id']) == pin:
+        del _pines[sala['id']]
+
+
+def invalidar(sala_id):
+    """Olvida la sala; la siguiente búsqueda de su PIN la relee"""
+    global _generacion
+    with _lock:
+        _generacion += 1
+        _metricas['invalidaciones'] += 1
+        pin = _pines.get(sala_id)
+        if pin is not None:
+            _quitar(pin)
+
+
+def vaciar():
+    global _generacion
+    with _lock:
+        _generacion += 1
+        _entradas.clear()
+        _pines.clear()
+
+
+@bus.al_recibir
+def _invalidar(mensaje, remoto):
+    if mensaje.tipo == 'bus_reconectado':
+        vaciar()
+    elif mensaje.tipo in ('game_started', 'game_finished', 'sala_modificada', 'sala_eliminada'):
+        invalidar(mensaje.sala_id)
+
+
+def estadisticas():
+    with _lock:
+        consultas = _metricas['aciertos'] + _metricas['fallos']
+        return {
+            'entradas': len(_entradas),
+            'capacidad': CAPACIDAD,
+            'ttl_s': TTL,
+            'aciertos': _metricas['aciertos'],
+            'fallos': _metricas['fallos'],
+            'tasa_aciertos': round(_metricas['aciertos'] / consultas, 4) if consultas else 0.0,
+            'caducadas': _metricas['caducadas'],
+            'expulsadas': _metricas['expulsadas'],
+            'invalidaciones': _metricas['invalidaciones']
+        }
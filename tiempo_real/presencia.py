@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+"""
+Presencia de participantes en la sala de espera
+Registro en memoria, por sala, de los participantes conectados, para que la
+sala de espera y el monitoreo del docente no relean participantes_sala en cada
+sondeo. Se carga desde MySQL la primera vez que se consulta una sala y después
+se mantiene con cada unión, salida y latido, con coste O(1) por evento.
+También lleva los contadores por estado (esperando, jugando, desconectados)
+que devuelve conteos(): contar no necesita copiar ni releer la lista.
+
+Latidos: la sala de espera envía un latido cada INTERVALO_LATIDO segundos
+(/api/sala/<id>/latido). Un participante en espera sin latidos durante
+PRESENCIA_TTL segundos caduca: desaparece del registro al momento y un hilo
+lo marca como ausente (participantes_sala.ausente) en MySQL por lotes (una
+sentencia por lote) cada PRESENCIA_INTERVALO segundos. Si vuelve a latir (un
+corte breve de red), se le readmite. Solo caducan participantes de salas
+cargadas en 'esperando': los que ya juegan, o cuya sala no está en el
+registro, no se tocan. Ausente no es 'desconectado' (salida explícita): el
+participante sigue en 'esperando', conserva su plaza e iniciar_juego_sala lo
+incluye en el juego como a los demás.
+
+Con varios procesos de servidor cada uno lleva su registro: las uniones y
+salidas llegan por tiempo_real.bus, y cada proceso publica cada INTERVALO los
+latidos que recibió ('latidos'), así que todos ven el último latido de cada
+participante sin importar a qué worker llegó. Las caducidades viajan con los
+datos del participante, de modo que cualquier worker puede readmitirlo; un
+worker que carga la sala de MySQL también conoce a sus ausentes. El TTL ya no
+depende del número de workers, pero debe cubrir un latido perdido más el
+retraso de la publicación y del barrido; se valida al importar el módulo.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from tiempo_real import bus
+
+# Segundos sin latido para dar por desconectado a un participante (0 = no caducan)
+TTL = float(os.environ.get('PRESENCIA_TTL') or 45)
+# Cada cuánto se buscan caducados y se escriben los cambios en MySQL
+INTERVALO = float(os.environ.get('PRESENCIA_INTERVALO') or 5)
+# Salas sin consultas durante este tiempo se retiran del registro
+INACTIVIDAD_SALA = 1800
+# Caducados que se recuerdan para readmitirlos si vuelven a latir
+CADUCADOS_MAX = 10000
+# Cada cuánto late la sala de espera (INTERVALO_LATIDO_MS de SalaEspera.html)
+INTERVALO_LATIDO = 10
+
+# Un latido perdido, más lo que tarda en publicarse a los demás workers y en
+# llegar el siguiente barrido, no debe bastar para caducar a nadie
+TTL_MINIMO = 2 * INTERVALO_LATIDO + 2 * INTERVALO
+if 0 < TTL < TTL_MINIMO:
+    raise RuntimeError(
+        f'PRESENCIA_TTL={TTL:g} es menor que {TTL_MINIMO:g} s (dos latidos de '
+        f'{INTERVALO_LATIDO} s más dos barridos de PRESENCIA_INTERVALO={INTERVALO:g} s)'
+    )
+
+
+def _claves(participante):
+    """Claves con las que se detecta a un participante repetido (por usuario y por nombre)"""
+    claves = [('nombre', participante['nombre_participante'])]
+    if participante.get('id_usuario'):
+        claves.append(('usuario', participante['id_usuario']))
+    return claves
+
+
+class _Sala:
+    """Participantes conectados de una sala, en orden de unión, y sus contadores"""
+
+    __slots__ = ('en_espera', 'participantes', 'claves', 'por_estado', 'desconectados', 'consultada_en')
+
+    def __init__(self, en_espera, participantes, desconectados=()):
+        self.en_espera = en_espera
+        self.participantes = OrderedDict()
+        self.claves = {}  # clave -> número de participantes con esa clave
+        self.por_estado = {}  # estado -> número de participantes conectados en ese estado
+        self.desconectados = set(desconectados)  # id_participante
+        for participante in participantes:
+            self.agregar(participante)
+        self.consultada_en = time.monotonic()
+
+    def _sumar(self, estado, cantidad):
+        total = self.por_estado.get(estado, 0) + cantidad
+        if total:
+            self.por_estado[estado] = total
+        else:
+            self.por_estado.pop(estado, None)
+
+    def agregar(self, participante):
+        if participante['id_participante'] in self.participantes:
+            return
+        self.participantes[participante['id_participante']] = participante
+        for clave in _claves(participante):
+            self.claves[clave] = self.claves.get(clave, 0) + 1
+        self._sumar(participante['estado'], 1)
+        self.desconectados.discard(participante['id_participante'])
+
+    def quitar(self, participante_id):
+        participante = self.participantes.pop(participante_id, None)
+        if participante is not None:
+            for clave in _claves(participante):
+                if self.claves[clave] > 1:
+                    self.claves[clave] -= 1
+                else:
+                    del self.claves[clave]
+            self._sumar(participante['estado'], -1)
+            self.desconectados.add(participante_id)
+        return participante
+
+    def iniciar(self):
+        """Aplica el inicio del juego: los participantes en espera pasan a jugar"""
+        self.en_espera = False
+        for participante in self.participantes.values():
+            if participante['estado'] == 'esperando':
+                participante['estado'] = 'jugando'
+        self._sumar('jugando', self.por_estado.pop('esperando', 0))
+
+
+_salas = {}  # sala_id -> _Sala
+_generaciones = {}  # sala_id -> contador de cambios (para no instalar cargas obsoletas)
+_latidos = OrderedDict()  # (sala_id, participante_id) -> último latido, del más antiguo al más reciente
+_caducados = OrderedDict()  # (sala_id, participante_id) -> datos del participante caducado
+_cambios = {}  # participante_id -> (sala_id, estado, datos) pendiente de escribir en MySQL
+_vistos = {}  # sala_id -> participantes que latieron en este proceso desde la última publicación
+_lock = threading.Lock()
+_escritura = threading.Lock()
+_cargar = None
+_hilo = None
+_metricas = {
+    'cargas': 0, 'latidos': 0, 'caducados': 0, 'readmitidos': 0,
+    'escritos': 0, 'lotes': 0, 'errores': 0
+}
+
+
+def cargador(funcion):
+    """
+    Registra la función que lee una sala de MySQL.
+    Recibe sala_id y devuelve (estado de la sala, lista de participantes
+    conectados en orden de unión, id de los desconectados, lista de los
+    ausentes) o None si la sala no existe. Los ausentes se recuerdan como
+    caducados para readmitirlos si vuelven a latir.
+    """
+    global _cargar
+    _cargar = funcion
+    return funcion
+
+
+def _cambio(sala_id):
+    _generaciones[sala_id] = _generaciones.get(sala_id, 0) + 1
+
+
+def _obtener_sala(sala_id):
+    """Devuelve la sala registrada, cargándola de MySQL si hace falta (fuera del lock)"""
+    with _lock:
+        sala = _salas.get(sala_id)
+        if sala is not None:
+            sala.consultada_en = time.monotonic()
+            return sala
+        generacion = _generaciones.get(sala_id, 0)
+
+    cargada = _cargar(sala_id)
+    if cargada is None:
+        return None
+    estado, participantes, desconectados, ausentes = cargada
+    sala = _Sala(estado == 'esperando', participantes,
+                 list(desconectados) + [p['id_participante'] for p in ausentes])
+    with _lock:
+        for participante in ausentes:
+            _caducar((sala_id, participante['id_participante']), participante)
+        _metricas['cargas'] += 1
+        # Si hubo uniones o salidas mientras se leía, no se instala (la siguiente consulta recarga)
+        if _generaciones.get(sala_id, 0) == generacion:
+            _salas.setdefault(sala_id, sala)
+            return _salas[sala_id]
+    return sala
+
+
+def participantes(sala_id):
+    """
+    Participantes conectados de la sala, en orden de unión
+
+    Returns:
+        Lista de diccionarios con id_participante, id_usuario,
+        nombre_participante, fecha_union, estado, id_grupo y nombre_grupo
+    """
+    sala = _obtener_sala(sala_id)
+    if sala is None:
+        return []
+    with _lock:
+        return [dict(p) for p in sala.participantes.values()]
+
+
+def contar(sala_id):
+    """Número de participantes conectados de la sala"""
+    sala = _obtener_sala(sala_id)
+    if sala is None:
+        return 0
+    with _lock:
+        return len(sala.participantes)
+
+
+def conteos(sala_id):
+    """
+    Contadores de participantes de la sala, sin copiar la lista
+
+    Returns:
+        Diccionario con total, conectados, esperando, jugando, desconectados
+        (y cualquier otro estado presente, p. ej. finalizado), o None si la
+        sala no existe
+    """
+    sala = _obtener_sala(sala_id)
+    if sala is None:
+        return None
+    with _lock:
+        conectados = len(sala.participantes)
+        resultado = {'esperando': 0, 'jugando': 0}
+        resultado.update(sala.por_estado)
+        resultado.update({
+            'conectados': conectados,
+            'desconectados': len(sala.desconectados),
+            'total': conectados + len(sala.desconectados)
+        })
+        return resultado
+
+
+def repetido(sala_id, nombre_participante, id_usuario=None):
+    """
+    Indica si la sala ya tiene un participante conectado con ese usuario o,
+    si no hay usuario, con ese nombre (mismo criterio que agregar_participante_sala)
+    """
+    sala = _obtener_sala(sala_id)
+    if sala is None:
+        return False
+    clave = ('usuario', id_usuario) if id_usuario else ('nombre', nombre_participante)
+    with _lock:
+        return clave in sala.claves
+
+
+def _vigilar(clave):
+    if TTL > 0:
+        _latidos[clave] = time.monotonic()
+        _latidos.move_to_end(clave)
+
+
+def _caducar(clave, participante):
+    _caducados[clave] = participante
+    if len(_caducados) > CADUCADOS_MAX:
+        _caducados.popitem(last=False)
+
+
+def unir(sala_id, participante):
+    """
+    Anota un participante recién insertado en participantes_sala
+
+    Args:
+        sala_id: ID de la sala
+        participante: diccionario con los campos de participantes()
+    """
+    clave = (sala_id, participante['id_participante'])
+    with _lock:
+        _cambio(sala_id)
+        sala = _salas.get(sala_id)
+        if sala is not None:
+            sala.agregar(participante)
+        _caducados.pop(clave, None)
+        _vigilar(clave)
+    _asegurar_hilo()
+
+
+def salir(sala_id, participante_id):
+    """Retira al participante (salida explícita: no se le readmite con un latido)"""
+    clave = (sala_id, participante_id)
+    with _lock:
+        _cambio(sala_id)
+        sala = _salas.get(sala_id)
+        if sala is not None:
+            sala.quitar(participante_id)
+        _latidos.pop(clave, None)
+        _caducados.pop(clave, None)
+        _cambios.pop(participante_id, None)
+
+
+def latido(sala_id, participante_id):
+    """
+    Renueva la presencia del participante
+
+    Returns:
+        True si el participante sigue (o vuelve a estar) en la sala
+    """
+    clave = (sala_id, participante_id)
+    with _lock:
+        _metricas['latidos'] += 1
+        # Con la sala fuera del registro se recarga: el barrido necesita su estado
+        if clave in _latidos and sala_id in _salas:
+            _vigilar(clave)
+            _vistos.setdefault(sala_id, set()).add(participante_id)
+            return True
+
+    sala = _obtener_sala(sala_id)
+    if sala is None:
+        return False
+    with _lock:
+        caducado = _caducados.pop(clave, None)
+        if caducado is not None and sala.en_espera:
+            _cambio(sala_id)
+            sala.agregar(caducado)
+            _cambios[participante_id] = (sala_id, 'esperando', caducado)
+            _metricas['readmitidos'] += 1
+        elif participante_id not in sala.participantes:
+            return False
+        if sala.en_espera:
+            _vigilar(clave)
+            _vistos.setdefault(sala_id, set()).add(participante_id)
+    _asegurar_hilo()
+    return True
+
+
+def descartar(sala_id):
+    """Elimina la sala del registro; la siguiente consulta la recargará desde MySQL"""
+    with _lock:
+        _cambio(sala_id)
+        _salas.pop(sala_id, None)
+
+
+def vaciar():
+    """Descarta todas las salas del registro (p. ej. tras perder mensajes del bus)"""
+    with _lock:
+        for sala_id in _salas:
+            _cambio(sala_id)
+        _salas.clear()
+
+
+def _barrer():
+    """Retira a los participantes sin latidos recientes y las salas inactivas"""
+    ahora = time.monotonic()
+    with _lock:
+        while _latidos:
+            clave, ultimo = next(iter(_latidos.items()))
+            if ahora - ultimo < TTL:
+                break
+            del _latidos[clave]
+            sala_id, participante_id = clave
+            sala = _salas.get(sala_id)
+            if sala is None or not sala.en_espera:
+                # Sala sin cargar (estado desconocido) o ya en juego: no se toca
+                continue
+            participante = sala.quitar(participante_id)
+            if participante is None:
+                continue
+            _cambio(sala_id)
+            _caducar(clave, participante)
+            _cambios[participante_id] = (sala_id, 'ausente', participante)
+            _metricas['caducados'] += 1
+
+        inactivas = [sala_id for sala_id, sala in _salas.items() if ahora - sala.consultada_en > INACTIVIDAD_SALA]
+        for sala_id in inactivas:
+            del _salas[sala_id]
+            _generaciones.pop(sala_id, None)
+
+
+def escribir_cambios():
+    """
+    Escribe en MySQL, por lotes, las caducidades y readmisiones pendientes y
+    las publica en el bus
+
+    Returns:
+        Número de participantes actualizados
+    """
+    from bd import obtener_pool
+
+    with _escritura:
+        with _lock:
+            cambios = dict(_cambios)
+            _cambios.clear()
+        if not cambios:
+            return 0
+
+        por_estado = {'ausente': [], 'esperando': []}
+        for participante_id, (sala_id, estado, participante) in cambios.items():
+            por_estado[estado].append(participante_id)
+
+        conexion = obtener_pool().obtener()
+        try:
+            with conexion.cursor() as cursor:
+                # Solo se tocan participantes que siguen esperando: los que ya
+                # juegan o salieron de la sala se quedan como están
+                for estado, ausente in (('ausente', 1), ('esperando', 0)):
+                    ids = por_estado[estado]
+                    if ids:
+                        marcadores = ', '.join(['%s'] * len(ids))
+                        cursor.execute(f'''
+                            UPDATE participantes_sala
+                            SET ausente = %s
+                            WHERE id_participante IN ({marcadores}) AND estado = 'esperando'
+                        ''', [ausente] + ids)
+            conexion.commit()
+        except Exception:
+            conexion.rollback()
+            with _lock:
+                _metricas['errores'] += 1
+                for participante_id, cambio in cambios.items():
+                    _cambios.setdefault(participante_id, cambio)
+            raise
+        finally:
+            conexion.close()
+
+        with _lock:
+            _metricas['escritos'] += len(cambios)
+            _metricas['lotes'] += 1
+
+        salidas = {}
+        for participante_id, (sala_id, estado, participante) in cambios.items():
+            if estado == 'ausente':
+                salidas.setdefault(sala_id, []).append(participante)
+            else:
+                bus.publicar(sala_id, 'participant_joined', datos_union(participante))
+        for sala_id, ausentes in salidas.items():
+            # Con los datos de los ausentes cualquier worker puede readmitirlos
+            bus.publicar(sala_id, 'participant_left', {
+                'participantes': [p['id_participante'] for p in ausentes],
+                'ausentes': [datos_union(p) for p in ausentes]
+            })
+        return len(cambios)
+
+
+def datos_union(participante):
+    """Datos del mensaje participant_joined (los demás procesos lo añaden sin releer MySQL)"""
+    fecha_union = participante.get('fecha_union')
+    return {
+        'id_participante': participante['id_participante'],
+        'nombre': participante['nombre_participante'],
+        'id_usuario': participante.get('id_usuario'),
+        'fecha_union': fecha_union.isoformat() if hasattr(fecha_union, 'isoformat') else fecha_union
+    }
+
+
+def _desde_union(datos):
+    """Participante en espera a partir de los datos de participant_joined"""
+    fecha_union = datos.get('fecha_union')
+    return {
+        'id_participante': datos['id_participante'],
+        'id_usuario': datos.get('id_usuario'),
+        'nombre_participante': datos['nombre'],
+        'fecha_union': datetime.fromisoformat(fecha_union) if fecha_union else None,
+        'estado': 'esperando',
+        'id_grupo': None,
+        'nombre_grupo': None
+    }
+
+
+def _publicar_latidos():
+    """Comparte con los demás workers los latidos recibidos desde la última vez"""
+    if bus.BACKEND == 'proceso':
+        return
+    with _lock:
+        vistos = dict(_vistos)
+        _vistos.clear()
+    for sala_id, ids in vistos.items():
+        bus.publicar(sala_id, 'latidos', {'participantes': sorted(ids)})
+
+
+def _bucle():
+    while True:
+        time.sleep(INTERVALO)
+        try:
+            _publicar_latidos()
+            _barrer()
+            escribir_cambios()
+        except Exception as e:
+            print(f"❌ [PRESENCIA] Error al escribir desconexiones (se reintentará): {e}")
+
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is not None or TTL <= 0:
+        return
+    with _lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='presencia-participantes', daemon=True)
+            _hilo.start()
+
+
+@bus.al_recibir
+def _sincronizar(mensaje, remoto):
+    """
+    Aplica las uniones, salidas y latidos de otros procesos y el inicio del
+    juego; el fin del juego y los cambios de la sala descartan el registro de
+    la sala para recargarlo desde MySQL
+    """
+    if mensaje.tipo == 'bus_reconectado':
+        vaciar()
+    elif mensaje.tipo == 'game_started':
+        # Mismo cambio que hace iniciar_juego_sala en MySQL (esperando -> jugando).
+        # Los ausentes también pasan a jugar: la sala se recarga para tenerlos
+        with _lock:
+            _cambio(mensaje.sala_id)
+            ausentes = [clave for clave in _caducados if clave[0] == mensaje.sala_id]
+            for clave in ausentes:
+                del _caducados[clave]
+            for participante_id in [pid for pid, cambio in _cambios.items() if cambio[0] == mensaje.sala_id]:
+                del _cambios[participante_id]
+            sala = _salas.get(mensaje.sala_id)
+            if ausentes:
+                _salas.pop(mensaje.sala_id, None)
+            elif sala is not None:
+                sala.iniciar()
+    elif mensaje.tipo in ('game_finished', 'sala_modificada', 'sala_eliminada'):
+        descartar(mensaje.sala_id)
+    elif not remoto:
+        return
+    elif mensaje.tipo == 'latidos':
+        with _lock:
+            for participante_id in mensaje.datos.get('participantes', ()):
+                clave = (mensaje.sala_id, participante_id)
+                if clave in _latidos:
+                    _vigilar(clave)
+    elif mensaje.tipo == 'participant_left':
+        ausentes = {datos['id_participante']: _desde_union(datos)
+                    for datos in mensaje.datos.get('ausentes', ())}
+        with _lock:
+            _cambio(mensaje.sala_id)
+            sala = _salas.get(mensaje.sala_id)
+            for participante_id in mensaje.datos.get('participantes', ()):
+                clave = (mensaje.sala_id, participante_id)
+                if sala is not None:
+                    sala.quitar(participante_id)
+                _latidos.pop(clave, None)
+                if participante_id in ausentes:
+                    _caducar(clave, ausentes[participante_id])
+                else:
+                    # Salida explícita: no se le readmite con un latido
+                    _caducados.pop(clave, None)
+    elif mensaje.tipo == 'participant_joined':
+        datos = mensaje.datos
+        if 'nombre' not in datos:
+            descartar(mensaje.sala_id)
+            return
+        with _lock:
+            _cambio(mensaje.sala_id)
+            _caducados.pop((mensaje.sala_id, datos['id_participante']), None)
+            sala = _salas.get(mensaje.sala_id)
+            if sala is not None:
+                sala.agregar(_desde_union(datos))
+
+
+def estadisticas():
+    with _lock:
+        return {
+            'ttl_s': TTL,
+            'salas': len(_salas),
+            'participantes': sum(len(s.participantes) for s in _salas.values()),
+            'vigilados': len(_latidos),
+            'pendientes_escritura': len(_cambios),
+            'cargas': _metricas['cargas'],
+            'latidos': _metricas['latidos'],
+            'caducados': _metricas['caducados'],
+            'readmitidos': _metricas['readmitidos'],
+            'escritos': _metricas['escritos'],
+            'lotes': _metricas['lotes'],
+            'errores': _metricas['errores']
+        }
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Temporizador de preguntas en el servidor
+Lleva el vencimiento de la pregunta en curso de cada sala con avance automático
+en un montículo (heapq) de plazos; un único hilo duerme hasta el plazo más
+próximo y, al vencer, llama a las funciones registradas con @al_vencer
+(controlador_juego avanza o finaliza la sala).
+
+Reprogramar o cancelar una sala no toca el montículo: la entrada vigente de
+cada sala se guarda aparte y las entradas antiguas se descartan al salir.
+
+Con varios procesos de servidor, cada sala se programa en el worker que la
+inició o avanzó (y en el que la recargue de MySQL tras un reinicio).
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+
+# Pausa tras agotarse el tiempo (o responder todos) antes de avanzar, para que
+# los estudiantes vean el resultado de la pregunta
+PAUSA = float(os.environ.get('TEMPORIZADOR_PAUSA') or 3)
+
+_monticulo = []  # (plazo, secuencia, sala_id, numero_pregunta)
+_vigentes = {}  # sala_id -> (plazo, secuencia, numero_pregunta)
+_al_vencer = []
+_secuencia = itertools.count()
+_cond = threading.Condition()
+_hilo = None
+_metricas = {'programadas': 0, 'adelantadas': 0, 'vencidas': 0, 'errores': 0}
+
+
+def al_vencer(funcion):
+    """Registra una función que recibe (sala_id, numero_pregunta) al vencer su plazo"""
+    _al_vencer.append(funcion)
+    return funcion
+
+
+def _encolar(sala_id, numero_pregunta, plazo):
+    entrada = (plazo, next(_secuencia), numero_pregunta)
+    _vigentes[sala_id] = entrada
+    heapq.heappush(_monticulo, (plazo, entrada[1], sala_id, numero_pregunta))
+    _cond.notify()
+
+
+def programar(sala_id, numero_pregunta, segundos):
+    """
+    Programa (o reprograma) el vencimiento de la pregunta en curso de la sala
+
+    Args:
+        sala_id: ID de la sala
+        numero_pregunta: Número de la pregunta que vence
+        segundos: Tiempo hasta el vencimiento
+    """
+    _asegurar_hilo()
+    with _cond:
+        _encolar(sala_id, numero_pregunta, time.monotonic() + max(0.0, segundos))
+        _metricas['programadas'] += 1
+
+
+def adelantar(sala_id, numero_pregunta, segundos=PAUSA):
+    """
+    Adelanta el vencimiento de la pregunta (p. ej. cuando ya respondieron todos).
+    No hace nada si la sala no tiene esa pregunta programada o ya vence antes.
+
+    Returns:
+        True si se adelantó
+    """
+    with _cond:
+        vigente = _vigentes.get(sala_id)
+        plazo = time.monotonic() + max(0.0, segundos)
+        if vigente is None or vigente[2] != numero_pregunta or vigente[0] <= plazo:
+            return False
+        _encolar(sala_id, numero_pregunta, plazo)
+        _metricas['adelantadas'] += 1
+        return True
+
+
+def cancelar(sala_id):
+    """Anula el vencimiento programado de la sala, si lo hay"""
+    with _cond:
+        _vigentes.pop(sala_id, None)
+
+
+def programada(sala_id):
+    """Devuelve el número de pregunta programado para la sala o None"""
+    with _cond:
+        vigente = _vigentes.get(sala_id)
+        return vigente[2] if vigente else None
+
+
+def _siguiente_vencida():
+    """Espera a la próxima entrada vigente que vence y la retira"""
+    with _cond:
+        while True:
+            while _monticulo and _vigentes.get(_monticulo[0][2], (None, None))[1] != _monticulo[0][1]:
+                heapq.heappop(_monticulo)  # reprogramada o cancelada
+            if not _monticulo:
+                _cond.wait()
+                continue
+            restante = _monticulo[0][0] - time.monotonic()
+            if restante > 0:
+                _cond.wait(restante)
+                continue
+            _, _, sala_id, numero_pregunta = heapq.heappop(_monticulo)
+            del _vigentes[sala_id]
+            _metricas['vencidas'] += 1
+            return sala_id, numero_pregunta
+
+
+def _bucle():
+    while True:
+        sala_id, numero_pregunta = _siguiente_vencida()
+        for funcion in _al_vencer:
+            try:
+                funcion(sala_id, numero_pregunta)
+            except Exception as e:
+                _metricas['errores'] += 1
+                print(f"❌ [TEMPORIZADOR] Error al vencer la pregunta {numero_pregunta} de la sala {sala_id}: {e}")
+
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is not None:
+        return
+    with _cond:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='temporizador-preguntas', daemon=True)
+            _hilo.start()
+
+
+def estadisticas():
+    with _cond:
+        ahora = time.monotonic()
+        proximo = min((v[0] for v in _vigentes.values()), default=None)
+        return {
+            'salas_programadas': len(_vigentes),
+            'entradas_monticulo': len(_monticulo),
+            'proximo_vencimiento_s': round(proximo - ahora, 2) if proximo is not None else None,
+            'programadas': _metricas['programadas'],
+            'adelantadas': _metricas['adelantadas'],
+            'vencidas': _metricas['vencidas'],
+            'errores': _metricas['errores']
+        }
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Versión del estado de cada sala para respuestas condicionales (ETag / 304)
+Cada mensaje publicado en tiempo_real.bus para una sala (inicio, avance, unión,
+respuesta, finalización, cambios de la sala...) incrementa su versión. Los
+endpoints de sondeo devuelven la versión como ETag y, si el cliente ya la
+tiene (If-None-Match), responden 304 sin cuerpo y sin consultar MySQL.
+
+La etiqueta incluye un identificador del proceso: cada worker lleva su propio
+contador, así que una etiqueta de otro worker nunca coincide por casualidad (el
+cliente recibe un 200 y sigue con la nueva). Con varios workers y el backend
+'proceso' del bus, ESTADO_SALAS_TTL hace además que las etiquetas caduquen
+pasado ese tiempo.
+
+Las esperas largas (/api/sala/<id>/esperar) usan además una versión de juego
+que no cambia con cada respuesta ni con el ranking: solo con inicio, avance,
+finalización y cambios de la sala, que es lo que esperan los estudiantes.
+"""
+
+import threading
+import time
+
+from tiempo_real import bus, estado_salas
+
+_EPOCA = bus.PROCESO[:8]
+
+# Mensajes que cambian la versión general (ETag) pero no la de juego
+_SIN_CAMBIO_DE_JUEGO = ('answer_recorded', 'ranking_updated')
+# Mensajes entre workers que no cambian lo que ven los clientes de la sala
+_INTERNOS = ('mazo_registrado', 'xp_liquidado', 'xp_entregado', 'latidos',
+             'vaciar_respuestas', 'respuestas_vaciadas')
+
+_versiones = {}  # sala_id -> versión
+_versiones_juego = {}  # sala_id -> versión de juego
+_esperas = {}  # sala_id -> [Condition, clientes esperando]
+_generacion = 0  # se incrementa al reconectar con el broker (pudieron perderse cambios)
+_lock = threading.Lock()
+_metricas = {'validaciones': 0, 'no_modificadas': 0, 'esperas': 0}
+
+
+def actual(sala_id):
+    """Devuelve la versión actual del estado de la sala"""
+    return _versiones.get(sala_id, 0)
+
+
+def incrementar(sala_id):
+    with _lock:
+        _versiones[sala_id] = _versiones.get(sala_id, 0) + 1
+
+
+def etag(sala_id, recurso):
+    """Etiqueta del estado actual de la sala para un recurso (endpoint) concreto"""
+    etiqueta = f'{recurso}-{sala_id}-{_EPOCA}.{_generacion}.{actual(sala_id)}'
+    if estado_salas.TTL_REVALIDACION > 0:
+        etiqueta += f'.{int(time.time() // estado_salas.TTL_REVALIDACION)}'
+    return etiqueta
+
+
+def version_juego(sala_id):
+    """Identificador opaco de la versión de juego de la sala"""
+    return f'{_EPOCA}.{_generacion}.{_versiones_juego.get(sala_id, 0)}'
+
+
+def _cambio_de_juego(sala_id):
+    with _lock:
+        _versiones_juego[sala_id] = _versiones_juego.get(sala_id, 0) + 1
+        espera = _esperas.get(sala_id)
+        if espera is not None:
+            espera[0].notify_all()
+
+
+def esperar_cambio(sala_id, desde, timeout):
+    """
+    Bloquea hasta que la versión de juego de la sala sea distinta de `desde` o
+    venza el tiempo. No usa conexiones de base de datos mientras espera.
+
+    Returns:
+        La versión de juego actual
+    """
+    limite = time.monotonic() + timeout
+    with _lock:
+        if version_juego(sala_id) != desde:
+            return version_juego(sala_id)
+        espera = _esperas.get(sala_id)
+        if espera is None:
+            espera = _esperas[sala_id] = [threading.Condition(_lock), 0]
+        espera[1] += 1
+        _metricas['esperas'] += 1
+        try:
+            while version_juego(sala_id) == desde:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                espera[0].wait(restante)
+        finally:
+            espera[1] -= 1
+            if espera[1] == 0:
+                del _esperas[sala_id]
+        return version_juego(sala_id)
+
+
+def registrar_validacion(no_modificada):
+    _metricas['validaciones'] += 1
+    if no_modificada:
+        _metricas['no_modificadas'] += 1
+
+
+@bus.al_recibir
+def _incrementar(mensaje, remoto):
+    global _generacion
+    if mensaje.tipo == 'bus_reconectado':
+        with _lock:
+            _generacion += 1
+            for espera in _esperas.values():
+                espera[0].notify_all()
+    elif mensaje.sala_id is not None and mensaje.tipo not in _INTERNOS:
+        incrementar(mensaje.sala_id)
+        if mensaje.tipo not in _SIN_CAMBIO_DE_JUEGO:
+            _cambio_de_juego(mensaje.sala_id)
+
+
+def estadisticas():
+    validaciones = _metricas['validaciones']
+    return {
+        'salas': len(_versiones),
+        'validaciones': validaciones,
+        'no_modificadas': _metricas['no_modificadas'],
+        'tasa_304': round(_metricas['no_modificadas'] / validaciones * 100, 1) if validaciones else 0.0,
+        'esperas_largas': _metricas['esperas'],
+        'esperando_ahora': sum(espera[1] for espera in list(_esperas.values()))
+    }
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Punto de entrada WSGI para producción (workers cooperativos con gevent)
+Las esperas largas (/api/sala/<id>/esperar) y el flujo SSE
+(/api/sala/<id>/eventos) mantienen la petición abierta hasta 25 s o mientras
+dure el juego. Con workers de hilos cada una ocupa un hilo; con gevent cada
+petición es un greenlet y la espera no bloquea al worker.
+
+monkey.patch_all() debe ejecutarse antes de importar main: así los locks,
+Condition y hilos de tiempo_real, time.sleep y los sockets de pymysql
+(y los del bus) se vuelven cooperativos.
+
+Uso (la configuración está en gunicorn.conf.py):
+    gunicorn wsgi:app
+
+Sin gunicorn (un solo proceso):
+    python wsgi.py
+"""
+
+from gevent import monkey
+
+monkey.patch_all()
+
+import os  # noqa: E402
+
+from main import app  # noqa: E402
+
+if __name__ == '__main__':
+    from gevent.pywsgi import WSGIServer
+
+    puerto = int(os.environ.get('PORT') or 5000)
+    print(f"🚀 Servidor gevent en http://0.0.0.0:{puerto}")
+    WSGIServer(('0.0.0.0', puerto), app).serve_forever()